@@ -4,14 +4,15 @@ Creates a connectivity matrix and provide methods to get the connectivity
 between two motes.
 
 The connectivity matrix is indexed by source id, destination id and channel.
-Each cell of the matrix is a dict with the fields `pdr` and `rssi`
+PDR and RSSI values are kept either in two dense arrays of that shape or, for
+large deployments, only for the links having a non-zero PDR.
 
 The connectivity matrix can be filled statically at startup or be updated along
 time if a connectivity trace is given.
 
-The propagate() method is called at every slot. It loops through the
-transmissions occurring during that slot and checks if the transmission fails or
-succeeds.
+The propagate() method is called at every slot where at least one radio is
+on. It loops through the transmissions occurring during that slot and checks if
+the transmission fails or succeeds.
 """
 from __future__ import print_function
 from __future__ import absolute_import
@@ -22,16 +23,22 @@ from __future__ import division
 from builtins import zip
 from builtins import str
 from builtins import object
+from builtins import range
 from past.utils import old_div
-import copy
+import array
+import bisect
 import sys
 import random
 import math
 import gzip
+import hashlib
+import os
 import datetime as dt
 import json
 import itertools
 
+import numpy
+
 from . import SimSettings
 from . import SimLog
 from .Mote.Mote import Mote
@@ -46,6 +53,56 @@ CONN_TYPE_TRACE         = u'trace'
 # =========================== classes =========================================
 
 class Connectivity(object):
+
+    # rssi and pdr relationship obtained by experiment; see _rssi_to_pdr()
+    RSSI_PDR_TABLE_RSSI = [
+        -97,  # this value is not from experiment
+        -96,
+        -95,
+        -94,
+        # <-- 50% PDR is here, at RSSI=-93.6
+        -93,
+        -92,
+        -91,
+        -90,
+        -89,
+        -88,
+        -87,
+        -86,
+        -85,
+        -84,
+        -83,
+        -82,
+        -81,
+        -80,
+        -79,  # this value is not from experiment
+    ]
+    RSSI_PDR_TABLE_PDR = [
+        0.0000,
+        0.1494,
+        0.2340,
+        0.4071,
+        0.6359,
+        0.6866,
+        0.7476,
+        0.8603,
+        0.8702,
+        0.9324,
+        0.9427,
+        0.9562,
+        0.9611,
+        0.9739,
+        0.9745,
+        0.9844,
+        0.9854,
+        0.9903,
+        1.0000,
+    ]
+
+    # below this number of listener x transmission pairs, collisions are
+    # resolved without NumPy; see _receive_in_collision()
+    COLLISION_MAX_SCALAR_LINKS = 48
+
     # ===== start singleton
     _instance = None
     _init = False
@@ -75,17 +132,33 @@ class Connectivity(object):
 
         # short-hands and local variables
         self.num_channels = self.settings.phy_numChans
+        self.asn_of_next_propagate = None
+
+        # ids of the motes whose radio is on, indexed by channel; maintained
+        # by Radio
+        self.transmitter_ids_by_channel = {}
+        self.listener_ids_by_channel = {}
+
+        # random numbers drawn in batch by _receive_in_collision();
+        # RandomState takes seeds of 32 bits at most, so the seed of the run
+        # is given as two 32-bit words
+        self.numpy_random = numpy.random.RandomState(
+            [
+                (self.engine.random_seed >> 32) & 0xffffffff,
+                self.engine.random_seed & 0xffffffff
+            ]
+        )
 
         # instantiate a connectivity matrix
+        self.matrix = None
         conn_class_name = self.settings.conn_class
         matrix_class_name = u'ConnectivityMatrix{0}'.format(conn_class_name)
         matrix_class = getattr(sys.modules[__name__], matrix_class_name)
         self.matrix = matrix_class(self)
 
-        # schedule propagation task
-        self._schedule_propagate()
-
     def destroy(self):
+        if self.matrix is not None:
+            self.matrix.destroy()
         cls           = type(self)
         cls._instance = None
         cls._init     = False
@@ -104,6 +177,9 @@ class Connectivity(object):
 
         return self.matrix.get_rssi(src_id, dst_id, channel)
 
+    def get_link_version(self, mote_id_1, mote_id_2):
+        return self.matrix.get_link_version(mote_id_1, mote_id_2)
+
     def propagate(self):
         """ Simulate the propagation of frames in a slot. """
 
@@ -111,14 +187,17 @@ class Connectivity(object):
         asn        = self.engine.getAsn()
         slotOffset = asn % self.settings.tsch_slotframeLength
 
-        # get all motes TXing or RXing on this slot organized by channel
+        # get all motes TXing or RXing on this slot organized by channel; take
+        # them from the registry of the radios which are on, in the order of
+        # mote id
         transmissions_by_channel = {}
         receivers_by_channel = {}
 
-        # organize all transmissions and receptions by channel
-        for mote in self.engine.motes:
-            # get all transmissions
-            if mote.radio.state == d.RADIO_STATE_TX:
+        for channel in sorted(self.transmitter_ids_by_channel):
+            transmissions_by_channel[channel] = []
+            for mote_id in sorted(self.transmitter_ids_by_channel[channel]):
+                mote = self.engine.motes[mote_id]
+                assert mote.radio.state == d.RADIO_STATE_TX
                 assert mote.radio.onGoingTransmission
                 thisTran = {
                     # channel
@@ -131,25 +210,16 @@ class Connectivity(object):
                     # number of ACKs received by this packet
                     u'numACKs': 0,
                 }
+                assert thisTran[u'channel'] == channel
+                transmissions_by_channel[channel] += [thisTran]
 
-                if thisTran[u'channel'] not in transmissions_by_channel:
-                    transmissions_by_channel[thisTran[u'channel']] = []
-
-                transmissions_by_channel[thisTran[u'channel']] += [thisTran]
-
-            # get all receivers
-            elif mote.radio.state == d.RADIO_STATE_RX:
-                if mote.radio.channel not in receivers_by_channel:
-                    receivers_by_channel[mote.radio.channel] = []
-
-                receivers_by_channel[mote.radio.channel] += [mote.id]
-
-            else:
-                # mote is idle, do nothing
-                pass
+        for channel in sorted(self.listener_ids_by_channel):
+            receivers_by_channel[channel] = sorted(
+                self.listener_ids_by_channel[channel]
+            )
 
         # remove all motes that are listening to channels without any transmission
-        for channel in set(receivers_by_channel.keys()) - set(transmissions_by_channel.keys()):
+        for channel in sorted(set(receivers_by_channel.keys()) - set(transmissions_by_channel.keys())):
             assert channel not in transmissions_by_channel
             assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
 
@@ -160,7 +230,7 @@ class Connectivity(object):
                 assert sentAck is False
 
         # remove all transmissions that are sent on channels without any listeners
-        for channel in set(transmissions_by_channel.keys()) - set(receivers_by_channel.keys()):
+        for channel in sorted(set(transmissions_by_channel.keys()) - set(receivers_by_channel.keys())):
             assert channel not in receivers_by_channel
             assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
 
@@ -168,55 +238,33 @@ class Connectivity(object):
                 self.engine.motes[t[u'tx_mote_id']].radio.txDone(False)
 
         # prosses packets sent on channels with listeners
-        for channel in set(transmissions_by_channel.keys()) & set(receivers_by_channel.keys()):
+        for channel in sorted(set(transmissions_by_channel.keys()) & set(receivers_by_channel.keys())):
             assert channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
 
-            for listener_id in receivers_by_channel[channel]:
-                # list the transmissions that listener can hear and lock to the earliest one
-                lockon_transmission = None
-                lockon_random_value = None
-                interfering_transmissions = []
-                detected_transmissions = 0
+            transmissions = transmissions_by_channel[channel]
+            listener_ids  = receivers_by_channel[channel]
+
+            if len(transmissions) > 1:
+                # resolve the receptions of all the listeners at once
+                (
+                    lockon_index_list,
+                    interfering_index_list,
+                    lockon_random_value_list,
+                    packet_pdr_list
+                ) = self._receive_in_collision(
+                    channel,
+                    transmissions,
+                    listener_ids
+                )
 
-                # deal with collisions
-                if len(transmissions_by_channel[channel]) > 1:
-                    for t in transmissions_by_channel[channel]:
-                        # random_value will be used for comparison against PDR
-                        random_value = random.random()
-
-                        peamble_pdr = self.get_pdr(
-                            src_id=t[u'tx_mote_id'],
-                            dst_id=listener_id,
-                            channel=channel,
-                        )
+            for (listener_index, listener_id) in enumerate(listener_ids):
 
-                        # you can interpret the following line as decision for
-                        # reception of the preamble of 't'
-                        if random_value > peamble_pdr:
-                            # reception failed, continue to the next transmission
-                            continue
-
-                        # update counter
-                        detected_transmissions += 1
-
-                        # begin locking to the first heard transmission
-                        if lockon_transmission is None:
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                            continue
-
-                        # then update the locked transmission if it's earlier than the previous earliest
-                        if t[u'txTime'] < lockon_transmission[u'txTime']:
-                            # add previous locked on tranmission to the interference list
-                            interfering_transmissions += [t]
-                            # and lock to the new earliest transmission
-                            lockon_transmission = t
-                            lockon_random_value = random_value
-                        else:
-                            interfering_transmissions += [t]
+                # deal with collisions
+                if len(transmissions) > 1:
+                    lockon_index = lockon_index_list[listener_index]
 
                     # check if it received anything
-                    if lockon_transmission is None:
+                    if lockon_index is None:
                         # nope, set the receiver to idle listen and cotinue to next one
                         sentAck = self.engine.motes[listener_id].radio.rxDone(
                             packet=None,
@@ -224,36 +272,35 @@ class Connectivity(object):
                         continue
 
                     # something was received, continue execution
-                    self.log(
-                        SimLog.LOG_PROP_INTERFERENCE,
-                        {
-                            u'_mote_id': listener_id,
-                            u'channel': lockon_transmission[u'channel'],
-                            u'lockon_transmission': (
-                                lockon_transmission[u'packet']
-                            ),
-                            u'interfering_transmissions': [
-                                t[u'packet']
-                                for t in interfering_transmissions
-                            ]
-                        }
-                    )
+                    lockon_transmission = transmissions[lockon_index]
+                    if SimLog.is_enabled(SimLog.LOG_PROP_INTERFERENCE):
+                        interfering_transmissions = [
+                            transmissions[i]
+                            for i in interfering_index_list[listener_index]
+                        ]
+                        self.log(
+                            SimLog.LOG_PROP_INTERFERENCE,
+                            {
+                                u'_mote_id': listener_id,
+                                u'channel': lockon_transmission[u'channel'],
+                                u'lockon_transmission': (
+                                    lockon_transmission[u'packet']
+                                ),
+                                u'interfering_transmissions': [
+                                    t[u'packet']
+                                    for t in interfering_transmissions
+                                ]
+                            }
+                        )
 
-                    # calculate the resulting pdr when taking
-                    # interferers into account
-                    packet_pdr = self._compute_pdr_with_interference(
-                        listener_id=listener_id,
-                        lockon_transmission=lockon_transmission,
-                        interfering_transmissions=interfering_transmissions
-                    )
+                    lockon_random_value = lockon_random_value_list[listener_index]
+                    packet_pdr = packet_pdr_list[listener_index]
 
                 # no collision, easy peasy
-                elif len(transmissions_by_channel[channel]) == 1:
+                elif len(transmissions) == 1:
                     # there's no point in testing the preamble here, so we'll skip it
-                    detected_transmissions = 1
-
                     lockon_random_value = random.random()
-                    lockon_transmission = transmissions_by_channel[channel][0]
+                    lockon_transmission = transmissions[0]
                     packet_pdr = self.get_pdr(
                         src_id  = lockon_transmission[u'tx_mote_id'],
                         dst_id  = listener_id,
@@ -264,13 +311,6 @@ class Connectivity(object):
                 else:
                     assert False
 
-                # lockon transmission selected
-                # all other transmissions are now intereferers
-                assert (
-                        detected_transmissions ==
-                        (len(interfering_transmissions) + 1)
-                )
-
                 # decide whether listener receives
                 # lockon_transmission or not
                 if lockon_random_value < packet_pdr:
@@ -317,7 +357,7 @@ class Connectivity(object):
                 # done processing this listener
 
             # after processing all listeners send back ACK to transmitter if possible
-            for t in transmissions_by_channel[channel]:
+            for t in transmissions:
                 # decide whether transmitter received an ACK
                 if t[u'numACKs'] == 0:
                     isACKed = False
@@ -332,92 +372,304 @@ class Connectivity(object):
                 self.engine.motes[t[u'tx_mote_id']].radio.txDone(isACKed)
 
         # verify all radios off
-        for mote in self.engine.motes:
-            assert mote.radio.state == d.RADIO_STATE_OFF
-            assert mote.radio.channel is None
-
-        # schedule next propagation
-        self._schedule_propagate()
-
-    def _schedule_propagate(self):
+        assert not self.transmitter_ids_by_channel
+        assert not self.listener_ids_by_channel
+        if self.settings.conn_debug_check_radios_off:
+            # this is expensive with many motes; double-check the registry
+            # against the state of every radio
+            for mote in self.engine.motes:
+                assert mote.radio.state == d.RADIO_STATE_OFF
+                assert mote.radio.channel is None
+
+    def schedule_propagate(self):
         '''
-        schedule a propagation task in the middle of the next slot.
-        FIXME: only schedule for next active slot.
+        schedule a propagation task in the middle of the slot in which a radio
+        is turned on. This is called when a radio is added to the registry; if
+        the propagation of the current slot has been done already, the task is
+        scheduled in the next slot.
         '''
+        asn = self.engine.getAsn()
+        if (
+                (self.engine.intraSlotOrder is None)
+                or
+                (self.engine.intraSlotOrder >= d.INTRASLOTORDER_PROPAGATE)
+            ):
+            asn += 1
+
+        if asn == self.asn_of_next_propagate:
+            # another radio is on in the same slot
+            return
+
         self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn() + 1,
+            asn              = asn,
             cb               = self.propagate,
             uniqueTag        = (None, u'Connectivity.propagate'),
             intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
         )
+        self.asn_of_next_propagate = asn
 
-    def _get_listener_id_list(self, channel):
-        returnVal = []
-        for mote in self.engine.motes:
-            if (
-                    (mote.radio.state == d.RADIO_STATE_RX)
-                    and
-                    (mote.radio.channel == channel)
-                ):
-                returnVal.append(mote.id)
-        return returnVal
+    # === registry of the radios which are on
 
-    def _compute_pdr_with_interference(
-            self,
-            listener_id,
-            lockon_transmission,
-            interfering_transmissions
-        ):
+    def add_transmitter(self, mote_id, channel):
+        """ called by Radio when it starts transmitting """
+        self._add_to_registry(self.transmitter_ids_by_channel, mote_id, channel)
 
-        # shorthand
-        channel = lockon_transmission[u'channel']
-        for t in interfering_transmissions:
-            assert t[u'channel'] == channel
-        lockon_tx_mote_id = lockon_transmission[u'tx_mote_id']
+    def remove_transmitter(self, mote_id, channel):
+        """ called by Radio at the end of its transmission """
+        self._remove_from_registry(
+            self.transmitter_ids_by_channel,
+            mote_id,
+            channel
+        )
 
-        # === compute the SINR
+    def add_listener(self, mote_id, channel):
+        """ called by Radio when it starts listening """
+        self._add_to_registry(self.listener_ids_by_channel, mote_id, channel)
 
-        noise_mW   = self._dBm_to_mW(
-            self.engine.motes[listener_id].radio.noisepower
+    def remove_listener(self, mote_id, channel):
+        """ called by Radio at the end of its reception """
+        self._remove_from_registry(
+            self.listener_ids_by_channel,
+            mote_id,
+            channel
         )
 
-        # S = RSSI - N
+    def _add_to_registry(self, registry, mote_id, channel):
+        if channel not in registry:
+            registry[channel] = set()
+        assert mote_id not in registry[channel]
+        registry[channel].add(mote_id)
 
-        signal_mW = self._dBm_to_mW(
-            self.get_rssi(lockon_tx_mote_id, listener_id, channel)
-        )
-        signal_mW -= noise_mW
-        if signal_mW < 0.0:
-            # RSSI has not to be below the noise level.
-            # If this happens, return very low SINR (-10.0dB)
-            return -10.0
-
-        # I = RSSI - N
-
-        totalInterference_mW = 0.0
-        for interfering_tran in interfering_transmissions:
-            interfering_tx_mote_id = interfering_tran[u'tx_mote_id']
-            interference_mW = self._dBm_to_mW(
-                self.get_rssi(interfering_tx_mote_id, listener_id, channel)
+        # the propagation model runs in this slot
+        self.schedule_propagate()
+
+    def _remove_from_registry(self, registry, mote_id, channel):
+        registry[channel].remove(mote_id)
+        if not registry[channel]:
+            del registry[channel]
+
+    def _get_listener_id_list(self, channel):
+        return sorted(self.listener_ids_by_channel.get(channel, []))
+
+    def _receive_in_collision(self, channel, transmissions, listener_ids):
+        """
+        Decide the receptions of all the listeners of a channel where more
+        than one transmission is going on. Preamble decisions, lock-on and
+        SINR are computed for all the listeners at once with NumPy; with few
+        links NumPy costs more than it saves, and the links are gone through
+        one at a time instead. Both ways draw the same random values.
+
+        Only the links which can be heard, the ones having a non-zero PDR,
+        are considered.
+
+        Return four lists indexed like listener_ids: the index of the
+        transmission the listener locks on (None when it hears nothing), the
+        indices of the interfering transmissions, the random value drawn for
+        the lockon transmission, and the PDR of the lockon transmission
+        taking interferers into account. The last two are None when the
+        listener hears nothing.
+        """
+        num_links = len(transmissions) * len(listener_ids)
+        if num_links <= self.COLLISION_MAX_SCALAR_LINKS:
+            return self._receive_in_collision_scalar(
+                channel,
+                transmissions,
+                listener_ids
             )
-            interference_mW -= noise_mW
-            if interference_mW < 0.0:
-                # RSSI has not to be below noise level.
-                # If this happens, set interference to 0.0
-                interference_mW = 0.0
-            totalInterference_mW += interference_mW
+        else:
+            return self._receive_in_collision_vector(
+                channel,
+                transmissions,
+                listener_ids
+            )
+
+    def _receive_in_collision_scalar(self, channel, transmissions, listener_ids):
+        lockon_index_list = []
+        interfering_index_list = []
+        lockon_random_value_list = []
+        packet_pdr_list = []
 
-        sinr_dB = self._mW_to_dBm(old_div(signal_mW, (totalInterference_mW + noise_mW)))
+        for listener_id in listener_ids:
 
-        # === compute the interference PDR
+            # === preamble reception and lock-on
 
-        # shorthand
-        noise_dBm = self.engine.motes[listener_id].radio.noisepower
+            lockon_index = None
+            lockon_random_value = None
+            lockon_pdr = None
+            detected_index_list = []
+            for (index, t) in enumerate(transmissions):
+                pdr = self.matrix.get_pdr(t[u'tx_mote_id'], listener_id, channel)
+                if pdr == 0:
+                    # this link cannot be heard, no random value is drawn
+                    continue
+                random_value = self.numpy_random.random_sample()
+                if random_value > pdr:
+                    continue
+                detected_index_list.append(index)
 
-        # RSSI of the interfering transmissions
-        interference_rssi = self._mW_to_dBm(
-            self._dBm_to_mW(sinr_dB + noise_dBm) +
-            self._dBm_to_mW(noise_dBm)
+                # lock on the earliest transmission
+                if (
+                        (lockon_index is None)
+                        or
+                        (
+                            t[u'txTime'] <
+                            transmissions[lockon_index][u'txTime']
+                        )
+                    ):
+                    lockon_index = index
+                    lockon_random_value = random_value
+                    lockon_pdr = pdr
+
+            interfering_indices = [
+                index for index in detected_index_list if index != lockon_index
+            ]
+            lockon_index_list.append(lockon_index)
+            interfering_index_list.append(interfering_indices)
+            lockon_random_value_list.append(lockon_random_value)
+            if lockon_index is None:
+                packet_pdr_list.append(None)
+                continue
+
+            # === compute the SINR
+
+            noise_dBm = self.engine.motes[listener_id].radio.noisepower
+            noise_mW = math.pow(10.0, noise_dBm / 10.0)
+
+            # S = RSSI - N
+            lockon_rssi = self.matrix.get_rssi(
+                transmissions[lockon_index][u'tx_mote_id'],
+                listener_id,
+                channel
+            )
+            signal_mW = math.pow(10.0, lockon_rssi / 10.0) - noise_mW
+            if signal_mW <= 0.0:
+                # a lockon transmission whose RSSI is not above the noise
+                # level cannot be received
+                packet_pdr_list.append(0.0)
+                continue
+
+            # I = RSSI - N; RSSI has not to be below noise level, if this
+            # happens, set interference to 0.0
+            interference_mW = 0.0
+            for index in interfering_indices:
+                rssi = self.matrix.get_rssi(
+                    transmissions[index][u'tx_mote_id'],
+                    listener_id,
+                    channel
+                )
+                interference_mW += max(
+                    math.pow(10.0, rssi / 10.0) - noise_mW,
+                    0.0
+                )
+
+            sinr_dB = 10 * math.log10(
+                signal_mW / (interference_mW + noise_mW)
+            )
+
+            # === compute the interference PDR
+
+            # RSSI of the interfering transmissions
+            interference_rssi = 10 * math.log10(
+                math.pow(10.0, (sinr_dB + noise_dBm) / 10.0) + noise_mW
+            )
+
+            # === compute the resulting PDR
+
+            packet_pdr_list.append(
+                lockon_pdr * self._rssi_to_pdr_scalar(interference_rssi)
+            )
+
+        return (
+            lockon_index_list,
+            interfering_index_list,
+            lockon_random_value_list,
+            packet_pdr_list
+        )
+
+    def _receive_in_collision_vector(self, channel, transmissions, listener_ids):
+
+        # links between the transmitters and the listeners; the ones which
+        # cannot be heard are skipped
+        (
+            link_listener_index,
+            link_transmission_index,
+            link_pdr,
+            link_rssi
+        ) = self.matrix.get_heard_links(
+            listener_ids,
+            [t[u'tx_mote_id'] for t in transmissions],
+            channel
+        )
+        tx_time = numpy.array([t[u'txTime'] for t in transmissions])
+        noise_dBm = numpy.array(
+            [
+                self.engine.motes[listener_id].radio.noisepower
+                for listener_id in listener_ids
+            ]
+        )
+        rows = numpy.arange(len(listener_ids))
+
+        # === preamble reception and lock-on
+
+        # random values will be used for comparison against PDR; one is drawn
+        # for every link which can be heard, in the order of the listeners
+        # then of the transmissions
+        link_random_values = self.numpy_random.random_sample(len(link_pdr))
+
+        # listener x transmission matrices; the links which cannot be heard
+        # are LINK_NONE's and never detected
+        shape = (len(listener_ids), len(transmissions))
+        link_index = (link_listener_index, link_transmission_index)
+        pdr = numpy.full(shape, self.matrix.LINK_NONE[u'pdr'], dtype=float)
+        pdr[link_index] = link_pdr
+        rssi = numpy.full(shape, self.matrix.LINK_NONE[u'rssi'], dtype=float)
+        rssi[link_index] = link_rssi
+        random_values = numpy.zeros(shape)
+        random_values[link_index] = link_random_values
+        detected = numpy.zeros(shape, dtype=bool)
+        detected[link_index] = link_random_values <= link_pdr
+
+        # each listener locks on the earliest transmission it detects; all
+        # the other detected transmissions are interferers
+        is_locked = detected.any(axis=1)
+        lockon = numpy.where(detected, tx_time, numpy.inf).argmin(axis=1)
+        interfering = detected.copy()
+        interfering[rows, lockon] = False
+
+        # === compute the SINR
+
+        noise_mW = self._dBm_to_mW(noise_dBm)
+
+        # S = RSSI - N
+        signal_mW = self._dBm_to_mW(rssi[rows, lockon]) - noise_mW
+
+        # I = RSSI - N; RSSI has not to be below noise level, if this happens,
+        # set interference to 0.0
+        interference_mW = numpy.where(
+            interfering,
+            numpy.maximum(
+                self._dBm_to_mW(rssi) - noise_mW[:, numpy.newaxis],
+                0.0
+            ),
+            0.0
+        ).sum(axis=1)
+
+        with numpy.errstate(divide=u'ignore', invalid=u'ignore'):
+            sinr_dB = self._mW_to_dBm(signal_mW / (interference_mW + noise_mW))
+
+            # === compute the interference PDR
+
+            # RSSI of the interfering transmissions
+            interference_rssi = self._mW_to_dBm(
+                self._dBm_to_mW(sinr_dB + noise_dBm) + noise_mW
+            )
+
+        # a lockon transmission whose RSSI is not above the noise level
+        # cannot be received
+        interference_rssi = numpy.where(
+            signal_mW > 0.0,
+            interference_rssi,
+            -numpy.inf
         )
 
         # PDR of the interfering transmissions
@@ -425,71 +677,314 @@ class Connectivity(object):
 
         # === compute the resulting PDR
 
-        lockon_pdr = self.get_pdr(
-            src_id  = lockon_tx_mote_id,
-            dst_id  = listener_id,
-            channel = channel)
-        returnVal = lockon_pdr * interference_pdr
-
-        return returnVal
+        packet_pdr = pdr[rows, lockon] * interference_pdr
+
+        is_locked = is_locked.tolist()
+        lockon_index_list = [
+            index if locked else None
+            for (index, locked) in zip(lockon.tolist(), is_locked)
+        ]
+        interfering_index_list = [
+            [index for (index, is_interfering) in enumerate(row) if is_interfering]
+            for row in interfering.tolist()
+        ]
+        lockon_random_value_list = [
+            value if locked else None
+            for (value, locked) in zip(
+                random_values[rows, lockon].tolist(),
+                is_locked
+            )
+        ]
+        packet_pdr_list = [
+            value if locked else None
+            for (value, locked) in zip(packet_pdr.tolist(), is_locked)
+        ]
+        return (
+            lockon_index_list,
+            interfering_index_list,
+            lockon_random_value_list,
+            packet_pdr_list
+        )
 
     # === helpers
 
     @staticmethod
     def _dBm_to_mW(dBm):
-        return math.pow(10.0, dBm / 10.0)
+        return numpy.power(10.0, numpy.divide(dBm, 10.0))
 
     @staticmethod
     def _mW_to_dBm(mW):
-        return 10 * math.log10(mW)
+        return 10 * numpy.log10(mW)
 
-    @staticmethod
-    def _rssi_to_pdr(rssi):
+    @classmethod
+    def _rssi_to_pdr(cls, rssi):
         """
         rssi and pdr relationship obtained by experiment below
         http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
+
+        rssi can be an array; PDR is interpolated linearly between the
+        points of the table.
         """
+        pdr = numpy.interp(rssi, cls.RSSI_PDR_TABLE_RSSI, cls.RSSI_PDR_TABLE_PDR)
 
-        rssi_pdr_table = {
-            -97:    0.0000,  # this value is not from experiment
-            -96:    0.1494,
-            -95:    0.2340,
-            -94:    0.4071,
-            # <-- 50% PDR is here, at RSSI=-93.6
-            -93:    0.6359,
-            -92:    0.6866,
-            -91:    0.7476,
-            -90:    0.8603,
-            -89:    0.8702,
-            -88:    0.9324,
-            -87:    0.9427,
-            -86:    0.9562,
-            -85:    0.9611,
-            -84:    0.9739,
-            -83:    0.9745,
-            -82:    0.9844,
-            -81:    0.9854,
-            -80:    0.9903,
-            -79:    1.0000,  # this value is not from experiment
-        }
+        assert numpy.all((0 <= pdr) & (pdr <= 1.0))
 
-        minRssi = min(rssi_pdr_table.keys())
-        maxRssi = max(rssi_pdr_table.keys())
+        return pdr
 
-        floorRssi = int(math.floor(rssi))
-        if  floorRssi < minRssi:
-            pdr = 0.0
-        elif floorRssi >= maxRssi:
-            pdr = 1.0
+    @classmethod
+    def _rssi_to_pdr_scalar(cls, rssi):
+        """same as _rssi_to_pdr() for a single value, without NumPy"""
+        index = bisect.bisect_right(cls.RSSI_PDR_TABLE_RSSI, rssi)
+        if index == 0:
+            return cls.RSSI_PDR_TABLE_PDR[0]
+        elif index == len(cls.RSSI_PDR_TABLE_RSSI):
+            return cls.RSSI_PDR_TABLE_PDR[-1]
         else:
-            pdrLow  = rssi_pdr_table[floorRssi]
-            pdrHigh = rssi_pdr_table[floorRssi+1]
-            # linear interpolation
-            pdr = (pdrHigh - pdrLow) * (rssi - float(floorRssi)) + pdrLow
+            rssi_low = cls.RSSI_PDR_TABLE_RSSI[index - 1]
+            pdr_low = cls.RSSI_PDR_TABLE_PDR[index - 1]
+            slope = (
+                (cls.RSSI_PDR_TABLE_PDR[index] - pdr_low) /
+                (cls.RSSI_PDR_TABLE_RSSI[index] - rssi_low)
+            )
+            return slope * (rssi - rssi_low) + pdr_low
 
-        assert 0 <= pdr <= 1.0
 
-        return pdr
+class ConnectivityStorageDense(object):
+    """
+    PDR and RSSI values of all the links, in two arrays indexed by source id,
+    destination id and channel index.
+    """
+
+    def __init__(self, num_motes, num_channels, link_none):
+        shape = (num_motes, num_motes, num_channels)
+        self._pdr  = numpy.full(shape, link_none[u'pdr'],  dtype=float)
+        self._rssi = numpy.full(shape, link_none[u'rssi'], dtype=float)
+
+    def get_pdr(self, src_id, dst_id, channel_index):
+        return self._pdr.item(src_id, dst_id, channel_index)
+
+    def set_pdr(self, src_id, dst_id, channel_index, pdr):
+        self._pdr[src_id, dst_id, channel_index] = pdr
+
+    def get_rssi(self, src_id, dst_id, channel_index):
+        return self._rssi.item(src_id, dst_id, channel_index)
+
+    def set_rssi(self, src_id, dst_id, channel_index, rssi):
+        self._rssi[src_id, dst_id, channel_index] = rssi
+
+    def set_link(self, src_id, dst_id, channel_index, pdr, rssi):
+        channel_index = self._get_channel_slice(channel_index)
+        self._pdr[src_id, dst_id, channel_index] = pdr
+        self._rssi[src_id, dst_id, channel_index] = rssi
+
+    def set_row(self, src_id, channel_index, pdr, rssi):
+        if channel_index is None:
+            # one value per destination, repeated over the channels
+            pdr = numpy.asarray(pdr, dtype=float)
+            rssi = numpy.asarray(rssi, dtype=float)
+            if pdr.ndim == 1:
+                pdr = pdr[:, numpy.newaxis]
+            if rssi.ndim == 1:
+                rssi = rssi[:, numpy.newaxis]
+        channel_index = self._get_channel_slice(channel_index)
+        self._pdr[src_id, :, channel_index] = pdr
+        self._rssi[src_id, :, channel_index] = rssi
+
+    def set_channel(self, channel_index, pdr, rssi):
+        channel_index = self._get_channel_slice(channel_index)
+        self._pdr[:, :, channel_index] = pdr
+        self._rssi[:, :, channel_index] = rssi
+
+    def get_transmitter_ids(self, dst_id, channel_index):
+        return set(
+            numpy.flatnonzero(self._pdr[:, dst_id, channel_index]).tolist()
+        )
+
+    def get_heard_links(self, dst_id_list, src_id_list, channel_index):
+        (pdr, rssi) = self.get_link_arrays(
+            dst_id_list,
+            src_id_list,
+            channel_index
+        )
+        (dst_index, src_index) = numpy.nonzero(pdr)
+        return (
+            dst_index,
+            src_index,
+            pdr[dst_index, src_index],
+            rssi[dst_index, src_index]
+        )
+
+    def get_link_arrays(self, dst_id_list, src_id_list, channel_index):
+        index = (
+            numpy.array(src_id_list)[numpy.newaxis, :],
+            numpy.array(dst_id_list)[:, numpy.newaxis],
+            channel_index
+        )
+        return (self._pdr[index], self._rssi[index])
+
+    # ======================= private =========================================
+
+    @staticmethod
+    def _get_channel_slice(channel_index):
+        if channel_index is None:
+            return slice(None)
+        else:
+            return channel_index
+
+
+class ConnectivityStorageSparse(object):
+    """
+    Only links having a non-zero PDR are stored, in dicts indexed by
+    destination id, channel index and source id. The memory footprint grows
+    with the number of links instead of the square of the number of motes.
+
+    PDR and RSSI values are kept apart: an RSSI set with set_rssi() is kept
+    whatever the PDR of the link. The bulk setters don't keep the RSSI of a
+    link whose PDR is 0, which reads as LINK_NONE's; a Random topology sets
+    an RSSI for every pair of motes.
+    """
+
+    def __init__(self, num_motes, num_channels, link_none):
+        self.num_motes    = num_motes
+        self.num_channels = num_channels
+        self._pdr_none    = float(link_none[u'pdr'])
+        self._rssi_none   = float(link_none[u'rssi'])
+        # one dict per (dst_id, channel_index), whose keys are the ids of the
+        # motes the destination can hear on that channel
+        self._pdr = [
+            [{} for _ in range(num_channels)] for _ in range(num_motes)
+        ]
+        # same for the RSSI values which are stored
+        self._rssi = [
+            [{} for _ in range(num_channels)] for _ in range(num_motes)
+        ]
+
+    def get_pdr(self, src_id, dst_id, channel_index):
+        return self._pdr[dst_id][channel_index].get(src_id, self._pdr_none)
+
+    def set_pdr(self, src_id, dst_id, channel_index, pdr):
+        self._set_value(
+            self._pdr[dst_id][channel_index],
+            src_id,
+            pdr,
+            self._pdr_none
+        )
+
+    def get_rssi(self, src_id, dst_id, channel_index):
+        return self._rssi[dst_id][channel_index].get(src_id, self._rssi_none)
+
+    def set_rssi(self, src_id, dst_id, channel_index, rssi):
+        self._set_value(
+            self._rssi[dst_id][channel_index],
+            src_id,
+            rssi,
+            self._rssi_none
+        )
+
+    def set_link(self, src_id, dst_id, channel_index, pdr, rssi):
+        if pdr == self._pdr_none:
+            # the link cannot be heard; don't store its RSSI
+            rssi = self._rssi_none
+        for _channel_index in self._get_channel_index_list(channel_index):
+            self.set_pdr(src_id, dst_id, _channel_index, pdr)
+            self.set_rssi(src_id, dst_id, _channel_index, rssi)
+
+    def set_row(self, src_id, channel_index, pdr, rssi):
+        pdr_list = numpy.broadcast_to(
+            numpy.asarray(pdr, dtype=float),
+            (self.num_motes,)
+        ).tolist()
+        rssi_list = numpy.broadcast_to(
+            numpy.asarray(rssi, dtype=float),
+            (self.num_motes,)
+        ).tolist()
+        for dst_id in range(self.num_motes):
+            self.set_link(
+                src_id,
+                dst_id,
+                channel_index,
+                pdr_list[dst_id],
+                rssi_list[dst_id]
+            )
+
+    def set_channel(self, channel_index, pdr, rssi):
+        for src_id in range(self.num_motes):
+            self.set_row(src_id, channel_index, pdr, rssi)
+
+    def get_transmitter_ids(self, dst_id, channel_index):
+        return self._pdr[dst_id][channel_index]
+
+    def get_heard_links(self, dst_id_list, src_id_list, channel_index):
+        src_index_by_id = dict(
+            (src_id, src_index)
+            for (src_index, src_id) in enumerate(src_id_list)
+        )
+        dst_index_list = []
+        src_index_list = []
+        pdr_list = []
+        rssi_list = []
+        for (dst_index, dst_id) in enumerate(dst_id_list):
+            # intersect the motes dst_id can hear with src_id_list, going
+            # through the shorter of the two
+            transmitter_ids = self.get_transmitter_ids(dst_id, channel_index)
+            if len(transmitter_ids) < len(src_id_list):
+                heard_src_index_list = sorted(
+                    src_index_by_id[src_id]
+                    for src_id in transmitter_ids
+                    if src_id in src_index_by_id
+                )
+            else:
+                heard_src_index_list = [
+                    src_index
+                    for (src_index, src_id) in enumerate(src_id_list)
+                    if src_id in transmitter_ids
+                ]
+            rssi_values = self._rssi[dst_id][channel_index]
+            for src_index in heard_src_index_list:
+                src_id = src_id_list[src_index]
+                dst_index_list.append(dst_index)
+                src_index_list.append(src_index)
+                pdr_list.append(transmitter_ids[src_id])
+                rssi_list.append(rssi_values.get(src_id, self._rssi_none))
+        return (
+            numpy.array(dst_index_list, dtype=int),
+            numpy.array(src_index_list, dtype=int),
+            numpy.array(pdr_list, dtype=float),
+            numpy.array(rssi_list, dtype=float)
+        )
+
+    def get_link_arrays(self, dst_id_list, src_id_list, channel_index):
+        pdr_list = []
+        rssi_list = []
+        for dst_id in dst_id_list:
+            pdr_values = self._pdr[dst_id][channel_index]
+            rssi_values = self._rssi[dst_id][channel_index]
+            pdr_list.append(
+                [pdr_values.get(src_id, self._pdr_none) for src_id in src_id_list]
+            )
+            rssi_list.append(
+                [rssi_values.get(src_id, self._rssi_none) for src_id in src_id_list]
+            )
+        shape = (len(dst_id_list), len(src_id_list))
+        return (
+            numpy.array(pdr_list, dtype=float).reshape(shape),
+            numpy.array(rssi_list, dtype=float).reshape(shape)
+        )
+
+    # ======================= private =========================================
+
+    @staticmethod
+    def _set_value(values, src_id, value, value_none):
+        if value == value_none:
+            values.pop(src_id, None)
+        else:
+            values[src_id] = float(value)
+
+    def _get_channel_index_list(self, channel_index):
+        if channel_index is None:
+            return range(self.num_channels)
+        else:
+            return [channel_index]
 
 
 class ConnectivityMatrixBase(object):
@@ -502,20 +997,41 @@ class ConnectivityMatrixBase(object):
         self.engine = connectivity.engine
         self.settings = connectivity.settings
         self.log = connectivity.log
-        self._matrix = {}
 
         # short hands
         self.num_channels = self.settings.phy_numChans
 
-        # at the beginning, connectivity matrix indicates no connectivity at all
-        for src_id in self.mote_id_list:
-            self._matrix[src_id] = {}
-            for dst_id in self.mote_id_list:
-                self._matrix[src_id][dst_id] = {}
-                for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                    self._matrix[src_id][dst_id][channel] = copy.copy(
-                        self.LINK_NONE
-                    )
+        # index of a channel in the storage
+        self._channel_index = dict(
+            (channel, index)
+            for index, channel in enumerate(
+                d.TSCH_HOPPING_SEQUENCE[:self.num_channels]
+            )
+        )
+
+        # PDR and RSSI values are kept by a storage indexed by source id,
+        # destination id and channel index; mote ids are 0 to num_motes-1. at
+        # the beginning, connectivity matrix indicates no connectivity at all
+        assert self.mote_id_list == list(range(len(self.mote_id_list)))
+        storage_class_name = u'ConnectivityStorage{0}'.format(
+            self.settings.conn_storage_class
+        )
+        storage_class = getattr(sys.modules[__name__], storage_class_name)
+        self._storage = storage_class(
+            len(self.mote_id_list),
+            self.num_channels,
+            self.LINK_NONE
+        )
+
+        # versions of the links, which tell whether PDR or RSSI of a link may
+        # have changed since a given time; every setter stamps what it
+        # changes with the next value of a counter. the version of a link is
+        # the latest stamp among the link itself, the rows of its end motes
+        # and the whole matrix
+        self._version_counter = 0
+        self._matrix_version = 0
+        self._row_versions = [0] * len(self.mote_id_list)
+        self._link_versions = {}
 
         self._additional_initialization()
 
@@ -524,25 +1040,141 @@ class ConnectivityMatrixBase(object):
         # for instance, to fill the matrix with some values
         pass
 
+    def destroy(self):
+        # override this method if you need to release resources, such as
+        # an open file
+        pass
+
     def set_pdr(self, src_id, dst_id, channel, pdr):
-        self._matrix[src_id][dst_id][channel][u'pdr'] = pdr
+        self._storage.set_pdr(src_id, dst_id, self._channel_index[channel], pdr)
+        self._stamp_link(src_id, dst_id)
 
     def set_pdr_both_directions(self, mote_id_1, mote_id_2, channel, pdr):
-        self._matrix[mote_id_1][mote_id_2][channel][u'pdr'] = pdr
-        self._matrix[mote_id_2][mote_id_1][channel][u'pdr'] = pdr
+        self.set_pdr(mote_id_1, mote_id_2, channel, pdr)
+        self.set_pdr(mote_id_2, mote_id_1, channel, pdr)
 
     def get_pdr(self, src_id, dst_id, channel):
-        return self._matrix[src_id][dst_id][channel][u'pdr']
+        return self._storage.get_pdr(
+            src_id,
+            dst_id,
+            self._channel_index[channel]
+        )
 
     def set_rssi(self, src_id, dst_id, channel, rssi):
-        self._matrix[src_id][dst_id][channel][u'rssi'] = rssi
+        self._storage.set_rssi(
+            src_id,
+            dst_id,
+            self._channel_index[channel],
+            rssi
+        )
+        self._stamp_link(src_id, dst_id)
 
     def set_rssi_both_directions(self, mote_id_1, mote_id_2, channel, rssi):
-        self._matrix[mote_id_1][mote_id_2][channel][u'rssi'] = rssi
-        self._matrix[mote_id_2][mote_id_1][channel][u'rssi'] = rssi
+        self.set_rssi(mote_id_1, mote_id_2, channel, rssi)
+        self.set_rssi(mote_id_2, mote_id_1, channel, rssi)
 
     def get_rssi(self, src_id, dst_id, channel):
-        return self._matrix[src_id][dst_id][channel][u'rssi']
+        return self._storage.get_rssi(
+            src_id,
+            dst_id,
+            self._channel_index[channel]
+        )
+
+    def get_transmitter_ids(self, dst_id, channel):
+        """return the ids of the motes dst_id can hear on the channel
+
+        The returned object supports the `in` operator; it shouldn't be
+        modified.
+        """
+        return self._storage.get_transmitter_ids(
+            dst_id,
+            self._channel_index[channel]
+        )
+
+    def get_heard_links(self, dst_id_list, src_id_list, channel):
+        """return the links on the channel which have a non-zero PDR
+
+        Return four arrays: the indices in dst_id_list and in src_id_list
+        of the destination and the source of the links, ordered by
+        destination then source, and the PDR and RSSI of the links.
+        """
+        return self._storage.get_heard_links(
+            dst_id_list,
+            src_id_list,
+            self._channel_index[channel]
+        )
+
+    def get_link_arrays(self, dst_id_list, src_id_list, channel):
+        """return PDR and RSSI arrays of the links on the channel
+
+        Both arrays have one row per destination and one column per source.
+        """
+        return self._storage.get_link_arrays(
+            dst_id_list,
+            src_id_list,
+            self._channel_index[channel]
+        )
+
+    # bulk setters; `channel` is None means all the channels
+
+    def set_link(self, src_id, dst_id, pdr, rssi, channel=None):
+        """set PDR and RSSI of a link on one or all the channels"""
+        self._storage.set_link(
+            src_id,
+            dst_id,
+            self._get_channel_index(channel),
+            pdr,
+            rssi
+        )
+        self._stamp_link(src_id, dst_id)
+
+    def set_link_both_directions(
+            self,
+            mote_id_1,
+            mote_id_2,
+            pdr,
+            rssi,
+            channel=None
+        ):
+        self.set_link(mote_id_1, mote_id_2, pdr, rssi, channel)
+        self.set_link(mote_id_2, mote_id_1, pdr, rssi, channel)
+
+    def set_row(self, src_id, pdr, rssi, channel=None):
+        """set PDR and RSSI from src_id to all the motes
+
+        pdr and rssi are either a single value or a sequence of values
+        indexed by destination id.
+        """
+        self._storage.set_row(
+            src_id,
+            self._get_channel_index(channel),
+            pdr,
+            rssi
+        )
+        self._version_counter += 1
+        self._row_versions[src_id] = self._version_counter
+
+    def set_channel(self, pdr, rssi, channel=None):
+        """set PDR and RSSI of all the links on one or all the channels"""
+        self._storage.set_channel(self._get_channel_index(channel), pdr, rssi)
+        self._version_counter += 1
+        self._matrix_version = self._version_counter
+
+    def get_link_version(self, mote_id_1, mote_id_2):
+        """return the version of the link between the two motes
+
+        The version changes whenever PDR or RSSI of the link may have
+        changed, in either direction and on any channel. Callers can keep
+        values computed from the link with its version and recompute them
+        only when the version changes.
+        """
+        return max(
+            self._matrix_version,
+            self._row_versions[mote_id_1],
+            self._row_versions[mote_id_2],
+            self._link_versions.get((mote_id_1, mote_id_2), 0),
+            self._link_versions.get((mote_id_2, mote_id_1), 0)
+        )
 
     def dump(self):
         output = []
@@ -550,40 +1182,50 @@ class ConnectivityMatrixBase(object):
 
         # header
         line = []
-        for src_id in self._matrix:
+        for src_id in self.mote_id_list:
             line += [str(src_id)]
         line = '\t|'.join(line)
         output  += [u'\t|'+line]
 
         # body
         channel = d.TSCH_HOPPING_SEQUENCE[0]
-        for src_id in self._matrix:
+        for src_id in self.mote_id_list:
             line = []
             line += [str(src_id)]
-            for dst_id in self._matrix[src_id]:
+            for dst_id in self.mote_id_list:
                 if src_id == dst_id:
                     line += [u'N/A']
                 else:
-                    line += [str(self._matrix[src_id][dst_id][channel][u'pdr'])]
+                    line += [str(self.get_pdr(src_id, dst_id, channel))]
             line = u'\t|'.join(line)
             output += [line]
 
         output = u'\n'.join(output)
         print(output)
 
+    # ======================= private =========================================
+
+    def _stamp_link(self, src_id, dst_id):
+        self._version_counter += 1
+        self._link_versions[(src_id, dst_id)] = self._version_counter
+
+    def _get_channel_index(self, channel):
+        if channel is None:
+            return None
+        else:
+            return self._channel_index[channel]
+
+
 class ConnectivityMatrixFullyMeshed(ConnectivityMatrixBase):
     """
     All nodes can hear all nodes with PDR=100%.
     """
 
     def _additional_initialization(self):
-        perfect_pdr = self.LINK_PERFECT[u'pdr']
-        perfect_rssi = self.LINK_PERFECT[u'rssi']
-        for src_id in self.mote_id_list:
-            for dst_id in self.mote_id_list:
-                for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                    self.set_pdr(src_id, dst_id, channel, perfect_pdr)
-                    self.set_rssi(src_id, dst_id, channel, perfect_rssi)
+        self.set_channel(
+            pdr  = self.LINK_PERFECT[u'pdr'],
+            rssi = self.LINK_PERFECT[u'rssi']
+        )
 
 
 class ConnectivityMatrixLinear(ConnectivityMatrixBase):
@@ -599,19 +1241,12 @@ class ConnectivityMatrixLinear(ConnectivityMatrixBase):
         parent_id = None
         for child_id in self.mote_id_list:
             if parent_id is not None:
-                for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                    self.set_pdr_both_directions(
-                        child_id,
-                        parent_id,
-                        channel,
-                        perfect_pdr
-                    )
-                    self.set_rssi_both_directions(
-                        child_id,
-                        parent_id,
-                        channel,
-                        perfect_rssi
-                    )
+                self.set_link_both_directions(
+                    child_id,
+                    parent_id,
+                    perfect_pdr,
+                    perfect_rssi
+                )
             parent_id = child_id
 
 
@@ -620,22 +1255,46 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
     Replay K7 connectivity trace.
     """
 
+    # number of rows of the trace held in memory at a time
+    TRACE_WINDOW_SIZE = 1024
+
+    # the generator reading rows from the trace file, until the last row
+    _trace_reader = None
+
+    # the columns of a window of the trace and of the cache of the trace,
+    # which is a NumPy file saved next to the trace
+    TRACE_WINDOW_TYPECODES = [
+        (u'asn',       'l'),
+        (u'src_id',    'i'),
+        (u'dst_id',    'i'),
+        (u'channel',   'i'),
+        (u'pdr',       'd'),
+        (u'mean_rssi', 'd'),
+    ]
+    TRACE_CACHE_DTYPE = [
+        ('asn',       '<i8'),
+        ('src_id',    '<i4'),
+        ('dst_id',    '<i4'),
+        ('channel',   '<i4'),
+        ('pdr',       '<f8'),
+        ('mean_rssi', '<f8'),
+    ]
+
     def _additional_initialization(self):
         """Fill the matrix using the connectivity trace file.  The
         connectivity matrix is initialized with values representing
-        the absence of a link.  The connectivity trace file is then
-        loaded into memory (connectivity values and trace meta
-        information).
+        the absence of a link.  The trace meta information is loaded,
+        then the connectivity values are read from the trace file on
+        demand, as the simulation advances.
         """
 
         # additional local variables
-        self.trace = []
         self.start_date = None
-        # the offset at which we stopped reading the trace
+        # the number of rows we have read in the trace
         self.trace_position = 0
         self.asn_of_next_update = 0
 
-        # load trace into memory and save metas (headers)
+        # load metas (headers)
         with gzip.open(self.settings.conn_trace, u'r') as tracefile:
             self.trace_header = json.loads(tracefile.readline().decode('utf-8'))
             self.csv_header = tracefile.readline().decode('utf-8').strip().split(u',')
@@ -689,33 +1348,36 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
             if self.settings.exec_numSlotframesPerRun > numSlotframes:
                 raise ValueError(u'exec_numSlotframesPerRun is too long')
 
-            initialization_is_done = False
-            initialized_links = set([])
+        # column indices in a row
+        self._column = dict(
+            (name, index) for (index, name) in enumerate(self.csv_header)
+        )
 
-            for line in tracefile:
-                row = self._parse_line(line.decode('utf-8'))
-                # make sure that PDR is a float
-                row[u'pdr'] = float(row[u'pdr'])
-                if not initialization_is_done:
-                    link = (row[u'src_id'], row[u'dst_id'], row[u'channel'])
-                    if link in initialized_links:
-                        # we've already initlized this link
-                        initialization_is_done = True
-                        # we don't need to keep the links any more
-                        initialized_links = None
-                    else:
-                        # this link has not been initialized. for this
-                        # purpose, set ASN 0 to this row so that this
-                        # row will be used to in the first _update()
-                        # call
-                        row[u'asn'] = 0
-                        # add the link to the list
-                        initialized_links.add(link)
-                self.trace.append(row)
+        # rows are read by _read_trace_window(), either from the cache of
+        # the trace or from the trace itself; the rows of the first part
+        # of the trace, until a link appears for the second time,
+        # initialize the matrix
+        self._trace_reader = None
+        self._trace_rows = None
+        self._trace_rows_position = 0
+        if self.settings.conn_trace_cache:
+            self._trace_rows = self._load_trace_cache()
+        if self._trace_rows is None:
+            self._trace_reader = self._read_trace()
+        self._window = None
+        self._window_position = 0
+        self._read_trace_window()
+
+        # initialize the matrix with the first part of the trace
+        # file
+        self._update()
 
-            # initialize the matrix with the first part of the trace
-            # file
-            self._update()
+    def destroy(self):
+        if self._trace_reader is not None:
+            self._trace_reader.close()
+            self._trace_reader = None
+        # release the memory-mapped cache
+        self._trace_rows = None
 
     # ======================= private =========================================
 
@@ -723,29 +1385,38 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
         assert self.asn_of_next_update >= self.engine.getAsn()
         # Read the connectivity trace and fill the connectivity
         # matrix
-        assert self.trace_position < len(self.trace)
         start_trace_position = self.trace_position
         while True:
-            row = self.trace[self.trace_position]
+            if self._window_position == len(self._window[u'asn']):
+                self._read_trace_window()
+
+            if len(self._window[u'asn']) == 0:
+                # we hit the bottom of the trace
+                asn_of_next_update = None
+                break
 
             # return next update ASN
 
-            if row[u'asn'] > self.engine.asn:
-                asn_of_next_update = row[u'asn']
+            index = self._window_position
+            if self._window[u'asn'][index] > self.engine.asn:
+                asn_of_next_update = self._window[u'asn'][index]
                 break
 
             # update matrix value
 
-            self._set_connectivity(row)
+            channel = self._window[u'channel'][index]
+            self._set_connectivity(
+                src_id  = self._window[u'src_id'][index],
+                dst_id  = self._window[u'dst_id'][index],
+                channel = channel if channel >= 0 else None,
+                pdr     = self._window[u'pdr'][index],
+                rssi    = self._window[u'mean_rssi'][index]
+            )
 
             # increment trace_position
+            self._window_position += 1
             self.trace_position += 1
 
-            if self.trace_position == len(self.trace):
-                # we hit the bottom of the trace
-                asn_of_next_update = None
-                break
-
         # update 'asn_of_next_update' with a new ASN, which can be
         # None
         self.asn_of_next_update = asn_of_next_update
@@ -766,63 +1437,183 @@ class ConnectivityMatrixK7(ConnectivityMatrixBase):
                 intraSlotOrder = d.INTRASLOTORDER_STARTSLOT
             )
 
-    def _set_connectivity(self, row):
-        """Modify the connectivity matrix.  If no channel is given
-        (i.e. channel is None), set all channels to the same value.
+    def _read_trace_window(self):
+        """Replace the window with the next rows of the trace.  The
+        window has one sequence per column; a channel of -1 means all
+        the channels.  The window is empty at the end of the trace.
         """
-        for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-            if (
-                    (row[u'channel'] is None)
-                    or
-                    (row[u'channel'] == channel)
-                ):
-                self.set_pdr(
-                    row[u'src_id'],
-                    row[u'dst_id'],
-                    channel,
-                    row[u'pdr']
+        self._window_position = 0
+
+        if self._trace_rows is not None:
+            # read the window from the cache; tolist() gives Python
+            # numbers, which are faster to handle than NumPy scalars
+            start = self._trace_rows_position
+            rows = self._trace_rows[start:start + self.TRACE_WINDOW_SIZE]
+            self._trace_rows_position += len(rows)
+            self._window = dict(
+                (name, rows[name].tolist())
+                for (name, _) in self.TRACE_CACHE_DTYPE
+            )
+            return
+
+        self._window = dict(
+            (name, array.array(typecode))
+            for (name, typecode) in self.TRACE_WINDOW_TYPECODES
+        )
+
+        if self._trace_reader is None:
+            # we've read the whole trace
+            return
+
+        for row in itertools.islice(self._trace_reader, self.TRACE_WINDOW_SIZE):
+            for ((name, _), value) in zip(self.TRACE_WINDOW_TYPECODES, row):
+                self._window[name].append(value)
+
+        if len(self._window[u'asn']) < self.TRACE_WINDOW_SIZE:
+            # this is the last window
+            self._trace_reader.close()
+            self._trace_reader = None
+
+    def _read_trace(self):
+        """Return a generator of the rows of the trace, as tuples of
+        (asn, src_id, dst_id, channel, pdr, mean_rssi).  The ASN of a row
+        initializing the matrix is 0; a channel of -1 means all the
+        channels.
+        """
+        tracefile = gzip.open(self.settings.conn_trace, u'r')
+        tracefile.readline() # trace header
+        tracefile.readline() # csv header
+
+        initialized_links = set([])
+        self._last_datetime = (None, None) # (string, ASN) of the last row
+        try:
+            for line in tracefile:
+                (asn, src_id, dst_id, channel, pdr, rssi) = self._parse_line(
+                    line.decode('utf-8')
                 )
-                self.set_rssi(
-                    row[u'src_id'],
-                    row[u'dst_id'],
-                    channel,
-                    row[u'mean_rssi']
+                if channel is None:
+                    channel = -1
+                if initialized_links is not None:
+                    link = (src_id, dst_id, channel)
+                    if link in initialized_links:
+                        # we've already initlized this link
+                        # we don't need to keep the links any more
+                        initialized_links = None
+                    else:
+                        # this link has not been initialized. for this
+                        # purpose, set ASN 0 to this row so that this
+                        # row will be used to in the first _update()
+                        # call
+                        asn = 0
+                        # add the link to the list
+                        initialized_links.add(link)
+                yield (asn, src_id, dst_id, channel, pdr, rssi)
+        finally:
+            tracefile.close()
+
+    def _get_trace_cache_path(self):
+        """Return the path of the cache of the trace, which is keyed by the
+        content of the trace and the slot duration.
+        """
+        trace_hash = hashlib.sha1()
+        with open(self.settings.conn_trace, u'rb') as tracefile:
+            for chunk in iter(lambda: tracefile.read(1024 * 1024), b''):
+                trace_hash.update(chunk)
+        return u'{0}.{1}.{2}us.npy'.format(
+            self.settings.conn_trace,
+            trace_hash.hexdigest()[:16],
+            int(round(self.settings.tsch_slotDuration * 1000000))
+        )
+
+    def _load_trace_cache(self):
+        """Return the rows of the trace memory-mapped from its cache,
+        converting the trace into the cache first if needed.  Return None
+        if the cache cannot be written.
+        """
+        cache_path = self._get_trace_cache_path()
+
+        if not os.path.exists(cache_path):
+            rows = numpy.array(
+                list(self._read_trace()),
+                dtype=self.TRACE_CACHE_DTYPE
+            )
+            # write to a temporary file first; another run may be looking
+            # for the same cache
+            tmp_path = u'{0}.{1}.tmp'.format(cache_path, os.getpid())
+            try:
+                with open(tmp_path, u'wb') as cachefile:
+                    numpy.save(cachefile, rows)
+                os.rename(tmp_path, cache_path)
+            except (IOError, OSError) as e:
+                print(
+                    u'Cannot write the cache of {0}: {1}'.format(
+                        self.settings.conn_trace,
+                        e
+                    )
                 )
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if not os.path.exists(cache_path):
+                    return None
+
+        return numpy.load(cache_path, mmap_mode=u'r')
+
+    def _set_connectivity(self, src_id, dst_id, channel, pdr, rssi):
+        """Modify the connectivity matrix.  If no channel is given
+        (i.e. channel is None), set all channels to the same value.
+        """
+        if (
+                (channel is not None)
+                and
+                (channel not in self._channel_index)
+            ):
+            # this channel is not used in the simulation
+            return
+        self.set_link(src_id, dst_id, pdr, rssi, channel=channel)
 
     def _parse_line(self, line):
+        """Return (asn, src_id, dst_id, channel, pdr, mean_rssi) of a row"""
 
         # === read and parse line
 
         vals = line.strip().split(u',')
-        row = dict(list(zip(self.csv_header, vals)))
+        column = self._column
 
         # === change row format
 
-        row[u'src_id'] = int(row[u'src']) if row[u'src'] else None
-        del row[u'src']
-        row[u'dst_id'] = int(row[u'dst']) if row[u'dst'] else None
-        del row[u'dst']
-        row[u'channel'] = int(row[u'channel']) if row[u'channel'] else None
-        row[u'datetime'] = dt.datetime.strptime(
-            row[u'datetime'], u'%Y-%m-%dT%H:%M:%S.%f'
-        )
+        src_id = int(vals[column[u'src']])
+        dst_id = int(vals[column[u'dst']])
+        channel = vals[column[u'channel']]
+        channel = int(channel) if channel else None
+
+        # make sure that PDR is a float
+        pdr = float(vals[column[u'pdr']])
 
         # rssi
 
-        if row[u'mean_rssi'] == u'' or (row[u'mean_rssi'] == u'None'):
-            row[u'mean_rssi'] = self.LINK_NONE[u'rssi']
+        mean_rssi = vals[column[u'mean_rssi']]
+        if mean_rssi == u'' or (mean_rssi == u'None'):
+            mean_rssi = self.LINK_NONE[u'rssi']
         else:
-            row[u'mean_rssi'] = float(row[u'mean_rssi'])
+            mean_rssi = float(mean_rssi)
 
-        # === add ASN value to row
+        # === ASN value of the row; consecutive rows often share the same
+        # datetime
 
-        time_delta = row[u'datetime'] - self.start_date
-        row[u'asn'] = int(
-            time_delta.total_seconds() /
-            float(self.settings.tsch_slotDuration)
-        )
+        datetime = vals[column[u'datetime']]
+        if datetime == self._last_datetime[0]:
+            asn = self._last_datetime[1]
+        else:
+            time_delta = dt.datetime.strptime(
+                datetime, u'%Y-%m-%dT%H:%M:%S.%f'
+            ) - self.start_date
+            asn = int(
+                time_delta.total_seconds() /
+                float(self.settings.tsch_slotDuration)
+            )
+            self._last_datetime = (datetime, asn)
 
-        return row
+        return (asn, src_id, dst_id, channel, pdr, mean_rssi)
 
 
 class ConnectivityMatrixRandom(ConnectivityMatrixBase):
@@ -841,6 +1632,20 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
         self.coordinates = {}  # (x, y) indexed by mote_id
         self.pister_hack = PisterHackModel(self.engine)
 
+        # a topology can be shared by runs through a file; the first run
+        # places the motes and saves the topology, the others load it
+        topology_file = self.settings.conn_random_topology_file
+        if topology_file is not None:
+            topology_file = topology_file.format(run_id=self.engine.run_id)
+
+        if (topology_file is not None) and os.path.exists(topology_file):
+            self._load_topology(topology_file)
+        else:
+            self._place_motes()
+            if topology_file is not None:
+                self._save_topology(topology_file)
+
+    def _place_motes(self):
         # ConnectivityRandom doesn't need the connectivity matrix. Instead, it
         # initializes coordinates of the motes. Its algorithm is:
         #
@@ -866,6 +1671,19 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
 
         assert init_min_neighbors <= self.settings.exec_numMotes
 
+        # deployed motes are registered in a grid of square cells; the side
+        # of a cell is the distance beyond which a link has PDR 0, whatever
+        # the random part of its RSSI. only the motes in the cells around a
+        # tentative coordinate can have a good PDR with the mote. with
+        # init_min_pdr of 0, every deployed mote counts.
+        if 0 < init_min_pdr:
+            self._grid_cell_side = self.pister_hack.compute_max_distance(
+                self.engine.motes
+            )
+        else:
+            self._grid_cell_side = None
+        self._grid = {}  # lists of mote ids indexed by cell
+
         # determine coordinates of the motes
         for target_mote_id in self.mote_id_list:
             mote_is_deployed = False
@@ -873,7 +1691,7 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
 
                 # select a tentative coordinate
                 if target_mote_id == 0:
-                    self.coordinates[target_mote_id] = (0, 0)
+                    self._deploy(target_mote_id, (0, 0), {})
                     mote_is_deployed = True
                     continue
 
@@ -882,36 +1700,27 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
                     square_side * random.random()
                 )
 
+                # draw the random part of the RSSI to each of the deployed
+                # motes, in the order compute_rssi() would
+                rssi_deviations = dict(
+                    (
+                        deployed_mote_id,
+                        self.pister_hack.draw_rssi_deviation()
+                    )
+                    for deployed_mote_id in self.coordinates
+                )
+
                 # count deployed motes who have enough PDR values to this
                 # mote
                 good_pdr_count = 0
-                base_channel = d.TSCH_HOPPING_SEQUENCE[0]
-                for deployed_mote_id in self.coordinates:
-                    rssi = self.pister_hack.compute_rssi(
-                        {
-                            u'mote'      : self._get_mote(target_mote_id),
-                            u'coordinate': coordinate
-                        },
-                        {
-                            u'mote'      : self._get_mote(deployed_mote_id),
-                            u'coordinate': self.coordinates[deployed_mote_id]
-                        }
-                    )
-                    pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
-                    # memorize the rssi and pdr values at the base channel
-                    self.set_pdr_both_directions(
-                        target_mote_id,
-                        deployed_mote_id,
-                        base_channel,
-                        pdr
-                    )
-                    self.set_rssi_both_directions(
+                for deployed_mote_id in self._get_mote_ids_around(coordinate):
+                    rssi = self._compute_rssi(
                         target_mote_id,
+                        coordinate,
                         deployed_mote_id,
-                        base_channel,
-                        rssi
+                        rssi_deviations[deployed_mote_id]
                     )
-
+                    pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
                     if init_min_pdr <= pdr:
                         good_pdr_count += 1
 
@@ -930,75 +1739,149 @@ class ConnectivityMatrixRandom(ConnectivityMatrixBase):
                         )
                     ):
                     # fix the coordinate of the mote
-                    self.coordinates[target_mote_id] = coordinate
-                    # copy the rssi and pdr values to other channels
-                    for deployed_mote_id in list(self.coordinates.keys()):
-                        rssi = self.get_rssi(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        pdr  = self.get_pdr(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        for channel in d.TSCH_HOPPING_SEQUENCE[:self.num_channels]:
-                            if channel == base_channel:
-                                # do nothing
-                                pass
-                            else:
-                                self.set_pdr_both_directions(
-                                    target_mote_id,
-                                    deployed_mote_id,
-                                    channel,
-                                    pdr
-                                )
-                                self.set_rssi_both_directions(
-                                    target_mote_id,
-                                    deployed_mote_id,
-                                    channel,
-                                    rssi
-                                )
-
+                    self._deploy(target_mote_id, coordinate, rssi_deviations)
                     mote_is_deployed = True
                 else:
-                    # remove memorized values at channel 0
-                    for deployed_mote_id in self.coordinates:
-                        self._clear_rssi(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
-                        self._clear_pdr(
-                            target_mote_id,
-                            deployed_mote_id,
-                            base_channel
-                        )
                     # try another random coordinate
                     continue
 
-    def _get_mote(self, mote_id):
-        # there must be a mote having mote_id. otherwise, the following line
-        # raises an exception.
-        return [mote for mote in self.engine.motes if mote.id == mote_id][0]
+    def _save_topology(self, topology_file):
+        # the links are symmetric and the same in all the channels
+        base_channel = d.TSCH_HOPPING_SEQUENCE[0]
+        topology = {
+            u'num_motes'  : len(self.mote_id_list),
+            u'settings'   : self._get_placement_settings(),
+            u'coordinates': [
+                list(self.coordinates[mote_id])
+                for mote_id in self.mote_id_list
+            ],
+            u'links'      : [
+                [
+                    src_id,
+                    dst_id,
+                    self.get_pdr(src_id, dst_id, base_channel),
+                    self.get_rssi(src_id, dst_id, base_channel)
+                ]
+                for src_id in self.mote_id_list
+                for dst_id in self.mote_id_list
+                if src_id < dst_id
+            ]
+        }
 
-    def _clear_rssi(self, mote_id_1, mote_id_2, channel):
-        self.set_rssi_both_directions(
-            mote_id_1,
-            mote_id_2,
-            channel,
-            self.LINK_NONE[u'rssi']
-        )
+        # write to a temporary file first; another run may be looking for
+        # the same file
+        tmp_file = u'{0}.{1}.tmp'.format(topology_file, os.getpid())
+        with open(tmp_file, u'w') as f:
+            json.dump(topology, f)
+        try:
+            os.rename(tmp_file, topology_file)
+        except OSError:
+            # another run has saved its topology in the meantime
+            os.remove(tmp_file)
+            if not os.path.exists(topology_file):
+                raise
+
+    def _load_topology(self, topology_file):
+        with open(topology_file, u'r') as f:
+            topology = json.load(f)
+
+        if topology[u'num_motes'] != len(self.mote_id_list):
+            raise ValueError(
+                u'{0} has {1} motes while exec_numMotes is {2}'.format(
+                    topology_file,
+                    topology[u'num_motes'],
+                    len(self.mote_id_list)
+                )
+            )
 
-    def _clear_pdr(self, mote_id_1, mote_id_2, channel):
-        self.set_rssi_both_directions(
-            mote_id_1,
-            mote_id_2,
-            channel,
-            self.LINK_NONE[u'pdr']
+        # the topology has to be placed with the same settings; a file saved
+        # without them is refused too
+        placement_settings = self._get_placement_settings()
+        if topology.get(u'settings') != placement_settings:
+            raise ValueError(
+                u'{0} was created with {1} while the settings are {2}'.format(
+                    topology_file,
+                    topology.get(u'settings'),
+                    placement_settings
+                )
+            )
+
+        for (mote_id, coordinate) in enumerate(topology[u'coordinates']):
+            self.coordinates[mote_id] = tuple(coordinate)
+        for (src_id, dst_id, pdr, rssi) in topology[u'links']:
+            self.set_link_both_directions(src_id, dst_id, pdr, rssi)
+
+    def _get_placement_settings(self):
+        # settings which the placement of the motes depends on
+        return dict(
+            (name, getattr(self.settings, name))
+            for name in [
+                u'conn_random_square_side',
+                u'conn_random_init_min_pdr',
+                u'conn_random_init_min_neighbors',
+            ]
         )
 
+    def _deploy(self, target_mote_id, coordinate, rssi_deviations):
+        # set the links between the mote and the deployed motes, in all the
+        # channels
+        for deployed_mote_id in self.coordinates:
+            rssi = self._compute_rssi(
+                target_mote_id,
+                coordinate,
+                deployed_mote_id,
+                rssi_deviations[deployed_mote_id]
+            )
+            pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
+            self.set_link_both_directions(
+                target_mote_id,
+                deployed_mote_id,
+                pdr,
+                rssi
+            )
+
+        # fix the coordinate of the mote
+        self.coordinates[target_mote_id] = coordinate
+        cell = self._get_grid_cell(coordinate)
+        if cell not in self._grid:
+            self._grid[cell] = []
+        self._grid[cell].append(target_mote_id)
+
+    def _compute_rssi(self, src_id, src_coordinate, dst_id, rssi_deviation):
+        return self.pister_hack.compute_mean_rssi(
+            {
+                u'mote'      : self.engine.motes[src_id],
+                u'coordinate': src_coordinate
+            },
+            {
+                u'mote'      : self.engine.motes[dst_id],
+                u'coordinate': self.coordinates[dst_id]
+            }
+        ) + rssi_deviation
+
+    def _get_grid_cell(self, coordinate):
+        if self._grid_cell_side is None:
+            # a single cell
+            return (0, 0)
+        else:
+            return (
+                int(math.floor(coordinate[0] / self._grid_cell_side)),
+                int(math.floor(coordinate[1] / self._grid_cell_side))
+            )
+
+    def _get_mote_ids_around(self, coordinate):
+        (x, y) = self._get_grid_cell(coordinate)
+        if self._grid_cell_side is None:
+            cells = [(x, y)]
+        else:
+            cells = [
+                (x + dx, y + dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1]
+            ]
+        mote_ids = []
+        for cell in cells:
+            mote_ids.extend(self._grid.get(cell, []))
+        return mote_ids
+
 
 class PisterHackModel(object):
 
@@ -1041,6 +1924,10 @@ class PisterHackModel(object):
         # RSSI value will be returned for the same motes and the ASN.
         self.rssi_cache = {} # indexed by (src_mote.id, dst_mote.id)
 
+        # bounds of the random part of an RSSI
+        self.rssi_deviation_min = old_div(-self.PISTER_HACK_LOWER_SHIFT,2)
+        self.rssi_deviation_max = old_div(+self.PISTER_HACK_LOWER_SHIFT,2)
+
     def compute_mean_rssi(self, src, dst):
         # distance in meters
         distance = self._get_distance_in_meters(
@@ -1050,8 +1937,8 @@ class PisterHackModel(object):
 
         # sqrt and inverse of the free space path loss (fspl)
         free_space_path_loss = (
-            old_div(self.SPEED_OF_LIGHT,
-            (4 * math.pi * distance * self.TWO_DOT_FOUR_GHZ))
+            self.SPEED_OF_LIGHT /
+            (4 * math.pi * distance * self.TWO_DOT_FOUR_GHZ)
         )
 
         # simple friis equation in Pr = Pt + Gt + Gr + 20log10(fspl)
@@ -1065,7 +1952,7 @@ class PisterHackModel(object):
         # according to the receiver power (RSSI) we can apply the Pister hack
         # model.
         # choosing the "mean" value
-        return pr - old_div(self.PISTER_HACK_LOWER_SHIFT, 2)
+        return pr - self.PISTER_HACK_LOWER_SHIFT / 2
 
     def compute_rssi(self, src, dst):
         """Compute RSSI between the points of a and b using Pister Hack"""
@@ -1078,16 +1965,32 @@ class PisterHackModel(object):
 
         # the receiver will receive the packet with an rssi uniformly
         # distributed between friis and (friis - 40)
-        rssi = (
-            mu +
-            random.uniform(
-                old_div(-self.PISTER_HACK_LOWER_SHIFT,2),
-                old_div(+self.PISTER_HACK_LOWER_SHIFT,2)
-            )
-        )
+        rssi = mu + self.draw_rssi_deviation()
 
         return rssi
 
+    def draw_rssi_deviation(self):
+        """Draw the random part of an RSSI, which is added to the mean RSSI"""
+        return random.uniform(self.rssi_deviation_min, self.rssi_deviation_max)
+
+    def compute_max_distance(self, motes):
+        """Return the distance in kilometers beyond which the PDR of a link
+        between two of the motes is 0, whatever the random part of its RSSI
+        """
+        # the RSSI is at most friis, and the PDR is 0 at and below the
+        # minimum RSSI in the table
+        max_gain = max(
+            [mote.radio.txPower + mote.radio.antennaGain for mote in motes]
+        ) + max([mote.radio.antennaGain for mote in motes])
+        min_rssi = min(self.RSSI_PDR_TABLE.keys())
+        max_distance = (
+            old_div(self.SPEED_OF_LIGHT,
+            (4 * math.pi * self.TWO_DOT_FOUR_GHZ)) *
+            math.pow(10, old_div(max_gain - min_rssi, 20.0))
+        )
+        # in kilometers, with a margin for rounding errors
+        return max_distance / 1000 * 1.01
+
     def convert_rssi_to_pdr(self, rssi):
         minRssi = min(self.RSSI_PDR_TABLE.keys())
         maxRssi = max(self.RSSI_PDR_TABLE.keys())
@@ -21,6 +21,7 @@ from . import sixp
 from . import tsch
 from . import radio
 
+from . import addr
 from . import MoteDefines as d
 
 # Simulator-wide modules
@@ -53,6 +54,7 @@ class Mote(object):
         self.dagRoot                   = False
         self._init_eui64(eui64)
         self.ipv6_prefix               = None
+        self._ipv6_global_addr         = None
 
         # stack
         self.app                       = app.App(self)
@@ -76,19 +78,23 @@ class Mote(object):
 
     def is_my_ipv6_addr(self, ipv6_addr):
         # get a address string in the canonical format
-        target_ipv6_addr = str(netaddr.IPAddress(ipv6_addr))
+        target_ipv6_addr = addr.get_ipv6_addr(ipv6_addr)
         return (
-            (self.get_ipv6_global_addr() == target_ipv6_addr)
+            (self._ipv6_global_addr == target_ipv6_addr)
             or
-            (self.get_ipv6_link_local_addr() == target_ipv6_addr)
+            (self._ipv6_link_local_addr == target_ipv6_addr)
         )
 
     def is_my_mac_addr(self, mac_addr):
-        return self.eui64 == mac_addr
+        return addr.get_mac_addr(mac_addr) == self._mac_addr
 
     def add_ipv6_prefix(self, prefix):
         # having more than one prefix is not supported
         self.ipv6_prefix = netaddr.IPAddress(prefix)
+        self._ipv6_global_addr = addr.mac_addr_to_ipv6_addr(
+            self._mac_addr,
+            str(self.ipv6_prefix)
+        )
         self.log(
             SimEngine.SimLog.LOG_IPV6_ADD_ADDR,
             {
@@ -101,18 +107,16 @@ class Mote(object):
     def delete_ipv6_prefix(self):
         # having more than one prefix is not supported
         self.ipv6_prefix = None
+        self._ipv6_global_addr = None
 
     def get_ipv6_global_addr(self, ref_addr=None):
-        if self.ipv6_prefix is None:
-            return None
-        else:
-            return str(self.eui64.ipv6(self.ipv6_prefix))
+        return self._ipv6_global_addr
 
     def get_ipv6_link_local_addr(self):
-        return str(self.eui64.ipv6_link_local())
+        return self._ipv6_link_local_addr
 
     def get_mac_addr(self):
-        return str(self.eui64)
+        return self._mac_addr
 
 
     # ==== location
@@ -213,6 +217,13 @@ class Mote(object):
                 self.eui64 = netaddr.EUI(local_eui64.value + self.id)
         else:
             self.eui64 = netaddr.EUI(eui64)
+        # addresses in the canonical format, computed once
+        self._mac_addr = str(self.eui64)
+        self._ipv6_link_local_addr = addr.mac_addr_to_ipv6_addr(
+            self._mac_addr,
+            None
+        )
+        self.engine.register_mac_addr(self, self.get_mac_addr())
         self.log(
             SimEngine.SimLog.LOG_MAC_ADD_ADDR,
             {
@@ -0,0 +1,110 @@
+"""
+Canonical forms of MAC and IPv6 addresses
+
+Addresses are carried in packets and logs as strings in the formats netaddr
+gives them (e.g. '02-00-00-00-00-00-00-01' and 'fe80::1'). Parsing and
+formatting them with netaddr is costly; the helpers below do it once per
+address and keep the results.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+from builtins import str
+
+import netaddr
+
+# =========================== defines =========================================
+
+# results of the conversions, indexed by the given address; the number of
+# addresses in a simulation is bounded by the number of motes
+_mac_addr_cache = {}       # canonical string, None for an invalid address
+_mac_addr_value_cache = {}
+_ipv6_addr_cache = {}      # (canonical string, integer value)
+_derived_mac_addr_cache = {}
+_mac_to_ipv6_addr_cache = {}
+
+# =========================== helpers =========================================
+
+def get_mac_addr(mac_addr):
+    """Return the canonical string of a MAC address, or None if mac_addr is
+    not a valid EUI
+    """
+    try:
+        return _mac_addr_cache[mac_addr]
+    except KeyError:
+        try:
+            canonical_mac_addr = str(netaddr.EUI(mac_addr))
+        except (netaddr.AddrFormatError, TypeError, ValueError):
+            canonical_mac_addr = None
+        _mac_addr_cache[mac_addr] = canonical_mac_addr
+        return canonical_mac_addr
+
+def get_mac_addr_value(mac_addr):
+    """Return the integer value of a MAC address"""
+    try:
+        return _mac_addr_value_cache[mac_addr]
+    except KeyError:
+        value = int(netaddr.EUI(mac_addr))
+        _mac_addr_value_cache[mac_addr] = value
+        return value
+
+def get_ipv6_addr(ipv6_addr):
+    """Return the canonical string of an IPv6 address
+
+    netaddr.AddrFormatError is raised for an invalid address.
+    """
+    return _get_ipv6_addr_entry(ipv6_addr)[0]
+
+def is_ipv6_multicast_addr(ipv6_addr):
+    return (_get_ipv6_addr_first_word(ipv6_addr) & 0xFF00) == 0xFF00
+
+def is_ipv6_link_local_addr(ipv6_addr):
+    return (_get_ipv6_addr_first_word(ipv6_addr) & 0xFE80) == 0xFE80
+
+def ipv6_addr_to_mac_addr(ipv6_addr):
+    """Return the MAC address derived from the interface ID of an IPv6
+    address
+    """
+    try:
+        return _derived_mac_addr_cache[ipv6_addr]
+    except KeyError:
+        # use lower 64 bits and invert U/L bit
+        mac_addr = str(
+            netaddr.EUI(
+                (_get_ipv6_addr_entry(ipv6_addr)[1] & 0xFFFFFFFFFFFFFFFF) ^
+                0x0200000000000000
+            )
+        )
+        _derived_mac_addr_cache[ipv6_addr] = mac_addr
+        return mac_addr
+
+def mac_addr_to_ipv6_addr(mac_addr, prefix):
+    """Return the IPv6 address made of a prefix and a MAC address; the
+    link-local address with prefix of None
+    """
+    key = (mac_addr, prefix)
+    try:
+        return _mac_to_ipv6_addr_cache[key]
+    except KeyError:
+        eui64 = netaddr.EUI(mac_addr)
+        if prefix is None:
+            ipv6_addr = str(eui64.ipv6_link_local())
+        else:
+            ipv6_addr = str(eui64.ipv6(netaddr.IPAddress(prefix)))
+        _mac_to_ipv6_addr_cache[key] = ipv6_addr
+        return ipv6_addr
+
+# =========================== private =========================================
+
+def _get_ipv6_addr_entry(ipv6_addr):
+    try:
+        return _ipv6_addr_cache[ipv6_addr]
+    except KeyError:
+        addr = netaddr.IPAddress(ipv6_addr)
+        entry = (str(addr), int(addr))
+        _ipv6_addr_cache[ipv6_addr] = entry
+        return entry
+
+def _get_ipv6_addr_first_word(ipv6_addr):
+    return _get_ipv6_addr_entry(ipv6_addr)[1] >> 112
@@ -74,6 +74,8 @@ class AppBase(object):
                 u'packet'  : packet
             }
         )
+        if self.engine.kpis is not None:
+            self.engine.kpis.record_app_rx(packet, self.engine.getAsn())
 
     #======================== private ==========================================
 
@@ -125,6 +127,12 @@ class AppBase(object):
                 u'packet':         packet,
             }
         )
+        if self.engine.kpis is not None:
+            self.engine.kpis.record_app_tx(
+                self.mote.id,
+                packet,
+                self.engine.getAsn()
+            )
 
         # send
         self.mote.sixlowpan.sendPacket(packet)
@@ -156,6 +164,8 @@ class AppRoot(AppBase):
                 u'packet'  : packet
             }
         )
+        if self.engine.kpis is not None:
+            self.engine.kpis.record_app_rx(packet, self.engine.getAsn())
 
     #======================== private ==========================================
 
@@ -0,0 +1,59 @@
+"""
+Copies of packets
+
+A packet is a dict of headers ('mac', 'net', 'app'), each of which is a dict
+of plain values, lists and dicts, so that it can be logged as it is.
+
+Copies are made copy-on-write: a layer which changes a header of a packet it
+doesn't own (e.g. 'hop_limit' of a forwarded packet, 'mac' of a fragment)
+works on a copy of that header, while headers it doesn't change are shared
+with the original packet. The 'app' payload is never modified once the packet
+is created; whoever needs a different payload builds a new one.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+import copy
+
+# =========================== defines =========================================
+
+# values which are shared by copies as they are
+_IMMUTABLE_TYPES = set([type(None), bool, int, float, str, type(u''), tuple])
+try:
+    _IMMUTABLE_TYPES.add(long)
+except NameError:
+    # Python 3
+    pass
+
+# =========================== helpers =========================================
+
+def copy_header(header):
+    """Return a copy of a header, which can be modified without changing the
+    given one
+    """
+    value_type = type(header)
+    if value_type is dict:
+        return dict(
+            (key, copy_header(value)) for key, value in header.items()
+        )
+    elif value_type is list:
+        return [copy_header(value) for value in header]
+    elif value_type in _IMMUTABLE_TYPES:
+        return header
+    else:
+        return copy.deepcopy(header)
+
+def copy_packet(packet):
+    """Return a copy of a packet, whose headers can be modified without
+    changing the given packet
+
+    This is much cheaper than copy.deepcopy(). The 'app' payload is shared.
+    """
+    new_packet = {}
+    for key, value in packet.items():
+        if key == u'app':
+            new_packet[key] = value
+        else:
+            new_packet[key] = copy_header(value)
+    return new_packet
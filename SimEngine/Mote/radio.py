@@ -76,10 +76,12 @@ class Radio(object):
             u'channel': channel,
             u'packet':  packet,
         }
+        self.engine.connectivity.add_transmitter(self.mote.id, channel)
 
     def txDone(self, isACKed):
         """end of tx slot"""
         self.state = d.RADIO_STATE_OFF
+        self.engine.connectivity.remove_transmitter(self.mote.id, self.channel)
 
         assert self.onGoingTransmission
 
@@ -110,12 +112,14 @@ class Radio(object):
         assert self.state != d.RADIO_STATE_RX
         self.state = d.RADIO_STATE_RX
         self.channel = channel
+        self.engine.connectivity.add_listener(self.mote.id, channel)
 
     def rxDone(self, packet):
         """end of RX radio activity"""
 
         # switch radio state
         self.state   = d.RADIO_STATE_OFF
+        self.engine.connectivity.remove_listener(self.mote.id, self.channel)
 
         # log charge consumed
         if not packet:
@@ -171,6 +175,12 @@ class Radio(object):
                 u'sleep'         : self.stats[u'sleep']
             }
         )
+        if self.engine.kpis is not None:
+            self.engine.kpis.record_radio_stats(
+                self.mote.id,
+                self.stats,
+                self.engine.getAsn()
+            )
 
         # schedule next
         self._schedule_log_stats()
@@ -16,17 +16,18 @@ from __future__ import division
 from builtins import str
 from builtins import object
 from past.utils import old_div
+import bisect
 import random
 import math
 import sys
 
-import netaddr
 import numpy
 
 # Mote sub-modules
 
 # Simulator-wide modules
 import SimEngine
+from . import addr
 from . import MoteDefines as d
 from .trickle_timer import TrickleTimer
 
@@ -65,6 +66,8 @@ class Rpl(object):
             callback = self._send_DIO
         )
         self.parentChildfromDAOs       = {}      # dictionary containing parents of each node
+        self.childrenFromDAOs          = {}      # reverse of parentChildfromDAOs, indexed by parent
+        self.source_routes             = {}      # source routes computed by the root, indexed by destination
         self._tx_stat                  = {}      # indexed by mote_id
         self.dis_mode = self._get_dis_mode()
 
@@ -82,7 +85,20 @@ class Rpl(object):
             return int(old_div(self.of.rank, d.RPL_MINHOPRANKINCREASE))
 
     def addParentChildfromDAOs(self, parent_addr, child_addr):
+        if child_addr in self.parentChildfromDAOs:
+            old_parent_addr = self.parentChildfromDAOs[child_addr]
+            if old_parent_addr == parent_addr:
+                # no change
+                return
+            self.childrenFromDAOs[old_parent_addr].discard(child_addr)
+
         self.parentChildfromDAOs[child_addr] = parent_addr
+        if parent_addr not in self.childrenFromDAOs:
+            self.childrenFromDAOs[parent_addr] = set()
+        self.childrenFromDAOs[parent_addr].add(child_addr)
+
+        # the routes to the child and its descendants have changed
+        self._invalidate_source_routes(child_addr)
 
     def getPreferredParent(self):
         # return the MAC address of the current preferred parent
@@ -434,9 +450,10 @@ class Rpl(object):
         if self.mote.clear_to_send_EBs_DATA()==False:
             return
 
-        parent_mac_addr = netaddr.EUI(self.of.get_preferred_parent())
-        prefix = netaddr.IPAddress(d.IPV6_DEFAULT_PREFIX)
-        parent_ipv6_addr = str(parent_mac_addr.ipv6(prefix))
+        parent_ipv6_addr = addr.mac_addr_to_ipv6_addr(
+            self.of.get_preferred_parent(),
+            d.IPV6_DEFAULT_PREFIX
+        )
 
         # create
         newDAO = {
@@ -492,27 +509,63 @@ class Rpl(object):
 
     def computeSourceRoute(self, dst_addr):
         assert self.mote.dagRoot
-        try:
-            sourceRoute = []
+
+        if dst_addr in self.source_routes:
+            sourceRoute = self.source_routes[dst_addr]
+        else:
+            # walk up from the destination until we reach ourselves or an
+            # address whose route is known
+            addrs_on_path = []
+            addrs_visited = set()
             cur_addr = dst_addr
-            while self.mote.is_my_ipv6_addr(cur_addr) is False:
-                sourceRoute += [cur_addr]
-                cur_addr     = self.parentChildfromDAOs[cur_addr]
-                if cur_addr in sourceRoute:
+            while True:
+                if cur_addr in self.source_routes:
+                    sourceRoute = self.source_routes[cur_addr]
+                    break
+                elif self.mote.is_my_ipv6_addr(cur_addr):
+                    sourceRoute = ()
+                    break
+                elif cur_addr in addrs_visited:
                     # routing loop is detected; cannot return an effective
                     # source-routing header
-                    returnVal = None
+                    sourceRoute = None
+                    break
+                elif cur_addr not in self.parentChildfromDAOs:
+                    # we don't know the parent
+                    sourceRoute = None
                     break
-        except KeyError:
+                addrs_on_path.append(cur_addr)
+                addrs_visited.add(cur_addr)
+                cur_addr = self.parentChildfromDAOs[cur_addr]
+
+            # keep the routes to all the addresses we went through, from the
+            # top (so goes from source to destination)
+            addrs_on_path.reverse()
+            for addr_on_path in addrs_on_path:
+                if sourceRoute is not None:
+                    sourceRoute = sourceRoute + (addr_on_path,)
+                self.source_routes[addr_on_path] = sourceRoute
+
+        if sourceRoute is None:
             returnVal = None
         else:
-            # reverse (so goes from source to destination)
-            sourceRoute.reverse()
-
-            returnVal = sourceRoute
+            # return a copy, which the caller may modify
+            returnVal = list(sourceRoute)
 
         return returnVal
 
+    def _invalidate_source_routes(self, addr):
+        # forget the routes to addr and all its descendants
+        addrs_to_visit = [addr]
+        addrs_visited = set()
+        while addrs_to_visit:
+            cur_addr = addrs_to_visit.pop()
+            if cur_addr in addrs_visited:
+                continue
+            addrs_visited.add(cur_addr)
+            self.source_routes.pop(cur_addr, None)
+            addrs_to_visit.extend(self.childrenFromDAOs.get(cur_addr, ()))
+
 
 class RplOFBase(object):
     def __init__(self, rpl):
@@ -576,34 +629,17 @@ class RplOF0(RplOFBase):
 
     def __init__(self, rpl):
         super(RplOF0, self).__init__(rpl)
-        self.neighbors = []
+        self._init_neighbor_table()
 
     @property
     def parents(self):
-        # a parent should have a lower rank than us by MinHopRankIncrease at
-        # least. See section 3.5.1 of RFC 6550:
-        #    "MinHopRankIncrease is the minimum increase in Rank between a node
-        #     and any of its DODAG parents."
-        _parents = []
-        for neighbor in self.neighbors:
-            if self._calculate_rank(neighbor) is None:
-                # skip this one
-                continue
-
-            if (
-                    (self.rank is None)
-                    or
-                    (
-                        d.RPL_MINHOPRANKINCREASE <=
-                        self.rank - neighbor[u'advertised_rank']
-                    )
-                ):
-                _parents.append(neighbor)
-
-        return _parents
+        return [
+            neighbor for neighbor in self.neighbors
+            if self._is_parent(neighbor)
+        ]
 
     def reset(self):
-        self.neighbors = []
+        self._init_neighbor_table()
         super(RplOF0, self).reset()
 
     def update(self, dio):
@@ -619,7 +655,7 @@ class RplOF0(RplOFBase):
         # if we received the infinite rank from our preferred parent,
         # invalidate our rank
         if (
-                (self.preferred_parent == neighbor)
+                (self.preferred_parent is neighbor)
                 and
                 (rank == d.RPL_INFINITE_RANK)
             ):
@@ -647,7 +683,7 @@ class RplOF0(RplOFBase):
 
     def update_etx(self, cell, mac_addr, isACKed):
         assert mac_addr != d.BROADCAST_ADDRESS
-        assert d.CELLOPTION_TX in cell.options
+        assert cell.is_tx_on()
 
         neighbor = self._find_neighbor(mac_addr)
         if neighbor is None:
@@ -686,29 +722,86 @@ class RplOF0(RplOFBase):
         self._update_neighbor_rank_increase(neighbor)
         self._update_preferred_parent()
 
+    def _init_neighbor_table(self):
+        # neighbors in the order they are added, which breaks ties among
+        # parents having the same rank
+        self.neighbors = []
+        self.neighbor_by_mac_addr = {}
+        # (calculated_rank, index in self.neighbors) of neighbors which have
+        # a calculated rank, in ascending order
+        self.ranked_neighbors = []
+
     def _add_neighbor(self, mac_addr):
         assert self._find_neighbor(mac_addr) is None
 
         neighbor = {
             u'mac_addr': mac_addr,
+            u'index': len(self.neighbors),
             u'advertised_rank': None,
             u'rank_increase': None,
+            # our rank when this neighbor is our parent, which is cached
+            # and updated when advertised_rank or rank_increase changes
+            u'calculated_rank': None,
             u'numTx': 0,
             u'numTxAck': 0,
             u'etx': self.ETX_DEFAULT
         }
         self.neighbors.append(neighbor)
+        self.neighbor_by_mac_addr[mac_addr] = neighbor
         self._update_neighbor_rank_increase(neighbor)
         return neighbor
 
     def _find_neighbor(self, mac_addr):
-        for neighbor in self.neighbors:
-            if neighbor[u'mac_addr'] == mac_addr:
+        return self.neighbor_by_mac_addr.get(mac_addr)
+
+    def _is_parent(self, neighbor):
+        # a parent should have a lower rank than us by MinHopRankIncrease at
+        # least. See section 3.5.1 of RFC 6550:
+        #    "MinHopRankIncrease is the minimum increase in Rank between a node
+        #     and any of its DODAG parents."
+        return (
+            (neighbor[u'calculated_rank'] is not None)
+            and
+            (
+                (self.rank is None)
+                or
+                (
+                    d.RPL_MINHOPRANKINCREASE <=
+                    self.rank - neighbor[u'advertised_rank']
+                )
+            )
+        )
+
+    def _find_best_parent_candidate(self):
+        # return the parent which brings the lowest rank; the first one in
+        # self.neighbors among the parents having the same rank
+        for _, index in self.ranked_neighbors:
+            neighbor = self.neighbors[index]
+            if self._is_parent(neighbor):
                 return neighbor
         return None
 
     def _update_neighbor_rank(self, neighbor, new_advertised_rank):
         neighbor[u'advertised_rank'] = new_advertised_rank
+        self._update_neighbor_calculated_rank(neighbor)
+
+    def _update_neighbor_calculated_rank(self, neighbor):
+        old_entry = (neighbor[u'calculated_rank'], neighbor[u'index'])
+        calculated_rank = self._calculate_rank(neighbor)
+        if calculated_rank == old_entry[0]:
+            # nothing to update
+            return
+
+        if old_entry[0] is not None:
+            del self.ranked_neighbors[
+                bisect.bisect_left(self.ranked_neighbors, old_entry)
+            ]
+        neighbor[u'calculated_rank'] = calculated_rank
+        if calculated_rank is not None:
+            bisect.insort(
+                self.ranked_neighbors,
+                (calculated_rank, neighbor[u'index'])
+            )
 
     def _update_neighbor_rank_increase(self, neighbor):
         if neighbor[u'etx'] > self.UPPER_LIMIT_OF_ACCEPTABLE_ETX:
@@ -726,9 +819,10 @@ class RplOF0(RplOFBase):
             # ETX is 3, which is defined in Section 5.1.1 of RFC 8180
             assert step_of_rank <= self.MAXIMUM_STEP_OF_RANK
             neighbor[u'rank_increase'] = step_of_rank * d.RPL_MINHOPRANKINCREASE
+        self._update_neighbor_calculated_rank(neighbor)
 
-        if neighbor == self.preferred_parent:
-            self.rank = self._calculate_rank(self.preferred_parent)
+        if neighbor is self.preferred_parent:
+            self.rank = neighbor[u'calculated_rank']
 
     def _calculate_rank(self, neighbor):
         if (
@@ -774,13 +868,12 @@ class RplOF0(RplOFBase):
             # the parent. otherwise, we may create a routing loop.
             return
 
-        try:
-            candidate = min(self.parents, key=self._calculate_rank)
-            new_rank = self._calculate_rank(candidate)
-        except ValueError:
-            # self.parents is empty
-            candidate = None
+        candidate = self._find_best_parent_candidate()
+        if candidate is None:
+            # we don't have any parent
             new_rank = None
+        else:
+            new_rank = candidate[u'calculated_rank']
 
         if new_rank is None:
             # we don't have any available parent
@@ -814,7 +907,7 @@ class RplOF0(RplOFBase):
         if (
                 (new_parent is not None)
                 and
-                (new_parent != self.preferred_parent)
+                (new_parent is not self.preferred_parent)
             ):
             # change to the new preferred parent
 
@@ -861,7 +954,6 @@ class RplOFBestLinkPDR(RplOF0):
     def __init__(self, rpl):
         super(RplOFBestLinkPDR, self).__init__(rpl)
         self.preferred_parent = self.NONE_PREFERRED_PARENT
-        self.neighbors = []
         self.path_pdr = 0
 
         # short hand
@@ -873,38 +965,14 @@ class RplOFBestLinkPDR(RplOF0):
     def parents(self):
         # return neighbors which don't have us on their paths to the
         # root
-        ret_val = []
-        for neighbor in self.neighbors:
-            # parent should have better PDR than ACCEPTABLE_LOWEST_PDR
-            if neighbor[u'mean_link_pdr'] < self.ACCEPTABLE_LOWEST_PDR:
-                # this neighbor is not eligible to be a parent
-                continue
-            parent_mote = self.engine.motes[neighbor[u'mote_id']]
-            while parent_mote.dagRoot is False:
-                assert parent_mote.rpl.of.preferred_parent
-                parent_id = parent_mote.rpl.of.preferred_parent[u'mote_id']
-
-                if (
-                        (parent_id is None)
-                        or
-                        (parent_id == self.mote.id)
-                    ):
-                    # this mote doesn't have parent. OR we will make a
-                    # routing loop if we select this neighbor as our
-                    # preferred parent.
-                    parent_mote = None
-                    break
-
-                parent_mote = self.engine.motes[parent_id]
-
-            if parent_mote:
-                ret_val.append(neighbor)
-        return ret_val
+        return [
+            neighbor for neighbor in self.neighbors
+            if self._is_parent(neighbor)
+        ]
 
     def reset(self):
         super(RplOFBestLinkPDR, self).reset()
         self.preferred_parent = self.NONE_PREFERRED_PARENT
-        self.neighbors = []
 
     def update(self, dio):
         # short-hand
@@ -918,20 +986,15 @@ class RplOFBestLinkPDR(RplOF0):
                 pass
             else:
                 # remove the neighbor advertising the infinite rank
-                self.neighbors.remove(neighbor)
+                self._remove_neighbor(neighbor)
         else:
             if neighbor is None:
                 # add a new neighbor entry
-                neighbor = {
-                    u'mac_addr': src_mac,
-                    u'mote_id': self._find_mote_id(src_mac),
-                    u'rank': None,
-                    u'mean_link_pdr': 0
-                }
-                self.neighbors.append(neighbor)
+                neighbor = self._add_neighbor(src_mac)
 
             # update the advertised rank and path ETX
             neighbor[u'rank'] = dio[u'app'][u'rank']
+            self._update_neighbor_position(neighbor)
 
         # update the PDR values
         self._update_link_quality_of_neighbors()
@@ -943,6 +1006,7 @@ class RplOFBestLinkPDR(RplOF0):
         neighbor = self._find_neighbor(mac_addr)
         if neighbor is not None:
             neighbor[u'rank'] = d.RPL_INFINITE_RANK
+            self._update_neighbor_position(neighbor)
         self._update_preferred_parent()
         # send a broadcast DIS to collect neighbors which we've not
         # noticed
@@ -982,35 +1046,129 @@ class RplOFBestLinkPDR(RplOF0):
             rank = neighbor[u'rank'] + rank_increase
         return rank
 
+    def _init_neighbor_table(self):
+        # neighbors are kept sorted by their sort keys, which are
+        # (calculated rank, mean link RSSI, mote_id); mote_id breaks ties
+        self.neighbors = []
+        self.neighbor_sort_keys = []
+        self.neighbor_by_mac_addr = {}
+
+    def _add_neighbor(self, mac_addr):
+        assert self._find_neighbor(mac_addr) is None
+
+        neighbor = {
+            u'mac_addr': mac_addr,
+            u'mote_id': self._find_mote_id(mac_addr),
+            u'rank': None,
+            u'mean_link_pdr': 0,
+            # version of the link with the neighbor at which the mean
+            # link values were computed
+            u'link_version': None,
+            # key of the neighbor in self.neighbor_sort_keys
+            u'sort_key': None
+        }
+        self.neighbor_by_mac_addr[mac_addr] = neighbor
+        # the neighbor is put into self.neighbors when its rank is known
+        neighbor[u'link_version'] = self.connectivity.get_link_version(
+            self.mote.id,
+            neighbor[u'mote_id']
+        )
+        self._update_mean_link_pdr(neighbor)
+        self._update_mean_link_rssi(neighbor)
+        return neighbor
+
+    def _remove_neighbor(self, neighbor):
+        index = bisect.bisect_left(
+            self.neighbor_sort_keys,
+            neighbor[u'sort_key']
+        )
+        assert self.neighbors[index] is neighbor
+        del self.neighbors[index]
+        del self.neighbor_sort_keys[index]
+        del self.neighbor_by_mac_addr[neighbor[u'mac_addr']]
+
+    def _update_neighbor_position(self, neighbor):
+        # move the neighbor to the position given by its current sort key
+        old_sort_key = neighbor[u'sort_key']
+        new_sort_key = (
+            self._calculate_rank(neighbor),
+            neighbor[u'mean_link_rssi'],
+            neighbor[u'mote_id']
+        )
+        if new_sort_key == old_sort_key:
+            # nothing to do
+            return
+
+        if old_sort_key is not None:
+            index = bisect.bisect_left(self.neighbor_sort_keys, old_sort_key)
+            assert self.neighbors[index] is neighbor
+            del self.neighbors[index]
+            del self.neighbor_sort_keys[index]
+        neighbor[u'sort_key'] = new_sort_key
+        index = bisect.bisect_left(self.neighbor_sort_keys, new_sort_key)
+        self.neighbors.insert(index, neighbor)
+        self.neighbor_sort_keys.insert(index, new_sort_key)
+
     def _find_neighbor(self, mac_addr):
-        ret_val = None
-        for neighbor in self.neighbors:
-            if neighbor[u'mac_addr'] == mac_addr:
-                ret_val = neighbor
-                break
-        return ret_val
+        return self.neighbor_by_mac_addr.get(mac_addr)
+
+    def _is_parent(self, neighbor):
+        # parent should have better PDR than ACCEPTABLE_LOWEST_PDR
+        if neighbor[u'mean_link_pdr'] < self.ACCEPTABLE_LOWEST_PDR:
+            # this neighbor is not eligible to be a parent
+            return False
+
+        # a parent shouldn't have us on its path to the root
+        parent_mote = self.engine.motes[neighbor[u'mote_id']]
+        while parent_mote.dagRoot is False:
+            assert parent_mote.rpl.of.preferred_parent
+            parent_id = parent_mote.rpl.of.preferred_parent[u'mote_id']
+
+            if (
+                    (parent_id is None)
+                    or
+                    (parent_id == self.mote.id)
+                ):
+                # this mote doesn't have parent. OR we will make a
+                # routing loop if we select this neighbor as our
+                # preferred parent.
+                return False
+
+            parent_mote = self.engine.motes[parent_id]
+        return True
 
     def _find_mote_id(self, mac_addr):
-        mote_id = None
-        for mote in self.engine.motes:
-            if mote.is_my_mac_addr(mac_addr):
-                mote_id = mote.id
-                break
-        assert mote_id is not None
-        return mote_id
+        mote = self.engine.get_mote_by_mac_addr(mac_addr)
+        assert mote is not None
+        return mote.id
 
     def _update_link_quality_of_neighbors(self):
-        for neighbor in self.neighbors:
-            self._update_mean_link_pdr(neighbor)
-            self._update_mean_link_rssi(neighbor)
+        # iterate over a copy since neighbors may move in the list
+        for neighbor in list(self.neighbors):
+            self._update_link_quality(neighbor)
+
+    def _update_link_quality(self, neighbor):
+        # the mean link values are recomputed only when the link has
+        # changed since they were computed
+        link_version = self.connectivity.get_link_version(
+            self.mote.id,
+            neighbor[u'mote_id']
+        )
+        if link_version == neighbor[u'link_version']:
+            # nothing to update
+            return
+        neighbor[u'link_version'] = link_version
+        self._update_mean_link_pdr(neighbor)
+        self._update_mean_link_rssi(neighbor)
+        self._update_neighbor_position(neighbor)
 
     def _update_preferred_parent(self):
-        if self.parents:
-            new_preferred_parent = self._find_best_parent()
-            new_rank = self._calculate_rank(new_preferred_parent)
-        else:
+        new_preferred_parent = self._find_best_parent()
+        if new_preferred_parent is None:
             new_preferred_parent = self.NONE_PREFERRED_PARENT
             new_rank = d.RPL_INFINITE_RANK
+        else:
+            new_rank = self._calculate_rank(new_preferred_parent)
 
         if (
                 (new_preferred_parent != self.NONE_PREFERRED_PARENT)
@@ -1049,11 +1207,15 @@ class RplOFBestLinkPDR(RplOF0):
                             d.RPL_INFINITE_RANK
                         )
                         and
-                        (old_preferred_parent in self.neighbors)
+                        (
+                            self._find_neighbor(
+                                old_preferred_parent[u'mac_addr']
+                            ) is old_preferred_parent
+                        )
                     ):
                     # this neighbor should have been poisoned; remove
                     # this one from our neighbor list
-                    self.neighbors.remove(old_preferred_parent)
+                    self._remove_neighbor(old_preferred_parent)
 
     def _update_mean_link_pdr(self, neighbor):
         # we will calculate the mean PDR value over all the available
@@ -1080,18 +1242,9 @@ class RplOFBestLinkPDR(RplOF0):
         ])
 
     def _find_best_parent(self):
-        # find a parent which brings the best rank for us. use mote_id
-        # for a tie-breaker.
-
-        # sort the neighbors
-        self.neighbors = sorted(
-            self.neighbors,
-            key=lambda e: (
-                self._calculate_rank(e),
-                e[u'mean_link_rssi'],
-                e[u'mote_id']
-            )
-        )
-
-        # then return the first neighbor in "parents"
-        return self.parents[0]
+        # find a parent which brings the best rank for us, which is the
+        # first one in the sorted neighbors; None if we have no parent
+        for neighbor in self.neighbors:
+            if self._is_parent(neighbor):
+                return neighbor
+        return None
@@ -60,6 +60,11 @@ class SecJoin(object):
                     u'_mote_id': self.mote.id,
                 }
             )
+            if self.engine.kpis is not None:
+                self.engine.kpis.record_join(
+                    self.mote.id,
+                    self.engine.getAsn()
+                )
             self.mote.rpl.start()
         elif self._isJoined:
             self.log(
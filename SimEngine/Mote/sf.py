@@ -7,9 +7,8 @@ import random
 import sys
 from abc import abstractmethod
 
-import netaddr
-
 import SimEngine
+from . import addr
 from . import MoteDefines as d
 from . import sixp
 
@@ -452,9 +451,9 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             autonomous_cells = [
                 cell for cell in cells
                 if (
-                        (d.CELLOPTION_TX in cell.options)
+                        cell.is_tx_on()
                         and
-                        (d.CELLOPTION_SHARED in cell.options)
+                        cell.is_shared_on()
                 )
             ]
             if autonomous_cells:
@@ -1390,7 +1389,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
 
         # assuming v (seed) is 0
         hash_value = 0
-        for word in netaddr.EUI(mac_addr).words:
+        # the 8-bit words of the EUI-64, from the most significant one; each
+        # word is hashed as two bytes, the first one being always 0
+        mac_addr_value = addr.get_mac_addr_value(mac_addr)
+        for shift in range(56, -8, -8):
+            word = (mac_addr_value >> shift) & 0xFF
             for byte in divmod(word, 0x100):
                 left_shifted = (hash_value << LEFT_SHIFT_NUM)
                 right_shifted = (hash_value >> RIGHT_SHIFT_NUM)
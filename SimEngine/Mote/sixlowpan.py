@@ -11,15 +11,14 @@ from builtins import range
 from past.utils import old_div
 from builtins import object
 from abc import abstractmethod
-import copy
 import math
 import random
 
-import netaddr
-
 # Simulator-wide modules
 import SimEngine
+from . import addr
 from . import MoteDefines as d
+from .packet import copy_header
 
 # =========================== defines =========================================
 
@@ -85,7 +84,7 @@ class Sixlowpan(object):
             if (
                     (self.mote.dagRoot)
                     and
-                    ((netaddr.IPAddress(packet[u'net'][u'srcIp']).words[0] & 0xFE80) != 0xFE80)
+                    (not addr.is_ipv6_link_local_addr(packet[u'net'][u'srcIp']))
                 ):
                 sourceRoute = self.mote.rpl.computeSourceRoute(packet[u'net'][u'dstIp'])
                 if sourceRoute==None:
@@ -264,12 +263,12 @@ class Sixlowpan(object):
         if goOn:
             fwdPacket             = {}
             # type
-            fwdPacket[u'type']     = copy.deepcopy(rxPacket[u'type'])
-            # app
+            fwdPacket[u'type']     = rxPacket[u'type']
+            # app; shared with the received packet
             if 'app' in rxPacket:
-                fwdPacket[u'app']  = copy.deepcopy(rxPacket[u'app'])
+                fwdPacket[u'app']  = rxPacket[u'app']
             # net
-            fwdPacket[u'net']      = copy.deepcopy(rxPacket[u'net'])
+            fwdPacket[u'net']      = copy_header(rxPacket[u'net'])
             if 'hop_limit' in fwdPacket[u'net']:
                 assert fwdPacket[u'net'][u'hop_limit'] > 1
                 fwdPacket[u'net'][u'hop_limit'] -= 1
@@ -277,7 +276,7 @@ class Sixlowpan(object):
             # mac
             if fwdPacket[u'type'] == d.PKT_TYPE_FRAG:
                 # fragment already has mac header (FIXME: why?)
-                fwdPacket[u'mac']  = copy.deepcopy(rxPacket[u'mac'])
+                fwdPacket[u'mac']  = copy_header(rxPacket[u'mac'])
             else:
                 # find next hop
                 dstMac = self._find_nexthop_mac_addr(fwdPacket)
@@ -330,16 +329,12 @@ class Sixlowpan(object):
 
     def _find_nexthop_mac_addr(self, packet):
         mac_addr = None
-        src_ip_addr = netaddr.IPAddress(packet[u'net'][u'srcIp'])
-        dst_ip_addr = netaddr.IPAddress(packet[u'net'][u'dstIp'])
+        src_ip_addr = packet[u'net'][u'srcIp']
+        dst_ip_addr = packet[u'net'][u'dstIp']
         # use lower 64 bits and invert U/L bit
-        derived_dst_mac = str(
-            netaddr.EUI(
-                (int(dst_ip_addr) & 0xFFFFFFFFFFFFFFFF) ^ 0x0200000000000000
-            )
-        )
+        derived_dst_mac = addr.ipv6_addr_to_mac_addr(dst_ip_addr)
 
-        if (dst_ip_addr.words[0] & 0xFF00) == 0xFF00:
+        if addr.is_ipv6_multicast_addr(dst_ip_addr):
             # this is an IPv6 multicast address
             mac_addr = d.BROADCAST_ADDRESS
 
@@ -353,10 +348,10 @@ class Sixlowpan(object):
         else:
             if self.mote.rpl.dodagId is None:
                 # upward during secure join process
-                mac_addr = str(self.mote.tsch.join_proxy)
+                mac_addr = addr.get_mac_addr(self.mote.tsch.join_proxy)
             elif (
                     (
-                        ((src_ip_addr.words[0] & 0xFE80) == 0xFE80)
+                        addr.is_ipv6_link_local_addr(src_ip_addr)
                     )
                     or
                     (
@@ -489,12 +484,13 @@ class Fragmentation(object):
                     for key, value in list(packet[u'net'].items()):
                         fragment[u'net'][key] = value
                     if u'sourceRoute' in packet[u'net']:
-                        fragment[u'net'][u'sourceRoute']      = copy.deepcopy(packet[u'net'][u'sourceRoute'])
+                        fragment[u'net'][u'sourceRoute']      = copy_header(packet[u'net'][u'sourceRoute'])
                 elif i == (number_of_fragments - 1):
                     # the last fragment
 
-                    # add original_packet_type and 'app' field
-                    fragment[u'app']                         = copy.deepcopy(packet[u'app'])
+                    # add original_packet_type and 'app' field, which is
+                    # shared with the packet
+                    fragment[u'app']                         = packet[u'app']
                     fragment[u'net'][u'original_packet_type'] = packet[u'type']
 
                 # populate packet_length
@@ -511,7 +507,7 @@ class Fragmentation(object):
                 datagram_offset += fragment[u'net'][u'packet_length']
 
                 # copy the MAC header
-                fragment[u'mac'] = copy.deepcopy(packet[u'mac'])
+                fragment[u'mac'] = copy_header(packet[u'mac'])
 
                 # add the fragment to a returning list
                 returnVal += [fragment]
@@ -576,7 +572,7 @@ class Fragmentation(object):
 
             if fragment[u'net'][u'datagram_offset'] == 0:
                 # store srcIp and dstIp which only the first fragment has
-                self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'] = copy.deepcopy(fragment[u'net'])
+                self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'] = copy_header(fragment[u'net'])
                 del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_size']
                 del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_offset']
                 del self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'][u'datagram_tag']
@@ -596,10 +592,11 @@ class Fragmentation(object):
             # reassembly is not completed
             return
 
-        # construct an original packet
-        packet = copy.copy(fragment)
+        # construct an original packet; the 'net' header kept in the buffer
+        # is not used any more
+        packet = dict(fragment)
         packet[u'type'] = fragment[u'net'][u'original_packet_type']
-        packet[u'net'] = copy.deepcopy(self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net'])
+        packet[u'net'] = self.reassembly_buffers[srcMac][incoming_datagram_tag][u'net']
         packet[u'net'][u'packet_length'] = datagram_size
 
         # reassembly is done, delete buffer
@@ -745,8 +742,8 @@ class FragmentForwarding(Fragmentation):
                 # need to create a new packet in order to distinguish between the
                 # received packet and a forwarding packet.
                 fwdFragment = {
-                    u'type':       copy.deepcopy(fragment[u'type']),
-                    u'net':        copy.deepcopy(fragment[u'net']),
+                    u'type':       fragment[u'type'],
+                    u'net':        copy_header(fragment[u'net']),
                     u'mac': {
                         u'srcMac': self.mote.get_mac_addr(),
                         u'dstMac': self.vrb_table[srcMac][incoming_datagram_tag][u'dstMac']
@@ -756,9 +753,9 @@ class FragmentForwarding(Fragmentation):
                 # forwarding fragment should have the outgoing datagram_tag
                 fwdFragment[u'net'][u'datagram_tag'] = self.vrb_table[srcMac][incoming_datagram_tag][u'outgoing_datagram_tag']
 
-                # copy app field if necessary
+                # share app field if necessary
                 if u'app' in fragment:
-                    fwdFragment[u'app'] = copy.deepcopy(fragment[u'app'])
+                    fwdFragment[u'app'] = fragment[u'app']
 
                 ret = fwdFragment
 
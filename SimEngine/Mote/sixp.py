@@ -11,11 +11,11 @@ from __future__ import absolute_import
 
 from builtins import range
 from builtins import object
-import copy
 import random
 
 # Mote sub-modules
 from . import MoteDefines as d
+from .packet import copy_packet
 
 # Simulator-wide modules
 import SimEngine
@@ -166,13 +166,13 @@ class SixP(object):
             # enqueue
             # the packet is saved for the callback, which is called
             # when the packet fails to be enqueued
-            original_packet = copy.deepcopy(packet)
+            original_packet = copy_packet(packet)
             self._tsch_enqueue(packet)
 
             if packet:
                 # update transaction using the packet that has a valid
                 # seqnum in the MAC header
-                transaction.request = copy.deepcopy(packet)
+                transaction.request = copy_packet(packet)
             elif callback:
                 # the packet could not be queued
                 callback(
@@ -221,7 +221,7 @@ class SixP(object):
         self._tsch_enqueue(packet)
         if transaction:
             # keep the response packet in case of abortion
-            transaction.response = copy.deepcopy(packet)
+            transaction.response = copy_packet(packet)
 
     def send_confirmation(
             self,
@@ -250,7 +250,7 @@ class SixP(object):
         self._tsch_enqueue(packet)
 
         # keep the confirmation packet
-        transaction.confirmation = copy.deepcopy(packet)
+        transaction.confirmation = copy_packet(packet)
 
     def add_transaction(self, transaction):
         if transaction.key in self.transaction_table:
@@ -649,7 +649,7 @@ class SixPTransaction(object):
         self.log              = SimEngine.SimLog.SimLog().log
 
         # local variables
-        self.request          = copy.deepcopy(request)
+        self.request          = copy_packet(request)
         self.response         = None
         self.confirmation     = None
         self.callback         = None
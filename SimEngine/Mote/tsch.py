@@ -10,7 +10,7 @@ from builtins import filter
 from builtins import range
 from builtins import object
 from past.utils import old_div
-import copy
+import bisect
 from itertools import chain
 import random
 
@@ -18,6 +18,7 @@ import netaddr
 
 # Mote sub-modules
 from . import MoteDefines as d
+from .packet import copy_packet
 from SimEngine.Mote.sf import SchedulingFunctionMSF
 
 # Simulator-wide modules
@@ -25,8 +26,30 @@ import SimEngine
 
 # =========================== defines =========================================
 
+# bits of Cell.option_bits, in the order cell options are listed
+CELLOPTION_BITS = [
+    (d.CELLOPTION_TX,     0x01),
+    (d.CELLOPTION_RX,     0x02),
+    (d.CELLOPTION_SHARED, 0x04),
+]
+CELLOPTION_BIT_BY_OPTION = dict(CELLOPTION_BITS)
+CELLOPTION_TX_BIT        = CELLOPTION_BIT_BY_OPTION[d.CELLOPTION_TX]
+CELLOPTION_RX_BIT        = CELLOPTION_BIT_BY_OPTION[d.CELLOPTION_RX]
+CELLOPTION_SHARED_BIT    = CELLOPTION_BIT_BY_OPTION[d.CELLOPTION_SHARED]
+
 # =========================== helpers =========================================
 
+def get_cell_option_bits(cell_options):
+    """Return the bitmask of a list of cell options"""
+    option_bits = 0
+    for option in cell_options:
+        option_bits |= CELLOPTION_BIT_BY_OPTION[option]
+    return option_bits
+
+def get_cell_options(option_bits):
+    """Return the list of cell options of a bitmask"""
+    return [option for option, bit in CELLOPTION_BITS if option_bits & bit]
+
 # =========================== body ============================================
 
 class Tsch(object):
@@ -97,6 +120,16 @@ class Tsch(object):
 
     # getters/setters
 
+    @property
+    def txQueue(self):
+        return self._tx_queue
+
+    @txQueue.setter
+    def txQueue(self, packets):
+        # keep the TX queue indexed by destination MAC address whatever is
+        # assigned to it
+        self._tx_queue = TxQueue(packets)
+
     def getIsSync(self):
         return self.isSync
 
@@ -112,6 +145,11 @@ class Tsch(object):
                     "_mote_id":   self.mote.id,
                 }
             )
+            if self.engine.kpis is not None:
+                self.engine.kpis.record_sync(
+                    self.mote.id,
+                    self.engine.getAsn()
+                )
 
             self.asnLastSync = self.engine.getAsn()
             if self.mote.dagRoot:
@@ -392,8 +430,8 @@ class Tsch(object):
 
         # check that I have cell to transmit on
         if goOn:
-            shared_tx_cells = [cell for cell in self.mote.tsch.get_cells(None) if d.CELLOPTION_TX in cell.options]
-            dedicated_tx_cells = [cell for cell in self.mote.tsch.get_cells(packet[u'mac'][u'dstMac']) if d.CELLOPTION_TX in cell.options]
+            shared_tx_cells = [cell for cell in self.mote.tsch.get_cells(None) if cell.is_tx_on()]
+            dedicated_tx_cells = [cell for cell in self.mote.tsch.get_cells(packet[u'mac'][u'dstMac']) if cell.is_tx_on()]
             if (
                     (len(shared_tx_cells) == 0)
                     and
@@ -462,8 +500,12 @@ class Tsch(object):
         return goOn
 
     def dequeue(self, packet):
-        if packet in self.txQueue:
-            self.txQueue.remove(packet)
+        # a packet equal to the given one has the same destination; look for
+        # it only among the packets to that destination
+        for _packet in self.txQueue.get_packets(packet[u'mac'][u'dstMac']):
+            if (_packet is packet) or (_packet == packet):
+                self.txQueue.discard(_packet)
+                break
         else:
             # do nothing
             pass
@@ -473,10 +515,7 @@ class Tsch(object):
                 and
                 isinstance(self.mote.sf, SchedulingFunctionMSF)
                 and
-                not [
-                    _pkt for _pkt in self.txQueue
-                    if _pkt[u'mac'][u'dstMac'] == packet[u'mac'][u'dstMac']
-                ]
+                self.txQueue.get_num_packets(packet[u'mac'][u'dstMac']) == 0
                 and
                 self.mote.sf.get_autonomous_tx_cell(packet[u'mac'][u'dstMac'])
             ):
@@ -514,26 +553,27 @@ class Tsch(object):
             else:
                 # return the first one in the TX queue, whose destination MAC
                 # is not associated with any of allocated (dedicated) TX cells
+                has_dedicated_tx_cells = {} # indexed by destination MAC
                 for packet in self.txQueue:
-                    packet_to_send = packet # tentatively
-                    for _, slotframe in list(self.slotframes.items()):
-                        dedicated_tx_cells = [cell for cell in slotframe.get_cells_by_mac_addr(packet[u'mac'][u'dstMac']) if d.CELLOPTION_TX in cell.options]
-                        if len(dedicated_tx_cells) > 0:
-                            packet_to_send = None
-                            break # try the next packet in TX queue
-
-                    if packet_to_send is not None:
+                    dst_mac_addr = packet[u'mac'][u'dstMac']
+                    if dst_mac_addr not in has_dedicated_tx_cells:
+                        has_dedicated_tx_cells[dst_mac_addr] = any(
+                            _cell.is_tx_on()
+                            for slotframe in list(self.slotframes.values())
+                            for _cell in slotframe.get_cells_by_mac_addr(
+                                dst_mac_addr
+                            )
+                        )
+                    if not has_dedicated_tx_cells[dst_mac_addr]:
                         # found a good packet to send
+                        packet_to_send = packet
                         break
 
                 # if no suitable packet is found, packet_to_send remains None
         else:
-            for packet in self.txQueue:
-                if packet[u'mac'][u'dstMac'] == dst_mac_addr:
-                    # return the first one having the dstMac
-                    packet_to_send = packet
-                    break
-            # if no packet is found, packet_to_send remains None
+            # return the first one having the dstMac; None if no packet is
+            # found
+            packet_to_send = self.txQueue.get_first_packet(dst_mac_addr)
 
         return packet_to_send
 
@@ -541,29 +581,17 @@ class Tsch(object):
         if dst_mac_addr is None:
             return len(self.txQueue)
         else:
-            return len(
-                [
-                    pkt for pkt in self.txQueue if (
-                        pkt[u'mac'][u'dstMac'] == dst_mac_addr
-                    )
-                ]
-            )
+            return self.txQueue.get_num_packets(dst_mac_addr)
 
     def remove_packets_in_tx_queue(self, type, dstMac=None):
-        i = 0
-        while i < len(self.txQueue):
-            if (
-                    (self.txQueue[i][u'type'] == type)
-                    and
-                    (
-                        (dstMac is None)
-                        or
-                        (self.txQueue[i][u'mac'][u'dstMac'] == dstMac)
-                    )
-                ):
-                del self.txQueue[i]
-            else:
-                i += 1
+        if dstMac is None:
+            self.txQueue[:] = [
+                packet for packet in self.txQueue if packet[u'type'] != type
+            ]
+        else:
+            for packet in self.txQueue.get_packets(dstMac):
+                if packet[u'type'] == type:
+                    self.txQueue.discard(packet)
 
     # interface with radio
 
@@ -578,23 +606,24 @@ class Tsch(object):
         assert self.waitingFor == d.WAITING_FOR_TX
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_TSCH_TXDONE,
-            {
-                u'_mote_id':       self.mote.id,
-                u'channel':        channel,
-                u'slot_offset':    (
-                    active_cell.slot_offset
-                    if active_cell else None
-                ),
-                u'channel_offset': (
-                    active_cell.channel_offset
-                    if active_cell else None
-                ),
-                u'packet':         self.pktToSend,
-                u'isACKed':        isACKed,
-            }
-        )
+        if SimEngine.SimLog.is_enabled(SimEngine.SimLog.LOG_TSCH_TXDONE):
+            self.log(
+                SimEngine.SimLog.LOG_TSCH_TXDONE,
+                {
+                    u'_mote_id':       self.mote.id,
+                    u'channel':        channel,
+                    u'slot_offset':    (
+                        active_cell.slot_offset
+                        if active_cell else None
+                    ),
+                    u'channel_offset': (
+                        active_cell.channel_offset
+                        if active_cell else None
+                    ),
+                    u'packet':         self.pktToSend,
+                    u'isACKed':        isACKed,
+                }
+            )
 
         if self.pktToSend[u'mac'][u'dstMac'] == d.BROADCAST_ADDRESS:
             # I just sent a broadcast packet
@@ -631,7 +660,7 @@ class Tsch(object):
                 # update the backoff exponent
                 self._update_backoff_state(
                     isRetransmission = self._is_retransmission(self.pktToSend),
-                    isSharedLink     = d.CELLOPTION_SHARED in active_cell.options,
+                    isSharedLink     = active_cell.is_shared_on(),
                     isTXSuccess      = isACKed,
                     packet           = self.pktToSend
                 )
@@ -708,8 +737,8 @@ class Tsch(object):
         # copy the received packet to a new packet instance since the passed
         # "packet" should be kept as it is so that Connectivity can use it
         # after this rxDone() process.
-        new_packet = copy.deepcopy(packet)
-        packet = new_packet
+        if packet is not None:
+            packet = copy_packet(packet)
 
         # make sure I'm in the right state
         assert self.waitingFor == d.WAITING_FOR_RX
@@ -741,22 +770,23 @@ class Tsch(object):
             # if I get here, I received a frame at the link layer (either unicast for me, or broadcast)
 
             # log
-            self.log(
-                SimEngine.SimLog.LOG_TSCH_RXDONE,
-                {
-                    u'_mote_id':       self.mote.id,
-                    u'channel':        channel,
-                    u'slot_offset':    (
-                        active_cell.slot_offset
-                        if active_cell else None
-                    ),
-                    u'channel_offset': (
-                        active_cell.channel_offset
-                        if active_cell else None
-                    ),
-                    u'packet':         packet,
-                }
-            )
+            if SimEngine.SimLog.is_enabled(SimEngine.SimLog.LOG_TSCH_RXDONE):
+                self.log(
+                    SimEngine.SimLog.LOG_TSCH_RXDONE,
+                    {
+                        u'_mote_id':       self.mote.id,
+                        u'channel':        channel,
+                        u'slot_offset':    (
+                            active_cell.slot_offset
+                            if active_cell else None
+                        ),
+                        u'channel_offset': (
+                            active_cell.channel_offset
+                            if active_cell else None
+                        ),
+                        u'packet':         packet,
+                    }
+                )
 
             # time correction
             if self.clock.source == packet[u'mac'][u'srcMac']:
@@ -1086,14 +1116,8 @@ class Tsch(object):
                 (
                     # we have more than one packet destined to the same
                     # neighbor
-                    len(
-                        [
-                            packet for packet in self.txQueue
-                            if (
-                                packet[u'mac'][u'dstMac'] ==
-                                pktToSend[u'mac'][u'dstMac']
-                            )
-                        ]
+                    self.txQueue.get_num_packets(
+                        pktToSend[u'mac'][u'dstMac']
                     ) > 1
                 )
                 and
@@ -1462,13 +1486,9 @@ class Tsch(object):
         assert self.waitingFor == None
         assert self.pktToSend == None
 
-        for packet in self.txQueue:
-            if (
-                    packet[u'mac'][u'dstMac'] ==
-                    self.args_for_next_pending_bit_task[u'dstMac']
-                ):
-                self.pktToSend = packet
-                break
+        self.pktToSend = self.txQueue.get_first_packet(
+            self.args_for_next_pending_bit_task[u'dstMac']
+        )
 
         if self.pktToSend is None:
             # done
@@ -1602,6 +1622,164 @@ class Clock(object):
         return random.uniform(-1 * max_drift * 2, max_drift * 2)
 
 
+class TxQueue(list):
+    """TX queue of Tsch
+
+    This is a list of packets in transmission order, which additionally
+    keeps the packets of each destination MAC address in a bucket. The
+    first packet and the number of packets for a neighbor are available
+    without scanning the whole queue.
+    """
+
+    def __init__(self, packets=()):
+        super(TxQueue, self).__init__(packets)
+        self._rebuild_buckets()
+
+    # list interface; every modification keeps the buckets in sync
+
+    def append(self, packet):
+        super(TxQueue, self).append(packet)
+        self._get_bucket(packet).append(packet)
+
+    def insert(self, index, packet):
+        # position of the packet in the queue, as list.insert() takes it
+        if index < 0:
+            index = max(index + len(self), 0)
+        else:
+            index = min(index, len(self))
+        super(TxQueue, self).insert(index, packet)
+
+        # position of the packet in its bucket; only the packets on the
+        # shorter side of the queue are looked at
+        dst_mac_addr = self._get_dst_mac_addr(packet)
+        bucket = self._get_bucket(packet)
+        if index <= len(self) // 2:
+            bucket_index = self._count_packets(dst_mac_addr, 0, index)
+        else:
+            bucket_index = len(bucket) - self._count_packets(
+                dst_mac_addr,
+                index + 1,
+                len(self)
+            )
+        bucket.insert(bucket_index, packet)
+
+    def extend(self, packets):
+        for packet in packets:
+            self.append(packet)
+
+    def __iadd__(self, packets):
+        self.extend(packets)
+        return self
+
+    def pop(self, index=-1):
+        packet = super(TxQueue, self).pop(index)
+        self._remove_from_bucket(packet)
+        return packet
+
+    def remove(self, packet):
+        del self[self.index(packet)]
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            super(TxQueue, self).__delitem__(index)
+            self._rebuild_buckets()
+        else:
+            packet = self[index]
+            super(TxQueue, self).__delitem__(index)
+            self._remove_from_bucket(packet)
+
+    def __setitem__(self, index, value):
+        super(TxQueue, self).__setitem__(index, value)
+        self._rebuild_buckets()
+
+    # Python 2 calls these instead of __delitem__() and __setitem__() for
+    # slices such as [:]
+    def __delslice__(self, i, j):
+        self.__delitem__(slice(i, j))
+
+    def __setslice__(self, i, j, packets):
+        self.__setitem__(slice(i, j), packets)
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, *args, **kwargs):
+        super(TxQueue, self).sort(*args, **kwargs)
+        self._rebuild_buckets()
+
+    def reverse(self):
+        super(TxQueue, self).reverse()
+        self._rebuild_buckets()
+
+    # per-destination access
+
+    def get_first_packet(self, dst_mac_addr):
+        bucket = self._buckets.get(dst_mac_addr)
+        if bucket:
+            return bucket[0]
+        else:
+            return None
+
+    def get_num_packets(self, dst_mac_addr):
+        bucket = self._buckets.get(dst_mac_addr)
+        if bucket:
+            return len(bucket)
+        else:
+            return 0
+
+    def get_packets(self, dst_mac_addr):
+        return list(self._buckets.get(dst_mac_addr, []))
+
+    def get_dst_mac_addrs(self):
+        return list(self._buckets.keys())
+
+    def discard(self, packet):
+        # remove the very packet object, not one which is equal to it
+        for index, _packet in enumerate(self):
+            if _packet is packet:
+                del self[index]
+                break
+
+    # private
+
+    @staticmethod
+    def _get_dst_mac_addr(packet):
+        try:
+            return packet[u'mac'][u'dstMac']
+        except KeyError:
+            return None
+
+    def _get_bucket(self, packet):
+        dst_mac_addr = self._get_dst_mac_addr(packet)
+        if dst_mac_addr not in self._buckets:
+            self._buckets[dst_mac_addr] = []
+        return self._buckets[dst_mac_addr]
+
+    def _remove_from_bucket(self, packet):
+        dst_mac_addr = self._get_dst_mac_addr(packet)
+        bucket = self._buckets[dst_mac_addr]
+        for index, _packet in enumerate(bucket):
+            if _packet is packet:
+                del bucket[index]
+                break
+        if not bucket:
+            del self._buckets[dst_mac_addr]
+
+    def _count_packets(self, dst_mac_addr, start, stop):
+        # number of packets to dst_mac_addr in self[start:stop]
+        return len(
+            [
+                index for index in range(start, stop)
+                if self._get_dst_mac_addr(self[index]) == dst_mac_addr
+            ]
+        )
+
+    def _rebuild_buckets(self):
+        self._buckets = {}
+        for packet in self:
+            self._get_bucket(packet).append(packet)
+
+
 class SlotFrame(object):
     def __init__(self, mote_id, slotframe_handle, num_slots):
         self.log = SimEngine.SimLog.SimLog().log
@@ -1610,6 +1788,9 @@ class SlotFrame(object):
         self.slotframe_handle = slotframe_handle
         self.length = num_slots
         self.slots  = {}
+        # slot offsets having cells, kept sorted for quick lookup of the next
+        # active slot
+        self.busy_slot_offsets = []
         # index by neighbor_mac_addr for quick access
         self.cells  = {}
 
@@ -1623,6 +1804,7 @@ class SlotFrame(object):
         assert cell.slot_offset < self.length
         if cell.slot_offset not in self.slots:
             self.slots[cell.slot_offset] = [cell]
+            bisect.insort(self.busy_slot_offsets, cell.slot_offset)
         else:
             self.slots[cell.slot_offset] += [cell]
 
@@ -1655,6 +1837,9 @@ class SlotFrame(object):
             del self.cells[cell.mac_addr]
         if len(self.slots[cell.slot_offset]) == 0:
             del self.slots[cell.slot_offset]
+            del self.busy_slot_offsets[
+                bisect.bisect_left(self.busy_slot_offsets, cell.slot_offset)
+            ]
 
         # log
         self.log(
@@ -1692,22 +1877,37 @@ class SlotFrame(object):
         return busy_slots
 
     def get_num_slots_to_next_active_cell(self, asn):
-        diff = 1
-        while diff <= self.length:
-            slot_offset = (asn + diff) % self.length
-            if slot_offset in self.slots:
-                return diff
-            diff += 1
-        return None
+        if not self.busy_slot_offsets:
+            return None
+
+        current_slot_offset = asn % self.length
+        index = bisect.bisect_right(
+            self.busy_slot_offsets,
+            current_slot_offset
+        )
+        if index < len(self.busy_slot_offsets):
+            return self.busy_slot_offsets[index] - current_slot_offset
+        else:
+            # wrap around; the next active slot is in the next slotframe
+            # iteration, which could be the current slot offset
+            return (
+                self.busy_slot_offsets[0] + self.length - current_slot_offset
+            )
 
     def get_available_slots(self):
         """
         Get the list of slot offsets that are not being used (no cell attached)
-        :return: a list of slot offsets (int)
+        :return: a list of slot offsets (int), in ascending order
         :rtype: list
         """
-        all_slots = set(range(self.length))
-        return list(all_slots - set(self.get_busy_slots()))
+        # collect the gaps between busy slot offsets
+        available_slots = []
+        start = 0
+        for slot_offset in self.busy_slot_offsets:
+            available_slots.extend(range(start, slot_offset))
+            start = slot_offset + 1
+        available_slots.extend(range(start, self.length))
+        return available_slots
 
     def get_cells_filtered(self, mac_addr="", cell_options=None):
         """
@@ -1728,7 +1928,8 @@ class SlotFrame(object):
         if cell_options is None:
             condition = lambda c: True
         else:
-            condition = lambda c: sorted(c.options) == sorted(cell_options)
+            option_bits = get_cell_option_bits(cell_options)
+            condition = lambda c: c.option_bits == option_bits
 
         # apply filter
         return list(filter(condition, target_cells))
@@ -1737,18 +1938,25 @@ class SlotFrame(object):
         # delete extra cells and slots if reducing slotframe length
         if new_length < self.length:
             # delete cells
-
-            slot_offset = new_length
-            while slot_offset < self.length:
-                if slot_offset in self.slots:
-                    for cell in self.slots[slot_offset]:
-                        self.delete(cell)
-                slot_offset += 1
+            index = bisect.bisect_left(self.busy_slot_offsets, new_length)
+            for slot_offset in self.busy_slot_offsets[index:]:
+                for cell in list(self.slots[slot_offset]):
+                    self.delete(cell)
 
         # apply the new length
         self.length = new_length
 
 class Cell(object):
+
+    # a schedule may have thousands of cells
+    __slots__ = [
+        '_key',
+        'slotframe',
+        'num_tx',
+        'num_tx_ack',
+        'num_rx',
+    ]
+
     def __init__(
             self,
             slot_offset,
@@ -1764,11 +1972,15 @@ class Cell(object):
         assert slot_offset    < 0x10000
         assert channel_offset < 0x10000
 
-        self.slot_offset    = slot_offset
-        self.channel_offset = channel_offset
-        self.options        = options
-        self.mac_addr       = mac_addr
-        self.link_type      = link_type
+        # the fields identifying the cell are read-only, since the cell may
+        # be in a set or a dict
+        self._key = (
+            slot_offset,
+            channel_offset,
+            mac_addr,
+            get_cell_option_bits(options),
+            link_type
+        )
 
         # back reference to slotframe; this will be set in SlotFrame.add()
         self.slotframe = None
@@ -1793,7 +2005,51 @@ class Cell(object):
         )
 
     def __eq__(self, other):
-        return str(self) == str(other)
+        if isinstance(other, Cell):
+            return self._key == other._key
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        ret = self.__eq__(other)
+        if ret is NotImplemented:
+            return ret
+        else:
+            return not ret
+
+    def __hash__(self):
+        return hash(self._key)
+
+    @property
+    def key(self):
+        # a cell is identified by what its representation shows; the
+        # slotframe is not part of it since it's set only when the cell is
+        # added to one
+        return self._key
+
+    @property
+    def slot_offset(self):
+        return self._key[0]
+
+    @property
+    def channel_offset(self):
+        return self._key[1]
+
+    @property
+    def mac_addr(self):
+        return self._key[2]
+
+    @property
+    def option_bits(self):
+        return self._key[3]
+
+    @property
+    def link_type(self):
+        return self._key[4]
+
+    @property
+    def options(self):
+        return get_cell_options(self._key[3])
 
     def increment_num_tx(self):
         self.num_tx += 1
@@ -1814,10 +2070,10 @@ class Cell(object):
         self.num_rx += 1
 
     def is_tx_on(self):
-        return d.CELLOPTION_TX in self.options
+        return bool(self._key[3] & CELLOPTION_TX_BIT)
 
     def is_rx_on(self):
-        return d.CELLOPTION_RX in self.options
+        return bool(self._key[3] & CELLOPTION_RX_BIT)
 
     def is_shared_on(self):
-        return d.CELLOPTION_SHARED in self.options
+        return bool(self._key[3] & CELLOPTION_SHARED_BIT)
@@ -13,6 +13,7 @@ from builtins import range
 from past.utils import old_div
 from collections import OrderedDict
 import hashlib
+import heapq
 import platform
 import random
 import sys
@@ -22,8 +23,10 @@ import traceback
 import json
 
 from . import Mote
+from .Mote import addr
 from . import SimSettings
 from . import SimLog
+from . import SimKpi
 from . import Connectivity
 from . import SimConfig
 
@@ -64,10 +67,13 @@ class DiscreteEventEngine(threading.Thread):
             self.simPaused                      = False
             self.goOn                           = True
             self.asn                            = 0
+            self.intraSlotOrder                 = None
             self.exc                            = None
             self.events                         = {}
+            self.eventAsns                      = [] # heap of ASNs in self.events
             self.uniqueTagSchedule              = {}
             self.random_seed                    = None
+            self.mote_by_mac_addr               = {} # indexed by str address
             self._init_additional_local_variables()
 
             # initialize parent class
@@ -118,25 +124,38 @@ class DiscreteEventEngine(threading.Thread):
                     if not self.events:
                         break
 
-                    # update the current ASN
-                    self.asn += 1
-
-                    if self.asn not in self.events:
+                    # jump straight to the next ASN having events; an ASN
+                    # whose events have all been removed stays in the heap
+                    # and is skipped here
+                    asn = heapq.heappop(self.eventAsns)
+                    if asn not in self.events:
                         continue
 
-                    intraSlotOrderKeys = list(self.events[self.asn].keys())
-                    intraSlotOrderKeys.sort()
+                    # update the current ASN; an event could be scheduled
+                    # with an integral float such as 100.0, while the ASN
+                    # stays an int
+                    self.asn = int(asn)
+
+                    # no event of this slot has been executed yet
+                    self.intraSlotOrder = None
+
+                    cbs = {} # indexed by intraSlotOrder
+                    self._collect_events(asn, cbs)
 
-                    cbs = []
-                    for intraSlotOrder in intraSlotOrderKeys:
-                        for uniqueTag, cb in list(self.events[self.asn][intraSlotOrder].items()):
-                            cbs += [cb]
-                            del self.uniqueTagSchedule[uniqueTag]
-                    del self.events[self.asn]
+                # call the callbacks (outside the dataLock), intraSlotOrder by
+                # intraSlotOrder; events which the callbacks schedule later in
+                # the current slot are collected after each intraSlotOrder
+                while cbs:
+                    self.intraSlotOrder = min(cbs)
+                    for cb in cbs.pop(self.intraSlotOrder):
+                        cb()
 
-                # call the callbacks (outside the dataLock)
-                for cb in cbs:
-                    cb()
+                    with self.dataLock:
+                        if asn in self.events:
+                            self._collect_events(asn, cbs)
+
+                # the slot is over; no more event can be scheduled in it
+                self.intraSlotOrder = None
 
         except Exception as e:
             # thread crashed
@@ -178,7 +197,8 @@ class DiscreteEventEngine(threading.Thread):
 
             sys.stderr.write(output)
 
-            # flush all the buffered log data
+            # flush all the buffered log data, including the logs queued
+            # for the writer thread, so that the log file is complete
             SimLog.SimLog().flush()
 
         else:
@@ -210,10 +230,17 @@ class DiscreteEventEngine(threading.Thread):
         return self.asn
 
     def get_mote_by_mac_addr(self, mac_addr):
-        for mote in self.motes:
-            if mote.is_my_mac_addr(mac_addr):
-                return mote
-        return None
+        mote = self.mote_by_mac_addr.get(mac_addr)
+        if mote is None:
+            # mac_addr may be given in another form than the keys, which are
+            # strings in the canonical format
+            mote = self.mote_by_mac_addr.get(addr.get_mac_addr(mac_addr))
+        return mote
+
+    # === address index, maintained by Mote
+
+    def register_mac_addr(self, mote, mac_addr):
+        self.mote_by_mac_addr[mac_addr] = mote
 
     #=== scheduling
 
@@ -221,10 +248,24 @@ class DiscreteEventEngine(threading.Thread):
         """
         Schedule an event at a particular ASN in the future.
         Also removed all future events with the same uniqueTag.
+
+        An event can be scheduled at the current ASN as long as its
+        intraSlotOrder comes after the one being executed. Outside the
+        execution of a slot, the event has to be in a later ASN.
         """
 
         # make sure we are scheduling in the future
-        assert asn > self.asn
+        assert (
+            (asn > self.asn)
+            or
+            (
+                (asn == self.asn)
+                and
+                (self.intraSlotOrder is not None)
+                and
+                (intraSlotOrder > self.intraSlotOrder)
+            )
+        )
 
         # remove all events with same uniqueTag (the event will be rescheduled)
         self.removeFutureEvent(uniqueTag)
@@ -235,6 +276,10 @@ class DiscreteEventEngine(threading.Thread):
                 self.events[asn] = {
                     intraSlotOrder: OrderedDict([(uniqueTag, cb)])
                 }
+                if asn > self.asn:
+                    # events at the current ASN are collected by run()
+                    # without the heap
+                    heapq.heappush(self.eventAsns, asn)
 
             elif intraSlotOrder not in self.events[asn]:
                 self.events[asn][intraSlotOrder] = (
@@ -314,6 +359,20 @@ class DiscreteEventEngine(threading.Thread):
 
     # ======================== private ========================================
 
+    def _collect_events(self, asn, cbs):
+        """
+        Move the callbacks scheduled at asn into cbs, a dict of lists
+        indexed by intraSlotOrder. The events are no longer future events
+        once collected.
+        """
+        for intraSlotOrder, events in list(self.events[asn].items()):
+            if intraSlotOrder not in cbs:
+                cbs[intraSlotOrder] = []
+            for uniqueTag, cb in list(events.items()):
+                cbs[intraSlotOrder] += [cb]
+                del self.uniqueTagSchedule[uniqueTag]
+        del self.events[asn]
+
     def _actionPauseSim(self):
         assert self.simPaused==False
         self.simPaused = True
@@ -395,6 +454,17 @@ class SimEngine(DiscreteEventEngine):
         else:
             eui64_table = [None] * self.settings.exec_numMotes
 
+        # KPIs computed while the simulation runs, the motes feeding the
+        # collector; they are logged when the simulation ends
+        if self.settings.log_kpis:
+            self.kpis = SimKpi.KpiCollector(
+                slot_duration = self.settings.tsch_slotDuration
+            )
+            for mote_id in range(self.settings.exec_numMotes):
+                self.kpis.add_mote(mote_id)
+        else:
+            self.kpis = None
+
         self.motes = [
             Mote.Mote.Mote(id, eui64)
             for id, eui64 in zip(
@@ -477,3 +547,10 @@ class SimEngine(DiscreteEventEngine):
                 "state": "stopped"
             }
         )
+
+        # log the KPIs of the run
+        if self.kpis is not None:
+            self.log(
+                SimLog.LOG_SIMULATOR_KPIS,
+                self.kpis.get_kpis_log_content()
+            )
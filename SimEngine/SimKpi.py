@@ -0,0 +1,418 @@
+"""
+\brief Key performance indicators (KPIs) of a run
+
+KpiCollector gathers the statistics of a run, either from its logs, as
+bin/compute_kpis.py does, or from the motes while the run goes on, and
+computes the KPIs of the run out of them.
+"""
+from __future__ import absolute_import
+from __future__ import division
+
+# ========================== imports =========================================
+
+from builtins import object
+import copy
+
+import netaddr
+import numpy as np
+
+from . import SimLog
+from .Mote import MoteDefines as d
+
+# =========================== defines =========================================
+
+DAGROOT_ID = 0  # we assume first mote is DAGRoot
+DAGROOT_IP = u'fd00::1:0'
+BATTERY_AA_CAPACITY_mAh = 2821.5
+
+GLOBAL_STATS = u'global-stats'
+
+# types of the logs KpiCollector.add_log() takes; it only needs the
+# '_mote_id' of the other logs
+LOG_TYPES = [
+    SimLog.LOG_TSCH_SYNCED[u'type'],
+    SimLog.LOG_SECJOIN_JOINED[u'type'],
+    SimLog.LOG_APP_TX[u'type'],
+    SimLog.LOG_APP_RX[u'type'],
+    SimLog.LOG_RADIO_STATS[u'type']
+]
+
+# =========================== helpers =========================================
+
+def mean(numbers):
+    return float(sum(numbers)) / max(len(numbers), 1)
+
+def init_mote():
+    return {
+        'upstream_num_tx': 0,
+        'upstream_num_rx': 0,
+        'upstream_num_lost': 0,
+        'join_asn': None,
+        'join_time_s': None,
+        'sync_asn': None,
+        'sync_time_s': None,
+        'charge_asn': None,
+        'upstream_pkts': {},
+        'latencies': [],
+        'hops': [],
+        'charge': None,
+        'lifetime_AA_years': None,
+        'avg_current_uA': None,
+    }
+
+# =========================== body ============================================
+
+class KpiCollector(object):
+    """
+    Collects the statistics of a run and computes its KPIs
+
+    The record_*() methods take what the app.tx, app.rx, tsch.synced,
+    secjoin.joined and radio.stats logs have; add_log() takes the logs
+    themselves.
+    """
+
+    def __init__(self, slot_duration):
+
+        # store params
+        self.slot_duration = slot_duration
+
+        # local variables
+        self.motestats     = {} # indexed by mote_id
+
+    def add_mote(self, mote_id):
+        if (mote_id != DAGROOT_ID) and (mote_id not in self.motestats):
+            self.motestats[mote_id] = init_mote()
+
+    def add_log(self, logline):
+        if u'_mote_id' in logline:
+            self.add_mote(logline[u'_mote_id'])
+
+        log_type = logline[u'_type']
+        if   log_type == SimLog.LOG_TSCH_SYNCED[u'type']:
+            self.record_sync(logline[u'_mote_id'], logline[u'_asn'])
+        elif log_type == SimLog.LOG_SECJOIN_JOINED[u'type']:
+            self.record_join(logline[u'_mote_id'], logline[u'_asn'])
+        elif log_type == SimLog.LOG_APP_TX[u'type']:
+            self.record_app_tx(
+                mote_id = logline[u'_mote_id'],
+                packet  = logline[u'packet'],
+                asn     = logline[u'_asn']
+            )
+        elif log_type == SimLog.LOG_APP_RX[u'type']:
+            self.record_app_rx(
+                packet = logline[u'packet'],
+                asn    = logline[u'_asn']
+            )
+        elif log_type == SimLog.LOG_RADIO_STATS[u'type']:
+            self.record_radio_stats(
+                mote_id = logline[u'_mote_id'],
+                stats   = logline,
+                asn     = logline[u'_asn']
+            )
+
+    def record_sync(self, mote_id, asn):
+        # only log non-dagRoot sync times
+        if mote_id == DAGROOT_ID:
+            return
+
+        self.motestats[mote_id]['sync_asn']    = asn
+        self.motestats[mote_id]['sync_time_s'] = asn*self.slot_duration
+
+    def record_join(self, mote_id, asn):
+        # only log non-dagRoot join times
+        if mote_id == DAGROOT_ID:
+            return
+
+        assert self.motestats[mote_id]['sync_asn'] is not None
+        self.motestats[mote_id]['join_asn']    = asn
+        self.motestats[mote_id]['join_time_s'] = asn*self.slot_duration
+
+    def record_app_tx(self, mote_id, packet, asn):
+        # shorthands
+        dstIp      = packet[u'net'][u'dstIp']
+        appcounter = packet[u'app'][u'appcounter']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        # populate
+        upstream_pkts = self.motestats[mote_id]['upstream_pkts']
+        assert self.motestats[mote_id]['join_asn'] is not None
+        if appcounter not in upstream_pkts:
+            upstream_pkts[appcounter] = {
+                'hops': 0,
+            }
+
+        upstream_pkts[appcounter]['tx_asn'] = asn
+
+    def record_app_rx(self, packet, asn):
+        # shorthands
+        dstIp      = packet[u'net'][u'dstIp']
+        hop_limit  = packet[u'net'][u'hop_limit']
+        appcounter = packet[u'app'][u'appcounter']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        mote_id = netaddr.IPAddress(packet[u'net'][u'srcIp']).words[-1]
+        pktstats = self.motestats[mote_id]['upstream_pkts'][appcounter]
+        pktstats['hops']   = d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1
+        pktstats['rx_asn'] = asn
+
+    def record_radio_stats(self, mote_id, stats, asn):
+        # only log non-dagRoot charge
+        if mote_id == DAGROOT_ID:
+            return
+
+        charge =  stats[u'idle_listen'] * d.CHARGE_IdleListen_uC
+        charge += stats[u'tx_data_rx_ack'] * d.CHARGE_TxDataRxAck_uC
+        charge += stats[u'rx_data_tx_ack'] * d.CHARGE_RxDataTxAck_uC
+        charge += stats[u'tx_data'] * d.CHARGE_TxData_uC
+        charge += stats[u'rx_data'] * d.CHARGE_RxData_uC
+        charge += stats[u'sleep'] * d.CHARGE_Sleep_uC
+
+        self.motestats[mote_id]['charge_asn'] = asn
+        self.motestats[mote_id]['charge']     = charge
+
+    def get_kpis(self):
+        """return the KPIs, indexed by mote_id and GLOBAL_STATS"""
+        # motes are taken in the order of their IDs, whatever order the
+        # logs come in, so that sums of floats are always the same
+        kpis = copy.deepcopy(dict(sorted(self.motestats.items())))
+        slot_duration = self.slot_duration
+
+        # === compute advanced motestats
+
+        for (mote_id, motestats) in list(kpis.items()):
+            if (motestats['sync_asn'] is not None) and (motestats['charge_asn'] is not None):
+                # avg_current, lifetime_AA
+                if (
+                        (motestats['charge'] <= 0)
+                        or
+                        (motestats['charge_asn'] <= motestats['sync_asn'])
+                    ):
+                    motestats['lifetime_AA_years'] = 'N/A'
+                else:
+                    motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_asn']-motestats['sync_asn']) * slot_duration)
+                    assert motestats['avg_current_uA'] > 0
+                    motestats['lifetime_AA_years'] = (BATTERY_AA_CAPACITY_mAh*1000/float(motestats['avg_current_uA']))/(24.0*365)
+            if motestats['join_asn'] is not None:
+                # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
+                for (appcounter, pktstats) in list(motestats['upstream_pkts'].items()):
+                    motestats['upstream_num_tx']      += 1
+                    if 'rx_asn' in pktstats:
+                        motestats['upstream_num_rx']  += 1
+                        thislatency = (pktstats['rx_asn']-pktstats['tx_asn'])*slot_duration
+                        motestats['latencies']  += [thislatency]
+                        motestats['hops']       += [pktstats['hops']]
+                    else:
+                        motestats['upstream_num_lost'] += 1
+                if (motestats['upstream_num_rx'] > 0) and (motestats['upstream_num_tx'] > 0):
+                    motestats['latency_min_s'] = min(motestats['latencies'])
+                    motestats['latency_avg_s'] = sum(motestats['latencies'])/float(len(motestats['latencies']))
+                    motestats['latency_max_s'] = max(motestats['latencies'])
+                    motestats['upstream_reliability'] = motestats['upstream_num_rx']/float(motestats['upstream_num_tx'])
+                    motestats['avg_hops'] = sum(motestats['hops'])/float(len(motestats['hops']))
+
+        # === network stats
+
+        #-- define stats
+
+        app_packets_sent = 0
+        app_packets_received = 0
+        app_packets_lost = 0
+        joining_times = []
+        us_latencies = []
+        current_consumed = []
+        lifetimes = []
+
+        #-- compute stats
+
+        for (mote_id, motestats) in list(kpis.items()):
+
+            # counters
+
+            app_packets_sent += motestats['upstream_num_tx']
+            app_packets_received += motestats['upstream_num_rx']
+            app_packets_lost += motestats['upstream_num_lost']
+
+            # joining times
+
+            if motestats['join_asn'] is not None:
+                joining_times.append(motestats['join_asn'])
+
+            # latency
+
+            us_latencies += motestats['latencies']
+
+            # current consumed
+
+            current_consumed.append(motestats['charge'])
+            # the lifetime of a mote is 'N/A' when it cannot be computed;
+            # such a mote doesn't count for the network lifetime
+            if motestats['lifetime_AA_years'] not in [None, 'N/A']:
+                lifetimes.append(motestats['lifetime_AA_years'])
+            current_consumed = [
+                value for value in current_consumed if value is not None
+            ]
+
+        #-- save stats
+
+        kpis[GLOBAL_STATS] = {
+            'e2e-upstream-delivery': [
+                {
+                    'name': 'E2E Upstream Delivery Ratio',
+                    'unit': '%',
+                    'value': (
+                        1 - app_packets_lost / app_packets_sent
+                        if app_packets_sent > 0 else 'N/A'
+                    )
+                },
+                {
+                    'name': 'E2E Upstream Loss Rate',
+                    'unit': '%',
+                    'value': (
+                        app_packets_lost / app_packets_sent
+                        if app_packets_sent > 0 else 'N/A'
+                    )
+                }
+            ],
+            'e2e-upstream-latency': [
+                {
+                    'name': 'E2E Upstream Latency',
+                    'unit': 's',
+                    'mean': (
+                        mean(us_latencies)
+                        if us_latencies else 'N/A'
+                    ),
+                    'min': (
+                        min(us_latencies)
+                        if us_latencies else 'N/A'
+                    ),
+                    'max': (
+                        max(us_latencies)
+                        if us_latencies else 'N/A'
+                    ),
+                    '99%': (
+                        np.percentile(us_latencies, 99)
+                        if us_latencies else 'N/A'
+                    )
+                },
+                {
+                    'name': 'E2E Upstream Latency',
+                    'unit': 'slots',
+                    'mean': (
+                        mean(us_latencies) / slot_duration
+                        if us_latencies else 'N/A'
+                    ),
+                    'min': (
+                        min(us_latencies) / slot_duration
+                        if us_latencies else 'N/A'
+                    ),
+                    'max': (
+                        max(us_latencies) / slot_duration
+                        if us_latencies else 'N/A'
+                    ),
+                    '99%': (
+                        np.percentile(us_latencies, 99) / slot_duration
+                        if us_latencies else 'N/A'
+                    )
+                }
+            ],
+            'current-consumed': [
+                {
+                    'name': 'Current Consumed',
+                    'unit': 'mA',
+                    'mean': (
+                        mean(current_consumed)
+                        if current_consumed else 'N/A'
+                    ),
+                    '99%': (
+                        np.percentile(current_consumed, 99)
+                        if current_consumed else 'N/A'
+                    )
+                }
+            ],
+            'network_lifetime':[
+                {
+                    'name': 'Network Lifetime',
+                    'unit': 'years',
+                    'min': (
+                        min(lifetimes)
+                        if lifetimes else 'N/A'
+                    ),
+                    'total_capacity_mAh': BATTERY_AA_CAPACITY_mAh,
+                }
+            ],
+            'joining-time': [
+                {
+                    'name': 'Joining Time',
+                    'unit': 'slots',
+                    'min': (
+                        min(joining_times)
+                        if joining_times else 'N/A'
+                    ),
+                    'max': (
+                        max(joining_times)
+                        if joining_times else 'N/A'
+                    ),
+                    'mean': (
+                        mean(joining_times)
+                        if joining_times else 'N/A'
+                    ),
+                    '99%': (
+                        np.percentile(joining_times, 99)
+                        if joining_times else 'N/A'
+                    )
+                }
+            ],
+            'app-packets-sent': [
+                {
+                    'name': 'Number of application packets sent',
+                    'total': app_packets_sent
+                }
+            ],
+            'app_packets_received': [
+                {
+                    'name': 'Number of application packets received',
+                    'total': app_packets_received
+                }
+            ],
+            'app_packets_lost': [
+                {
+                    'name': 'Number of application packets lost',
+                    'total': app_packets_lost
+                }
+            ]
+        }
+
+        # === remove unnecessary stats
+
+        for (mote_id, motestats) in list(kpis.items()):
+            if 'sync_asn' in motestats:
+                del motestats['sync_asn']
+            if 'charge_asn' in motestats:
+                del motestats['charge_asn']
+                del motestats['charge']
+            if 'join_asn' in motestats:
+                del motestats['upstream_pkts']
+                del motestats['hops']
+                del motestats['join_asn']
+
+        return kpis
+
+    def get_kpis_log_content(self):
+        """return the content of a LOG_SIMULATOR_KPIS log"""
+        kpis = self.get_kpis()
+        return {
+            u'kpis': dict((str(key), value) for (key, value) in kpis.items())
+        }
+
+def kpis_from_log(logline):
+    """return the KPIs of a LOG_SIMULATOR_KPIS log, as get_kpis() does"""
+    return dict(
+        (key if key == GLOBAL_STATS else int(key), value)
+        for (key, value) in logline[u'kpis'].items()
+    )
@@ -19,18 +19,59 @@ from builtins import str
 from builtins import object
 import copy
 import json
+import threading
 import traceback
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
 
 from . import SimSettings
+from . import SimLogFormat
+
+# =========================== log types =======================================
+
+# all the log types, indexed by type name
+LOG_TYPES = {}
+
+class LogType(dict):
+    """
+    Definition of a log type, compiled
+
+    It is the dict of the definition, {u'type': ..., u'keys': [...]}, with
+    attributes computed once for all the logs of the type: 'enabled' tells
+    whether logs of the type are written under the current log filters,
+    'key_set' is the set of the keys.
+    """
+
+    def __init__(self, definition):
+        super(LogType, self).__init__(definition)
+        assert self[u'type'] not in LOG_TYPES
+        self.enabled = False
+        self.key_set = frozenset(self[u'keys'])
+        LOG_TYPES[self[u'type']] = self
+
+def is_enabled(simlog):
+    """return True if logs of the type are written
+
+    Use this to skip building the content of a log when it's costly:
+
+        if SimLog.is_enabled(SimLog.LOG_TSCH_TXDONE):
+            self.log(SimLog.LOG_TSCH_TXDONE, {...})
+    """
+    return simlog.enabled
 
 # =========================== defines =========================================
 
 # === simulator
-LOG_SIMULATOR_STATE               = {u'type': u'simulator.state',           u'keys': [u'state', u'name']}
-LOG_SIMULATOR_RANDOM_SEED         = {u'type': u'simulator.random_seed',     u'keys': [u'value']}
+LOG_SIMULATOR_STATE               = LogType({u'type': u'simulator.state',           u'keys': [u'state', u'name']})
+LOG_SIMULATOR_RANDOM_SEED         = LogType({u'type': u'simulator.random_seed',     u'keys': [u'value']})
+LOG_SIMULATOR_KPIS                = LogType({u'type': u'simulator.kpis',            u'keys': [u'kpis']})
+LOG_SIMULATOR_LOGS_DROPPED        = LogType({u'type': u'simulator.logs_dropped',    u'keys': [u'num_logs']})
 
 # === packet drops
-LOG_PACKET_DROPPED                = {u'type': u'packet_dropped',            u'keys': [u'_mote_id',u'packet',u'reason']}
+LOG_PACKET_DROPPED                = LogType({u'type': u'packet_dropped',            u'keys': [u'_mote_id',u'packet',u'reason']})
 DROPREASON_NO_ROUTE               = u'no_route'
 DROPREASON_TXQUEUE_FULL           = u'txqueue_full'
 DROPREASON_NO_TX_CELLS            = u'no_tx_cells'
@@ -41,69 +82,69 @@ DROPREASON_TIME_EXCEEDED          = u'time_exceeded'
 DROPREASON_RANK_ERROR             = u'rank_error'
 
 # === app
-LOG_APP_TX                        = {u'type': u'app.tx',                    u'keys': [u'_mote_id',u'packet']}
-LOG_APP_RX                        = {u'type': u'app.rx',                    u'keys': [u'_mote_id',u'packet']}
+LOG_APP_TX                        = LogType({u'type': u'app.tx',                    u'keys': [u'_mote_id',u'packet']})
+LOG_APP_RX                        = LogType({u'type': u'app.rx',                    u'keys': [u'_mote_id',u'packet']})
 
 # === secjoin
-LOG_SECJOIN_TX                    = {u'type': u'secjoin.tx',                u'keys': [u'_mote_id']}
-LOG_SECJOIN_RX                    = {u'type': u'secjoin.rx',                u'keys': [u'_mote_id']}
-LOG_SECJOIN_JOINED                = {u'type': u'secjoin.joined',            u'keys': [u'_mote_id']}
-LOG_SECJOIN_UNJOINED              = {u'type': u'secjoin.unjoined',          u'keys': [u'_mote_id']}
-LOG_SECJOIN_FAILED                = {u'type': u'secjoin.failed',            u'keys': [u'_mote_id']}
+LOG_SECJOIN_TX                    = LogType({u'type': u'secjoin.tx',                u'keys': [u'_mote_id']})
+LOG_SECJOIN_RX                    = LogType({u'type': u'secjoin.rx',                u'keys': [u'_mote_id']})
+LOG_SECJOIN_JOINED                = LogType({u'type': u'secjoin.joined',            u'keys': [u'_mote_id']})
+LOG_SECJOIN_UNJOINED              = LogType({u'type': u'secjoin.unjoined',          u'keys': [u'_mote_id']})
+LOG_SECJOIN_FAILED                = LogType({u'type': u'secjoin.failed',            u'keys': [u'_mote_id']})
 
 # === rpl
-LOG_RPL_DIO_TX                    = {u'type': u'rpl.dio.tx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_DIO_RX                    = {u'type': u'rpl.dio.rx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_DAO_TX                    = {u'type': u'rpl.dao.tx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_DAO_RX                    = {u'type': u'rpl.dao.rx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_DIS_TX                    = {u'type': u'rpl.dis.tx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_DIS_RX                    = {u'type': u'rpl.dis.rx',                u'keys': [u'_mote_id',u'packet']}
-LOG_RPL_CHURN                     = {u'type': u'rpl.churn',                 u'keys': [u'_mote_id',u'rank',u'preferredParent']}
-LOG_RPL_LOCAL_REPAIR              = {u'type': u'rpl.local_repair',          u'keys': [u'_mote_id']}
+LOG_RPL_DIO_TX                    = LogType({u'type': u'rpl.dio.tx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_DIO_RX                    = LogType({u'type': u'rpl.dio.rx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_DAO_TX                    = LogType({u'type': u'rpl.dao.tx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_DAO_RX                    = LogType({u'type': u'rpl.dao.rx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_DIS_TX                    = LogType({u'type': u'rpl.dis.tx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_DIS_RX                    = LogType({u'type': u'rpl.dis.rx',                u'keys': [u'_mote_id',u'packet']})
+LOG_RPL_CHURN                     = LogType({u'type': u'rpl.churn',                 u'keys': [u'_mote_id',u'rank',u'preferredParent']})
+LOG_RPL_LOCAL_REPAIR              = LogType({u'type': u'rpl.local_repair',          u'keys': [u'_mote_id']})
 
 # === 6LoWPAN
-LOG_SIXLOWPAN_PKT_TX              = {u'type': u'sixlowpan.pkt.tx',          u'keys': [u'_mote_id',u'packet']}
-LOG_SIXLOWPAN_PKT_FWD             = {u'type': u'sixlowpan.pkt.fwd',         u'keys': [u'_mote_id',u'packet']}
-LOG_SIXLOWPAN_PKT_RX              = {u'type': u'sixlowpan.pkt.rx',          u'keys': [u'_mote_id',u'packet']}
-LOG_SIXLOWPAN_FRAG_GEN            = {u'type': u'sixlowpan.frag.gen',        u'keys': [u'_mote_id',u'packet']}
+LOG_SIXLOWPAN_PKT_TX              = LogType({u'type': u'sixlowpan.pkt.tx',          u'keys': [u'_mote_id',u'packet']})
+LOG_SIXLOWPAN_PKT_FWD             = LogType({u'type': u'sixlowpan.pkt.fwd',         u'keys': [u'_mote_id',u'packet']})
+LOG_SIXLOWPAN_PKT_RX              = LogType({u'type': u'sixlowpan.pkt.rx',          u'keys': [u'_mote_id',u'packet']})
+LOG_SIXLOWPAN_FRAG_GEN            = LogType({u'type': u'sixlowpan.frag.gen',        u'keys': [u'_mote_id',u'packet']})
 
 # === MSF
-LOG_MSF_TX_CELL_UTILIZATION       = {u'type': u'msf.tx_cell_utilization',   u'keys': [u'_mote_id',u'neighbor',u'value']}
-LOG_MSF_RX_CELL_UTILIZATION       = {u'type': u'msf.rx_cell_utilization',   u'keys': [u'_mote_id',u'neighbor',u'value']}
-LOG_MSF_ERROR_SCHEDULE_FULL       = {u'type': u'msf.error.schedule_full',   u'keys': [u'_mote_id']}
+LOG_MSF_TX_CELL_UTILIZATION       = LogType({u'type': u'msf.tx_cell_utilization',   u'keys': [u'_mote_id',u'neighbor',u'value']})
+LOG_MSF_RX_CELL_UTILIZATION       = LogType({u'type': u'msf.rx_cell_utilization',   u'keys': [u'_mote_id',u'neighbor',u'value']})
+LOG_MSF_ERROR_SCHEDULE_FULL       = LogType({u'type': u'msf.error.schedule_full',   u'keys': [u'_mote_id']})
 
 # === sixp
-LOG_SIXP_TX                       = {u'type': u'sixp.tx',                   u'keys': [u'_mote_id',u'packet']}
-LOG_SIXP_RX                       = {u'type': u'sixp.rx',                   u'keys': [u'_mote_id',u'packet']}
-LOG_SIXP_TRANSACTION_COMPLETED    = {u'type': u'sixp.comp',                 u'keys': [u'_mote_id',u'peerMac',u'seqNum', u'cmd']}
-LOG_SIXP_TRANSACTION_TIMEOUT      = {u'type': u'sixp.timeout',              u'keys': [u'_mote_id',u'srcMac',u'dstMac',u'seqNum', u'cmd']}
-LOG_SIXP_TRANSACTION_ABORTED      = {u'type': u'sixp.abort',                u'keys': [u'_mote_id',u'srcMac',u'dstMac',u'seqNum', u'cmd']}
+LOG_SIXP_TX                       = LogType({u'type': u'sixp.tx',                   u'keys': [u'_mote_id',u'packet']})
+LOG_SIXP_RX                       = LogType({u'type': u'sixp.rx',                   u'keys': [u'_mote_id',u'packet']})
+LOG_SIXP_TRANSACTION_COMPLETED    = LogType({u'type': u'sixp.comp',                 u'keys': [u'_mote_id',u'peerMac',u'seqNum', u'cmd']})
+LOG_SIXP_TRANSACTION_TIMEOUT      = LogType({u'type': u'sixp.timeout',              u'keys': [u'_mote_id',u'srcMac',u'dstMac',u'seqNum', u'cmd']})
+LOG_SIXP_TRANSACTION_ABORTED      = LogType({u'type': u'sixp.abort',                u'keys': [u'_mote_id',u'srcMac',u'dstMac',u'seqNum', u'cmd']})
 
 # === tsch
-LOG_TSCH_SYNCED                   = {u'type': u'tsch.synced',               u'keys': [u'_mote_id']}
-LOG_TSCH_DESYNCED                 = {u'type': u'tsch.desynced',             u'keys': [u'_mote_id']}
-LOG_TSCH_EB_TX                    = {u'type': u'tsch.eb.tx',                u'keys': [u'_mote_id',u'packet']}
-LOG_TSCH_EB_RX                    = {u'type': u'tsch.eb.rx',                u'keys': [u'_mote_id',u'packet']}
-LOG_TSCH_ADD_CELL                 = {u'type': u'tsch.add_cell',             u'keys': [u'_mote_id',u'slotFrameHandle',u'slotOffset',u'channelOffset',u'neighbor',u'cellOptions']}
-LOG_TSCH_DELETE_CELL              = {u'type': u'tsch.delete_cell',          u'keys': [u'_mote_id',u'slotFrameHandle',u'slotOffset',u'channelOffset',u'neighbor',u'cellOptions']}
-LOG_TSCH_TXDONE                   = {u'type': u'tsch.txdone',               u'keys': [u'_mote_id',u'channel',u'slot_offset', u'channel_offset', u'packet',u'isACKed']}
-LOG_TSCH_RXDONE                   = {u'type': u'tsch.rxdone',               u'keys': [u'_mote_id',u'channel',u'slot_offset', u'channel_offset', u'packet']}
-LOG_TSCH_BACKOFF_EXPONENT_UPDATED = {u'type': u'tsch.be.updated',           u'keys': [u'_mote_id',u'old_be', u'new_be']}
-LOG_TSCH_ADD_SLOTFRAME            = {u'type': u'tsch.add_slotframe',        u'keys': [u'_mote_id',u'slotFrameHandle',u'length']}
-LOG_TSCH_DELETE_SLOTFRAME         = {u'type': u'tsch.delete_slotframe',     u'keys': [u'_mote_id',u'slotFrameHandle',u'length']}
+LOG_TSCH_SYNCED                   = LogType({u'type': u'tsch.synced',               u'keys': [u'_mote_id']})
+LOG_TSCH_DESYNCED                 = LogType({u'type': u'tsch.desynced',             u'keys': [u'_mote_id']})
+LOG_TSCH_EB_TX                    = LogType({u'type': u'tsch.eb.tx',                u'keys': [u'_mote_id',u'packet']})
+LOG_TSCH_EB_RX                    = LogType({u'type': u'tsch.eb.rx',                u'keys': [u'_mote_id',u'packet']})
+LOG_TSCH_ADD_CELL                 = LogType({u'type': u'tsch.add_cell',             u'keys': [u'_mote_id',u'slotFrameHandle',u'slotOffset',u'channelOffset',u'neighbor',u'cellOptions']})
+LOG_TSCH_DELETE_CELL              = LogType({u'type': u'tsch.delete_cell',          u'keys': [u'_mote_id',u'slotFrameHandle',u'slotOffset',u'channelOffset',u'neighbor',u'cellOptions']})
+LOG_TSCH_TXDONE                   = LogType({u'type': u'tsch.txdone',               u'keys': [u'_mote_id',u'channel',u'slot_offset', u'channel_offset', u'packet',u'isACKed']})
+LOG_TSCH_RXDONE                   = LogType({u'type': u'tsch.rxdone',               u'keys': [u'_mote_id',u'channel',u'slot_offset', u'channel_offset', u'packet']})
+LOG_TSCH_BACKOFF_EXPONENT_UPDATED = LogType({u'type': u'tsch.be.updated',           u'keys': [u'_mote_id',u'old_be', u'new_be']})
+LOG_TSCH_ADD_SLOTFRAME            = LogType({u'type': u'tsch.add_slotframe',        u'keys': [u'_mote_id',u'slotFrameHandle',u'length']})
+LOG_TSCH_DELETE_SLOTFRAME         = LogType({u'type': u'tsch.delete_slotframe',     u'keys': [u'_mote_id',u'slotFrameHandle',u'length']})
 
 # === mote info
-LOG_RADIO_STATS                   = {u'type': u'radio.stats',               u'keys': [u'_mote_id', u'idle_listen', u'tx_data_rx_ack', u'tx_data', u'rx_data_tx_ack', u'rx_data', u'sleep']}
-LOG_MAC_ADD_ADDR                  = {u'type': u'mac.add_addr',              u'keys': [u'_mote_id', u'type', u'addr']}
-LOG_IPV6_ADD_ADDR                 = {u'type': u'ipv6.add_addr',             u'keys': [u'_mote_id', u'type', u'addr']}
+LOG_RADIO_STATS                   = LogType({u'type': u'radio.stats',               u'keys': [u'_mote_id', u'idle_listen', u'tx_data_rx_ack', u'tx_data', u'rx_data_tx_ack', u'rx_data', u'sleep']})
+LOG_MAC_ADD_ADDR                  = LogType({u'type': u'mac.add_addr',              u'keys': [u'_mote_id', u'type', u'addr']})
+LOG_IPV6_ADD_ADDR                 = LogType({u'type': u'ipv6.add_addr',             u'keys': [u'_mote_id', u'type', u'addr']})
 
 # === propagation
-LOG_PROP_TRANSMISSION             = {u'type': u'prop.transmission',         u'keys': [u'channel',u'packet']}
-LOG_PROP_INTERFERENCE             = {u'type': u'prop.interference',         u'keys': [u'_mote_id',u'channel',u'lockon_transmission',u'interfering_transmissions']}
-LOG_PROP_DROP_LOCKON              = {u'type': u'prop.drop_lockon' ,         u'keys': [u'_mote_id',u'channel',u'lockon_transmission']}
+LOG_PROP_TRANSMISSION             = LogType({u'type': u'prop.transmission',         u'keys': [u'channel',u'packet']})
+LOG_PROP_INTERFERENCE             = LogType({u'type': u'prop.interference',         u'keys': [u'_mote_id',u'channel',u'lockon_transmission',u'interfering_transmissions']})
+LOG_PROP_DROP_LOCKON              = LogType({u'type': u'prop.drop_lockon' ,         u'keys': [u'_mote_id',u'channel',u'lockon_transmission']})
 
 # === connectivity matrix
-LOG_CONN_MATRIX_K7_UPDATE         = {u'type': u'conn.matrix.update',        u'keys': [u'start_trace_position', u'end_trace_position', u'asn_of_next_update']}
+LOG_CONN_MATRIX_K7_UPDATE         = LogType({u'type': u'conn.matrix.update',        u'keys': [u'start_trace_position', u'end_trace_position', u'asn_of_next_update']})
 
 # ============================ SimLog =========================================
 
@@ -138,9 +179,20 @@ class SimLog(object):
 
             # local variables
             self.log_filters = []
-
-            # open log file
-            self.log_output_file = open(self.settings.getOutputFile(), u'a')
+            self.debug_check_keys = self.settings.log_debug_check_keys
+
+            # open log file; see SimLogFormat for the formats
+            self.log_output_file = self._open_output_file()
+            if self.settings.log_format == SimLogFormat.LOG_FORMAT_BINARY:
+                self.binary_log_encoder = SimLogFormat.BinaryLogEncoder(
+                    run_id    = self.settings.run_id,
+                    log_types = list(LOG_TYPES.values())
+                )
+                self._encode_log = self.binary_log_encoder.encode_log
+            else:
+                assert self.settings.log_format == SimLogFormat.LOG_FORMAT_JSON
+                self.binary_log_encoder = None
+                self._encode_log = self._encode_json_log
 
             # write config to log file; if a file with the same file name exists,
             # append logs to the file. this happens if you multiple runs on the
@@ -150,8 +202,28 @@ class SimLog(object):
             config_line[u'_type']   = u'config'
             config_line[u'_run_id'] = config_line[u'run_id']
             del config_line[u'run_id']
-            json_string = json.dumps(config_line)
-            self.log_output_file.write(json_string + u'\n')
+            if self.binary_log_encoder is None:
+                json_string = json.dumps(config_line)
+                self.log_output_file.write(json_string + u'\n')
+            else:
+                self.log_output_file.write(
+                    self.binary_log_encoder.encode_header() +
+                    self.binary_log_encoder.encode_raw_log(config_line)
+                )
+
+            # logs are written either by this thread or by a writer thread
+            if self.settings.log_async_writer:
+                self.log_writer = AsyncLogWriter(
+                    output_file   = self.log_output_file,
+                    queue_size    = self.settings.log_async_queue_size,
+                    block_on_full = (
+                        self.settings.log_async_on_full == u'block'
+                    )
+                )
+                self._write = self.log_writer.write
+            else:
+                self.log_writer = None
+                self._write = self.log_output_file.write
         except:
             # destroy the singleton
             cls._instance = None
@@ -165,18 +237,18 @@ class SimLog(object):
         """
 
         # ignore types that are not listed in the simulation config
-        if (self.log_filters != u'all') and (simlog[u'type'] not in self.log_filters):
+        try:
+            enabled = simlog.enabled
+        except AttributeError:
+            # not a LogType
+            enabled = self._is_enabled_type(simlog[u'type'])
+        if not enabled:
             return
 
-        # if a key is passed but is not listed in the log definition, raise error
-        if (u'keys' in simlog) and (sorted(simlog[u'keys']) != sorted(content.keys())):
-            raise Exception(
-                "Wrong keys passed to log() function for type {0}!\n    - expected {1}\n    - got      {2}".format(
-                    simlog[u'type'],
-                    sorted(simlog[u'keys']),
-                    sorted(content.keys()),
-                )
-            )
+        # if a key is passed but is not listed in the log definition, raise
+        # error; this is checked only in the debug mode
+        if self.debug_check_keys:
+            self._check_keys(simlog, content)
 
         # if self.engine is not available, consider the current time
         # is ASN 0.
@@ -196,8 +268,7 @@ class SimLog(object):
 
         # write line
         try:
-            json_string = json.dumps(content, sort_keys=True)
-            self.log_output_file.write(json_string + u'\n')
+            self._write(self._encode_log(simlog, content))
         except Exception as err:
             output  = []
             output += [u'----------------------']
@@ -215,23 +286,186 @@ class SimLog(object):
             raise
 
     def flush(self):
-        # flush the internal buffer, write data to the file
+        # flush the internal buffer, write data to the file; this waits
+        # for the writer thread to write all the queued logs
         assert not self.log_output_file.closed
-        self.log_output_file.flush()
+        if self.log_writer is None:
+            self.log_output_file.flush()
+        else:
+            self.log_writer.flush()
 
     def set_simengine(self, engine):
         self.engine = engine
 
     def set_log_filters(self, log_filters):
         self.log_filters = log_filters
+        for log_type in LOG_TYPES.values():
+            log_type.enabled = self._is_enabled_type(log_type[u'type'])
 
     def destroy(self):
-        # close log file
-        if not self.log_output_file.closed:
-            self.log_output_file.close()
+        # disable all the log types
+        self.set_log_filters([])
 
-        cls = type(self)
-        cls._instance       = None
-        cls._init           = False
+        try:
+            # stop the writer thread after it writes all the queued logs; an
+            # error of the thread is raised here
+            if self.log_writer is not None:
+                log_writer = self.log_writer
+                self.log_writer = None
+                if log_writer.num_dropped_lines > 0:
+                    self._log_dropped_lines(log_writer)
+                log_writer.close()
+        finally:
+            # close log file
+            if not self.log_output_file.closed:
+                self.log_output_file.close()
+
+            cls = type(self)
+            cls._instance       = None
+            cls._init           = False
 
     # ============================== private ==================================
+
+    def _open_output_file(self):
+        file_path = self.settings.getOutputFile()
+        if self.settings.log_compression == SimLogFormat.LOG_COMPRESSION_GZIP:
+            return SimLogFormat.GzipLogFile(
+                file_path,
+                block_size = self.settings.log_compression_block_size
+            )
+        assert self.settings.log_compression == SimLogFormat.LOG_COMPRESSION_NONE
+        if self.settings.log_format == SimLogFormat.LOG_FORMAT_BINARY:
+            return open(file_path, u'ab')
+        else:
+            return open(file_path, u'a')
+
+    def _log_dropped_lines(self, log_writer):
+        # the file tells how many logs are missing from it, whatever the log
+        # filters
+        print(
+            u'{0} logs were dropped since the log queue was full'.format(
+                log_writer.num_dropped_lines
+            )
+        )
+        content = {
+            u'num_logs': log_writer.num_dropped_lines,
+            u'_asn':     0 if self.engine is None else self.engine.asn,
+            u'_type':    LOG_SIMULATOR_LOGS_DROPPED[u'type'],
+            u'_run_id':  self.settings.run_id
+        }
+        log_writer.write(self._encode_log(LOG_SIMULATOR_LOGS_DROPPED, content))
+
+    @staticmethod
+    def _encode_json_log(simlog, content):
+        return json.dumps(content, sort_keys=True) + u'\n'
+
+    def _is_enabled_type(self, log_type):
+        return (self.log_filters == u'all') or (log_type in self.log_filters)
+
+    @staticmethod
+    def _check_keys(simlog, content):
+        if u'keys' not in simlog:
+            return
+        if isinstance(simlog, LogType):
+            key_set = simlog.key_set
+        else:
+            key_set = set(simlog[u'keys'])
+        if key_set != set(content.keys()):
+            raise Exception(
+                "Wrong keys passed to log() function for type {0}!\n    - expected {1}\n    - got      {2}".format(
+                    simlog[u'type'],
+                    sorted(simlog[u'keys']),
+                    sorted(content.keys()),
+                )
+            )
+
+# ============================ AsyncLogWriter =================================
+
+class AsyncLogWriter(threading.Thread):
+    """
+    Writes log lines, or binary records, to a file in its own thread
+
+    Lines are put into batches, which are handed to the thread through a
+    bounded queue. When the queue is full, write() either waits for the
+    thread to catch up or drops the batch, counting the dropped lines.
+
+    Lines are encoded by the caller: the content of a log refers to
+    objects, such as packets, which change after log() returns.
+    """
+
+    BATCH_SIZE = 1000 # lines
+
+    def __init__(self, output_file, queue_size, block_on_full):
+
+        # store params
+        self.output_file       = output_file
+        self.block_on_full     = block_on_full
+
+        # local variables
+        self.num_dropped_lines = 0
+        self.exc               = None
+        self._batch            = []
+        self._queue            = queue.Queue(maxsize=queue_size)
+
+        # initialize parent class
+        super(AsyncLogWriter, self).__init__()
+        self.name              = u'AsyncLogWriter'
+        self.daemon            = True
+        self.start()
+
+    def write(self, line):
+        self._batch.append(line)
+        if len(self._batch) == self.BATCH_SIZE:
+            self._put_batch(block=self.block_on_full)
+
+    def flush(self):
+        # wait until the thread writes all the lines given so far
+        self._put_batch(block=True)
+        self._queue.join()
+        if self.exc is not None:
+            raise self.exc
+        self.output_file.flush()
+
+    def close(self):
+        # the thread stops when it gets None
+        self._put_batch(block=True)
+        self._queue.put(None)
+        self.join()
+        if self.exc is not None:
+            raise self.exc
+
+    def run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    break
+                if self.exc is None:
+                    # lines are either str or bytes, as given
+                    self.output_file.write(batch[0][:0].join(batch))
+            except Exception as e:
+                # keep the exception for the simulation thread; the
+                # following batches are discarded
+                self.exc = e
+            finally:
+                self._queue.task_done()
+
+    # ============================== private ==================================
+
+    def _put_batch(self, block):
+        if not self._batch:
+            return
+        batch = self._batch
+        self._batch = []
+        if block:
+            self._queue.put(batch)
+        else:
+            try:
+                self._queue.put_nowait(batch)
+            except queue.Full:
+                if self.num_dropped_lines == 0:
+                    print(
+                        u'the log queue is full, logs are being dropped; '
+                        u'their number is given at the end of the run'
+                    )
+                self.num_dropped_lines += len(batch)
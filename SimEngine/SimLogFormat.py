@@ -0,0 +1,543 @@
+"""
+Formats of log files
+
+SimLog writes a log file either in the JSON format, one JSON object per line,
+or in the binary format described below, as the 'log_format' setting says.
+read_logs() reads both formats and yields the same dicts.
+
+Binary format
+-------------
+
+A file is a series of segments. SimLog writes a segment per run; segments of
+different files can be concatenated. A segment starts with a header:
+
+    SEGMENT_MARKER | header length (uint32) | header (JSON)
+
+The header is {"version": 1, "run_id": <run_id>, "types": [...]}, where the
+n-th entry of "types", [<type>, [<key>, ...]], defines the type ID n+1. The
+keys are the ones of the log type, in the order their values are written;
+"_asn", "_type" and "_run_id" are not listed.
+
+Records follow the header:
+
+    record length (uint32) | type ID (uint16) | body
+
+* type ID 0: the body is a whole log, as a JSON object
+* type ID 0xFFFF: the body defines a type which is not in the header, as a
+  JSON array, [<type ID>, <type>, [<key>, ...]]
+* other type IDs: the body is the ASN (uint64) followed by the values of the
+  keys of the type, as a JSON array
+
+Integers are little-endian. The record length counts the type ID and the
+body. Values are JSON-encoded, so that they are read back exactly as from the
+JSON format.
+
+Compression
+-----------
+
+A file in either format is compressed with gzip when the 'log_compression'
+setting is 'gzip'. SimLog appends a gzip member per run and flushes the
+compressed stream every 'log_compression_block_size' bytes of logs, so that
+a file cut by a crash is readable up to the last flush. open_log_file()
+opens compressed and plain files alike.
+
+Reading by runs
+---------------
+
+find_runs() gives where the runs of a plain file start, so that the runs
+can be read separately, e.g. by several processes, with open_log_file().
+read_logs() decodes only the logs of the given types; of the other ones, it
+gives only their '_type', '_run_id' and '_mote_id', found without decoding
+them.
+"""
+from __future__ import absolute_import
+
+# =========================== imports =========================================
+
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+
+# =========================== defines =========================================
+
+LOG_FORMAT_JSON                 = u'json'
+LOG_FORMAT_BINARY               = u'binary'
+
+LOG_COMPRESSION_NONE            = u'none'
+LOG_COMPRESSION_GZIP            = u'gzip'
+
+BINARY_FORMAT_VERSION           = 1
+
+# a length of record never starts with 0xFFFFFFFF
+SEGMENT_MARKER                  = b'\xff\xff\xff\xffSIMLOG'
+
+TYPE_ID_RAW                     = 0
+TYPE_ID_DEFINITION              = 0xFFFF
+
+GZIP_MAGIC                      = b'\x1f\x8b'
+GZIP_COMPRESS_LEVEL             = 6
+
+_LENGTH                         = struct.Struct('<I')
+_RECORD_HEADER                  = struct.Struct('<IH')
+_TYPED_RECORD_HEADER            = struct.Struct('<IHQ')
+_ASN                            = struct.Struct('<Q')
+_TYPE_ID                        = struct.Struct('<H')
+
+# number of bytes read from a file at once
+_READ_CHUNK_SIZE                = 1024 * 1024
+
+# wbits of zlib for a gzip member
+_GZIP_WBITS                     = 16 + zlib.MAX_WBITS
+
+# the beginning of a log in the JSON format, as SimLog writes it with sorted
+# keys, and of the body of a typed record whose first key is '_mote_id'
+_JSON_CONFIG_TYPE               = b'"_type": "config"'
+_JSON_LOG_IDS                   = re.compile(
+    br'\{"_asn": -?\d+, (?:"_mote_id": (-?\d+|null), )?'
+    br'"_run_id": (-?\d+|null), "_type": "([^"\\]*)"'
+)
+_JSON_FIRST_ID                  = re.compile(br'\[(-?\d+|null)[,\]]')
+
+# =========================== writer ==========================================
+
+class BinaryLogEncoder(object):
+    """
+    Encodes logs of a run into the binary format
+
+    log_types are the types defined in the header; logs of other types get
+    their definitions when they appear.
+    """
+
+    def __init__(self, run_id, log_types):
+
+        # store params
+        self.run_id       = run_id
+
+        # local variables
+        self._types       = {} # (type ID, keys) indexed by type
+        self._definitions = []
+        for log_type in log_types:
+            self._add_type(log_type[u'type'], log_type[u'keys'])
+
+    def encode_header(self):
+        header = json.dumps(
+            {
+                u'version': BINARY_FORMAT_VERSION,
+                u'run_id':  self.run_id,
+                u'types':   self._definitions
+            }
+        ).encode(u'utf-8')
+        return SEGMENT_MARKER + _LENGTH.pack(len(header)) + header
+
+    def encode_log(self, simlog, content):
+        """return the record(s) of a log, whose content has '_asn', '_type'
+        and '_run_id'
+        """
+        ret_val = b''
+
+        type_entry = self._types.get(simlog[u'type'])
+        if type_entry is None:
+            if u'keys' not in simlog:
+                # nothing tells what keys logs of this type have
+                return self.encode_raw_log(content)
+            type_entry = self._add_type(simlog[u'type'], simlog[u'keys'])
+            ret_val += self._encode_record(
+                TYPE_ID_DEFINITION,
+                json.dumps(
+                    [type_entry[0], simlog[u'type'], type_entry[1]]
+                ).encode(u'utf-8')
+            )
+
+        (type_id, keys) = type_entry
+        if len(content) != len(keys) + 3:
+            # the content doesn't have the keys of its type
+            return ret_val + self.encode_raw_log(content)
+        try:
+            values = [content[key] for key in keys]
+        except KeyError:
+            # same as above
+            return ret_val + self.encode_raw_log(content)
+        body = json.dumps(values).encode(u'utf-8')
+        return ret_val + _TYPED_RECORD_HEADER.pack(
+            len(body) + 10,
+            type_id,
+            content[u'_asn']
+        ) + body
+
+    def encode_raw_log(self, content):
+        return self._encode_record(
+            TYPE_ID_RAW,
+            json.dumps(content, sort_keys=True).encode(u'utf-8')
+        )
+
+    # ============================== private ==================================
+
+    def _add_type(self, log_type, keys):
+        keys = sorted(keys)
+        self._definitions.append([log_type, keys])
+        type_id = len(self._definitions)
+        assert type_id < TYPE_ID_DEFINITION
+        self._types[log_type] = (type_id, keys)
+        return self._types[log_type]
+
+    @staticmethod
+    def _encode_record(type_id, body):
+        return _RECORD_HEADER.pack(len(body) + 2, type_id) + body
+
+class GzipLogFile(object):
+    """
+    Writes logs to a file compressed with gzip, appending a gzip member
+
+    Logs are buffered and compressed by blocks of block_size bytes; the
+    compressed stream is flushed after each block, so that the file is
+    readable up to there even if the simulator is killed. Logs are either
+    str or bytes, as written to a plain file.
+    """
+
+    def __init__(self, file_path, block_size):
+
+        # store params
+        self.block_size         = block_size
+
+        # local variables
+        self._file              = gzip.GzipFile(
+            file_path,
+            mode          = u'ab',
+            compresslevel = GZIP_COMPRESS_LEVEL
+        )
+        self._buf               = []
+        self._num_pending_bytes = 0
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def write(self, data):
+        self._buf.append(data)
+        self._num_pending_bytes += len(data)
+        if self._num_pending_bytes >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self._buf:
+            data = self._buf[0][:0].join(self._buf)
+            if not isinstance(data, bytes):
+                data = data.encode(u'utf-8')
+            self._buf = []
+            self._num_pending_bytes = 0
+            self._file.write(data)
+        # end the deflate block and write it to the file
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+# =========================== reader ==========================================
+
+def open_log_file(file_path, start=0, end=None):
+    """
+    Open a log file to read, either compressed with gzip or not
+
+    Return a file object in binary mode, which gives the decompressed data
+    of a compressed file, to be passed to read_logs(). A compressed file cut
+    in the middle of a gzip member is read up to the cut.
+
+    Only the bytes from start to end are read from a plain file, typically
+    the runs between two offsets given by find_runs(). A compressed file is
+    read as a whole only.
+    """
+    input_file = io.open(file_path, u'rb')
+    if input_file.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+        if (start != 0) or (end is not None):
+            input_file.close()
+            raise ValueError(u'a compressed file is read as a whole only')
+        return io.BufferedReader(_GzipReader(input_file), _READ_CHUNK_SIZE)
+    elif (start != 0) or (end is not None):
+        return io.BufferedReader(
+            _FileRange(input_file, start, end),
+            _READ_CHUNK_SIZE
+        )
+    else:
+        return input_file
+
+def find_runs(file_path):
+    """
+    Return the offsets where the runs of a log file start, the first one
+    being 0; None for a compressed file
+
+    A run starts with its 'config' log, which is a line in the JSON format
+    and a new segment in the binary format.
+    """
+    with io.open(file_path, u'rb') as input_file:
+        if input_file.peek(len(GZIP_MAGIC))[:len(GZIP_MAGIC)] == GZIP_MAGIC:
+            return None
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return [0]
+        data = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    offsets = [0]
+    try:
+        if data[:len(SEGMENT_MARKER)] == SEGMENT_MARKER:
+            pos = data.find(SEGMENT_MARKER, len(SEGMENT_MARKER))
+            while pos >= 0:
+                offsets.append(pos)
+                pos = data.find(SEGMENT_MARKER, pos + len(SEGMENT_MARKER))
+        else:
+            pos = data.find(_JSON_CONFIG_TYPE)
+            while pos >= 0:
+                line_start = data.rfind(b'\n', 0, pos) + 1
+                if line_start > 0:
+                    offsets.append(line_start)
+                pos = data.find(_JSON_CONFIG_TYPE, pos + len(_JSON_CONFIG_TYPE))
+    finally:
+        data.close()
+    return offsets
+
+def read_logs(input_file, on_error=None, log_types=None):
+    """
+    Yield the logs of a file as dicts, the first one being the 'config' log
+
+    input_file is a file object opened in binary mode, in either format. For
+    a JSON file, on_error is called with a line which cannot be parsed, which
+    is skipped; without on_error, ValueError is raised. A line or a record
+    cut at the end of a file, as the last one of a crashed run, is ignored.
+
+    When log_types is given, only logs of these types are decoded; a log of
+    another type has only its '_type', '_run_id' and '_mote_id', if any.
+    """
+    head = input_file.read(len(SEGMENT_MARKER))
+    if head == SEGMENT_MARKER:
+        return _read_binary_logs(input_file, head, log_types)
+    else:
+        return _read_json_logs(input_file, head, on_error, log_types)
+
+# =========================== private =========================================
+
+def _read_json_logs(input_file, head, on_error, log_types):
+    # the first line starts with the bytes read by read_logs()
+    first_line = head
+    if head and not head.endswith(b'\n'):
+        first_line += input_file.readline()
+    lines = [first_line] if first_line else []
+
+    for line_list in (lines, input_file):
+        for line in line_list:
+            if log_types is not None:
+                log = _read_json_log_ids(line, log_types)
+                if log is not None:
+                    yield log
+                    continue
+            try:
+                log = json.loads(line.decode(u'utf-8'))
+            except ValueError:
+                if not line.endswith(b'\n'):
+                    # the file ends in the middle of the line
+                    return
+                if on_error is None:
+                    raise
+                on_error(line.decode(u'utf-8', u'replace'))
+                continue
+            yield log
+
+def _read_binary_logs(input_file, head, log_types):
+    reader = _ChunkReader(input_file, head)
+    header = None
+
+    while True:
+        length_bytes = reader.read(_LENGTH.size)
+        if len(length_bytes) < _LENGTH.size:
+            # end of the file
+            return
+
+        if length_bytes == SEGMENT_MARKER[:_LENGTH.size]:
+            # a new segment
+            marker_end = reader.read(len(SEGMENT_MARKER) - _LENGTH.size)
+            if marker_end != SEGMENT_MARKER[_LENGTH.size:]:
+                raise ValueError(u'not a log file')
+            length_bytes = reader.read(_LENGTH.size)
+            if len(length_bytes) < _LENGTH.size:
+                return
+            (length,) = _LENGTH.unpack(length_bytes)
+            data = reader.read(length)
+            if len(data) < length:
+                return
+            header = json.loads(data.decode(u'utf-8'))
+            if header[u'version'] != BINARY_FORMAT_VERSION:
+                raise ValueError(
+                    u'unsupported log format version: {0}'.format(
+                        header[u'version']
+                    )
+                )
+            run_id = header[u'run_id']
+            types = {}
+            for (index, (log_type, keys)) in enumerate(header[u'types']):
+                types[index + 1] = (log_type, keys)
+            continue
+        elif header is None:
+            raise ValueError(u'not a log file')
+
+        (length,) = _LENGTH.unpack(length_bytes)
+        data = reader.read(length)
+        if len(data) < length:
+            # the file ends in the middle of the record
+            return
+
+        (type_id,) = _TYPE_ID.unpack_from(data)
+        if type_id == TYPE_ID_RAW:
+            yield json.loads(data[2:].decode(u'utf-8'))
+        elif type_id == TYPE_ID_DEFINITION:
+            (new_type_id, log_type, keys) = json.loads(
+                data[2:].decode(u'utf-8')
+            )
+            types[new_type_id] = (log_type, keys)
+        else:
+            (log_type, keys) = types[type_id]
+            if (log_types is not None) and (log_type not in log_types):
+                log = _read_binary_log_ids(data, keys)
+                if log is not None:
+                    log[u'_type'] = log_type
+                    log[u'_run_id'] = run_id
+                    yield log
+                    continue
+            (asn,) = _ASN.unpack_from(data, 2)
+            log = dict(zip(keys, json.loads(data[10:].decode(u'utf-8'))))
+            log[u'_asn'] = asn
+            log[u'_type'] = log_type
+            log[u'_run_id'] = run_id
+            yield log
+
+def _read_json_log_ids(line, log_types):
+    """return the '_type', '_run_id' and '_mote_id' of a line whose type is
+    not in log_types; None when the line has to be decoded
+    """
+    match = _JSON_LOG_IDS.match(line)
+    if match is None:
+        return None
+    (mote_id, run_id, log_type) = match.groups()
+    log_type = log_type.decode(u'utf-8')
+    if log_type in log_types:
+        return None
+
+    log = {
+        u'_type':   log_type,
+        u'_run_id': _to_id(run_id)
+    }
+    if mote_id is not None:
+        log[u'_mote_id'] = _to_id(mote_id)
+    return log
+
+def _read_binary_log_ids(data, keys):
+    """return the '_mote_id' of a typed record, if any; None when the record
+    has to be decoded
+    """
+    log = {}
+    if u'_mote_id' in keys:
+        match = None
+        if keys[0] == u'_mote_id':
+            # the body follows the type ID and the ASN
+            match = _JSON_FIRST_ID.match(data, 10)
+        if match is None:
+            return None
+        log[u'_mote_id'] = _to_id(match.group(1))
+    return log
+
+def _to_id(value):
+    return None if value == b'null' else int(value)
+
+class _FileRange(io.RawIOBase):
+    """Reads the bytes of a file from start to end, or to the end of the
+    file when end is None
+    """
+
+    def __init__(self, input_file, start, end):
+        super(_FileRange, self).__init__()
+        input_file.seek(start)
+        self._file      = input_file
+        self._remaining = None if end is None else end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = len(b)
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        b[:len(data)] = data
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(_FileRange, self).close()
+
+class _ChunkReader(object):
+    """Reads a file by chunks, which is faster than many small reads"""
+
+    def __init__(self, input_file, head):
+        self._file = input_file
+        self._buf = head
+        self._pos = 0
+
+    def read(self, size):
+        """return the next size bytes; fewer at the end of the file"""
+        end = self._pos + size
+        if end > len(self._buf):
+            self._buf = self._buf[self._pos:] + self._file.read(
+                max(size, _READ_CHUNK_SIZE)
+            )
+            self._pos = 0
+            end = size
+        data = self._buf[self._pos:end]
+        self._pos = end
+        return data
+
+class _GzipReader(io.RawIOBase):
+    """
+    Decompresses gzip members one after another, as gzip.GzipFile does,
+    ending quietly where the file is cut instead of raising EOFError
+    """
+
+    def __init__(self, input_file):
+        super(_GzipReader, self).__init__()
+        self._file         = input_file
+        self._decompressor = zlib.decompressobj(_GZIP_WBITS)
+        self._data         = b''
+        self._pos          = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos == len(self._data):
+            # bytes given after the end of a member are kept as unused data;
+            # they start the next member
+            compressed = self._decompressor.unused_data
+            if compressed:
+                self._decompressor = zlib.decompressobj(_GZIP_WBITS)
+            else:
+                compressed = self._file.read(_READ_CHUNK_SIZE)
+                if not compressed:
+                    # end of the file, possibly in the middle of a member
+                    return 0
+            self._data = self._decompressor.decompress(compressed)
+            self._pos = 0
+        size = min(len(b), len(self._data) - self._pos)
+        b[:size] = self._data[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(_GzipReader, self).close()
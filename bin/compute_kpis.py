@@ -6,406 +6,166 @@ from __future__ import print_function
 import os
 import sys
 
-import netaddr
-
 if __name__ == '__main__':
     here = sys.path[0]
     sys.path.insert(0, os.path.join(here, '..'))
 
 # ========================== imports ==========================================
 
+import argparse
 import json
 import glob
-import numpy as np
+import multiprocessing
 
+from SimEngine import SimKpi
 from SimEngine import SimLog
-import SimEngine.Mote.MoteDefines as d
+from SimEngine import SimLogFormat
 
 # =========================== defines =========================================
 
-DAGROOT_ID = 0  # we assume first mote is DAGRoot
-DAGROOT_IP = 'fd00::1:0'
-BATTERY_AA_CAPACITY_mAh = 2821.5
+DAGROOT_ID = SimKpi.DAGROOT_ID  # we assume first mote is DAGRoot
+DAGROOT_IP = SimKpi.DAGROOT_IP
+BATTERY_AA_CAPACITY_mAh = SimKpi.BATTERY_AA_CAPACITY_mAh
+
+# only these logs are decoded; the '_type', '_run_id' and '_mote_id' of the
+# other ones are picked without decoding them
+PARSED_LOG_TYPES = set(
+    SimKpi.LOG_TYPES + [u'config', SimLog.LOG_SIMULATOR_KPIS['type']]
+)
 
 # =========================== decorators ======================================
 
 def openfile(func):
     def inner(inputfile):
-        with open(inputfile, 'r') as f:
-            return func(f)
+        with SimLogFormat.open_log_file(inputfile) as f:
+            return func(
+                SimLogFormat.read_logs(f, log_types=PARSED_LOG_TYPES)
+            )
     return inner
 
-# =========================== helpers =========================================
-
-def mean(numbers):
-    return float(sum(numbers)) / max(len(numbers), 1)
-
-def init_mote():
-    return {
-        'upstream_num_tx': 0,
-        'upstream_num_rx': 0,
-        'upstream_num_lost': 0,
-        'join_asn': None,
-        'join_time_s': None,
-        'sync_asn': None,
-        'sync_time_s': None,
-        'charge_asn': None,
-        'upstream_pkts': {},
-        'latencies': [],
-        'hops': [],
-        'charge': None,
-        'lifetime_AA_years': None,
-        'avg_current_uA': None,
-    }
-
 # =========================== KPIs ============================================
 
 @openfile
-def kpis_all(inputfile):
+def kpis_all(loglines):
 
-    allstats = {} # indexed by run_id, mote_id
+    file_settings = next(loglines)  # first line contains settings
 
-    file_settings = json.loads(inputfile.readline())  # first line contains settings
+    return kpis_runs(loglines, file_settings['tsch_slotDuration'])
+
+def kpis_runs(loglines, slot_duration):
+
+    collectors  = {} # indexed by run_id
+    logged_kpis = {} # KPIs logged by the simulator, indexed by run_id
 
     # === gather raw stats
 
-    for line in inputfile:
-        logline = json.loads(line)
+    for logline in loglines:
 
         # shorthands
         run_id = logline['_run_id']
-        if '_asn' in logline: # TODO this should be enforced in each line
-            asn = logline['_asn']
-        if '_mote_id' in logline: # TODO this should be enforced in each line
-            mote_id = logline['_mote_id']
 
         # populate
-        if run_id not in allstats:
-            allstats[run_id] = {}
-        if (
-                ('_mote_id' in logline)
-                and
-                (mote_id not in allstats[run_id])
-                and
-                (mote_id != DAGROOT_ID)
-            ):
-            allstats[run_id][mote_id] = init_mote()
-
-        if   logline['_type'] == SimLog.LOG_TSCH_SYNCED['type']:
-            # sync'ed
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot sync times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            allstats[run_id][mote_id]['sync_asn']  = asn
-            allstats[run_id][mote_id]['sync_time_s'] = asn*file_settings['tsch_slotDuration']
-
-        elif logline['_type'] == SimLog.LOG_SECJOIN_JOINED['type']:
-            # joined
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot join times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # populate
-            assert allstats[run_id][mote_id]['sync_asn'] is not None
-            allstats[run_id][mote_id]['join_asn']  = asn
-            allstats[run_id][mote_id]['join_time_s'] = asn*file_settings['tsch_slotDuration']
-
-        elif logline['_type'] == SimLog.LOG_APP_TX['type']:
-            # packet transmission
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            dstIp      = logline['packet']['net']['dstIp']
-            appcounter = logline['packet']['app']['appcounter']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
-                continue
-
-            # populate
-            assert allstats[run_id][mote_id]['join_asn'] is not None
-            if appcounter not in allstats[run_id][mote_id]['upstream_pkts']:
-                allstats[run_id][mote_id]['upstream_pkts'][appcounter] = {
-                    'hops': 0,
-                }
-
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['tx_asn'] = asn
-
-        elif logline['_type'] == SimLog.LOG_APP_RX['type']:
-            # packet reception
-
-            # shorthands
-            mote_id    = netaddr.IPAddress(logline['packet']['net']['srcIp']).words[-1]
-            dstIp      = logline['packet']['net']['dstIp']
-            hop_limit  = logline['packet']['net']['hop_limit']
-            appcounter = logline['packet']['app']['appcounter']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
-                continue
-
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['hops']   = (
-                d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1
+        if run_id not in collectors:
+            collectors[run_id] = SimKpi.KpiCollector(
+                slot_duration = slot_duration
             )
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['rx_asn'] = asn
-
-        elif logline['_type'] == SimLog.LOG_RADIO_STATS['type']:
-            # shorthands
-            mote_id    = logline['_mote_id']
-
-            # only log non-dagRoot charge
-            if mote_id == DAGROOT_ID:
-                continue
-
-            charge =  logline['idle_listen'] * d.CHARGE_IdleListen_uC
-            charge += logline['tx_data_rx_ack'] * d.CHARGE_TxDataRxAck_uC
-            charge += logline['rx_data_tx_ack'] * d.CHARGE_RxDataTxAck_uC
-            charge += logline['tx_data'] * d.CHARGE_TxData_uC
-            charge += logline['rx_data'] * d.CHARGE_RxData_uC
-            charge += logline['sleep'] * d.CHARGE_Sleep_uC
-
-            allstats[run_id][mote_id]['charge_asn'] = asn
-            allstats[run_id][mote_id]['charge']     = charge
-
-    # === compute advanced motestats
-
-    for (run_id, per_mote_stats) in list(allstats.items()):
-        for (mote_id, motestats) in list(per_mote_stats.items()):
-            if mote_id != 0:
-
-                if (motestats['sync_asn'] is not None) and (motestats['charge_asn'] is not None):
-                    # avg_current, lifetime_AA
-                    if (
-                            (motestats['charge'] <= 0)
-                            or
-                            (motestats['charge_asn'] <= motestats['sync_asn'])
-                        ):
-                        motestats['lifetime_AA_years'] = 'N/A'
-                    else:
-                        motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_asn']-motestats['sync_asn']) * file_settings['tsch_slotDuration'])
-                        assert motestats['avg_current_uA'] > 0
-                        motestats['lifetime_AA_years'] = (BATTERY_AA_CAPACITY_mAh*1000/float(motestats['avg_current_uA']))/(24.0*365)
-                if motestats['join_asn'] is not None:
-                    # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
-                    for (appcounter, pktstats) in list(allstats[run_id][mote_id]['upstream_pkts'].items()):
-                        motestats['upstream_num_tx']      += 1
-                        if 'rx_asn' in pktstats:
-                            motestats['upstream_num_rx']  += 1
-                            thislatency = (pktstats['rx_asn']-pktstats['tx_asn'])*file_settings['tsch_slotDuration']
-                            motestats['latencies']  += [thislatency]
-                            motestats['hops']       += [pktstats['hops']]
-                        else:
-                            motestats['upstream_num_lost'] += 1
-                    if (motestats['upstream_num_rx'] > 0) and (motestats['upstream_num_tx'] > 0):
-                        motestats['latency_min_s'] = min(motestats['latencies'])
-                        motestats['latency_avg_s'] = sum(motestats['latencies'])/float(len(motestats['latencies']))
-                        motestats['latency_max_s'] = max(motestats['latencies'])
-                        motestats['upstream_reliability'] = motestats['upstream_num_rx']/float(motestats['upstream_num_tx'])
-                        motestats['avg_hops'] = sum(motestats['hops'])/float(len(motestats['hops']))
-
-    # === network stats
-    for (run_id, per_mote_stats) in list(allstats.items()):
-
-        #-- define stats
-
-        app_packets_sent = 0
-        app_packets_received = 0
-        app_packets_lost = 0
-        joining_times = []
-        us_latencies = []
-        current_consumed = []
-        lifetimes = []
-        slot_duration = file_settings['tsch_slotDuration']
-
-        #-- compute stats
-
-        for (mote_id, motestats) in list(per_mote_stats.items()):
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # counters
-
-            app_packets_sent += motestats['upstream_num_tx']
-            app_packets_received += motestats['upstream_num_rx']
-            app_packets_lost += motestats['upstream_num_lost']
-
-            # joining times
-
-            if motestats['join_asn'] is not None:
-                joining_times.append(motestats['join_asn'])
-
-            # latency
-
-            us_latencies += motestats['latencies']
-
-            # current consumed
-
-            current_consumed.append(motestats['charge'])
-            if motestats['lifetime_AA_years'] is not None:
-                lifetimes.append(motestats['lifetime_AA_years'])
-            current_consumed = [
-                value for value in current_consumed if value is not None
-            ]
-
-        #-- save stats
-
-        allstats[run_id]['global-stats'] = {
-            'e2e-upstream-delivery': [
-                {
-                    'name': 'E2E Upstream Delivery Ratio',
-                    'unit': '%',
-                    'value': (
-                        1 - app_packets_lost / app_packets_sent
-                        if app_packets_sent > 0 else 'N/A'
-                    )
-                },
-                {
-                    'name': 'E2E Upstream Loss Rate',
-                    'unit': '%',
-                    'value': (
-                        app_packets_lost / app_packets_sent
-                        if app_packets_sent > 0 else 'N/A'
-                    )
-                }
-            ],
-            'e2e-upstream-latency': [
-                {
-                    'name': 'E2E Upstream Latency',
-                    'unit': 's',
-                    'mean': (
-                        mean(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    'min': (
-                        min(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    'max': (
-                        max(us_latencies)
-                        if us_latencies else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(us_latencies, 99)
-                        if us_latencies else 'N/A'
-                    )
-                },
-                {
-                    'name': 'E2E Upstream Latency',
-                    'unit': 'slots',
-                    'mean': (
-                        mean(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    'min': (
-                        min(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    'max': (
-                        max(us_latencies) / slot_duration
-                        if us_latencies else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(us_latencies, 99) / slot_duration
-                        if us_latencies else 'N/A'
-                    )
-                }
-            ],
-            'current-consumed': [
-                {
-                    'name': 'Current Consumed',
-                    'unit': 'mA',
-                    'mean': (
-                        mean(current_consumed)
-                        if current_consumed else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(current_consumed, 99)
-                        if current_consumed else 'N/A'
-                    )
-                }
-            ],
-            'network_lifetime':[
-                {
-                    'name': 'Network Lifetime',
-                    'unit': 'years',
-                    'min': (
-                        min(lifetimes)
-                        if lifetimes else 'N/A'
-                    ),
-                    'total_capacity_mAh': BATTERY_AA_CAPACITY_mAh,
-                }
-            ],
-            'joining-time': [
-                {
-                    'name': 'Joining Time',
-                    'unit': 'slots',
-                    'min': (
-                        min(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    'max': (
-                        max(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    'mean': (
-                        mean(joining_times)
-                        if joining_times else 'N/A'
-                    ),
-                    '99%': (
-                        np.percentile(joining_times, 99)
-                        if joining_times else 'N/A'
-                    )
-                }
-            ],
-            'app-packets-sent': [
-                {
-                    'name': 'Number of application packets sent',
-                    'total': app_packets_sent
-                }
-            ],
-            'app_packets_received': [
-                {
-                    'name': 'Number of application packets received',
-                    'total': app_packets_received
-                }
-            ],
-            'app_packets_lost': [
-                {
-                    'name': 'Number of application packets lost',
-                    'total': app_packets_lost
-                }
-            ]
-        }
-
-    # === remove unnecessary stats
-
-    for (run_id, per_mote_stats) in list(allstats.items()):
-        for (mote_id, motestats) in list(per_mote_stats.items()):
-            if 'sync_asn' in motestats:
-                del motestats['sync_asn']
-            if 'charge_asn' in motestats:
-                del motestats['charge_asn']
-                del motestats['charge']
-            if 'join_asn' in motestats:
-                del motestats['upstream_pkts']
-                del motestats['hops']
-                del motestats['join_asn']
+
+        if logline['_type'] == SimLog.LOG_SIMULATOR_KPIS['type']:
+            # the simulator has computed the KPIs of the run already
+            logged_kpis[run_id] = SimKpi.kpis_from_log(logline)
+        else:
+            collectors[run_id].add_log(logline)
+
+    # === compute KPIs
+
+    allstats = {} # indexed by run_id, mote_id
+    for (run_id, collector) in list(collectors.items()):
+        if run_id in logged_kpis:
+            allstats[run_id] = logged_kpis[run_id]
+        else:
+            allstats[run_id] = collector.get_kpis()
 
     return allstats
 
+def kpis_files(inputfiles, num_cpus=1):
+    """
+    Return the KPIs of log files, indexed by file, as kpis_all() gives them
+
+    The runs of a plain file are read separately, on num_cpus processes at
+    most, and never more processes than runs; a compressed file is read as
+    a whole. The KPIs of the runs are merged per file. When the logs of a
+    run appear in several runs of a file, i.e. after a run_id is reused,
+    the file is read by kpis_all() instead.
+    """
+
+    # split the files into shards of runs
+    shards = []
+    for inputfile in inputfiles:
+        with SimLogFormat.open_log_file(inputfile) as f:
+            file_settings = next(SimLogFormat.read_logs(f))
+        offsets = SimLogFormat.find_runs(inputfile)
+        if offsets is None:
+            ranges = [(0, None)]
+        else:
+            ranges = list(zip(offsets, offsets[1:] + [None]))
+        for (start, end) in ranges:
+            shards.append(
+                (inputfile, start, end, file_settings['tsch_slotDuration'])
+            )
+
+    # compute the KPIs of each shard; there is no use for more processes
+    # than shards
+    num_cpus = min(num_cpus, len(shards))
+    if num_cpus <= 1:
+        shard_kpis_list = [_kpis_shard(shard) for shard in shards]
+    else:
+        pool = multiprocessing.Pool(num_cpus)
+        try:
+            shard_kpis_list = pool.map(_kpis_shard, shards)
+        finally:
+            pool.close()
+            pool.join()
+
+    # merge the KPIs of the shards of each file
+    ret_val = dict((inputfile, {}) for inputfile in inputfiles)
+    for (shard, shard_kpis) in zip(shards, shard_kpis_list):
+        inputfile = shard[0]
+        if ret_val[inputfile] is None:
+            continue
+        for (run_id, kpis) in list(shard_kpis.items()):
+            if run_id in ret_val[inputfile]:
+                ret_val[inputfile] = None
+                break
+            ret_val[inputfile][run_id] = kpis
+    for inputfile in inputfiles:
+        if ret_val[inputfile] is None:
+            ret_val[inputfile] = kpis_all(inputfile)
+
+    return ret_val
+
+def _kpis_shard(shard):
+    (inputfile, start, end, slot_duration) = shard
+    with SimLogFormat.open_log_file(inputfile, start, end) as f:
+        loglines = SimLogFormat.read_logs(f, log_types=PARSED_LOG_TYPES)
+        if start == 0:
+            # the settings of the file, which kpis_all() skips
+            next(loglines)
+        return kpis_runs(loglines, slot_duration)
+
 # =========================== main ============================================
 
 def main():
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--cpus',
+        dest    = 'num_cpus',
+        help    = 'maximum number of processes computing KPIs, one per run at most; all the CPUs by default',
+        type    = int,
+        default = multiprocessing.cpu_count()
+    )
+    args = parser.parse_args()
+
     # FIXME: This logic could be a helper method for other scripts
     # Identify simData having the latest results. That directory should have
     # the latest "mtime".
@@ -413,11 +173,16 @@ def main():
         [os.path.join('simData', x) for x in os.listdir('simData')]
     )
     subfolder = max(subfolders, key=os.path.getmtime)
-    for infile in glob.glob(os.path.join(subfolder, '*.dat')):
+    infiles = glob.glob(os.path.join(subfolder, '*.dat'))
+
+    # gather the kpis of all the files at once
+    all_kpis = kpis_files(infiles, num_cpus=args.num_cpus)
+
+    for infile in infiles:
         print('generating KPIs for {0}'.format(infile))
 
         # gather the kpis
-        kpis = kpis_all(infile)
+        kpis = all_kpis[infile]
 
         # print on the terminal
         print(json.dumps(kpis, indent=4))
@@ -11,6 +11,7 @@ if __name__ == '__main__':
     sys.path.insert(0, os.path.join(here, '..'))
 
 from SimEngine.SimConfig import SimConfig
+from SimEngine import SimLogFormat
 
 
 def main():
@@ -40,9 +41,8 @@ def main():
     # identify config_line and random_seed
     config_line = None
     random_seed = None
-    with open(args.log_file_path, 'r') as f:
-        for line in f:
-            log = json.loads(line)
+    with SimLogFormat.open_log_file(args.log_file_path) as f:
+        for log in SimLogFormat.read_logs(f):
 
             if log['_run_id'] != args.target_run_id:
                 continue
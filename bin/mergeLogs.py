@@ -14,8 +14,15 @@ import json
 import os
 import re
 import shutil
+import sys
 import time
 
+if __name__ == '__main__':
+    here = sys.path[0]
+    sys.path.insert(0, os.path.join(here, '..'))
+
+from SimEngine import SimLogFormat
+
 # =========================== helpers =========================================
 
 
@@ -190,18 +197,19 @@ def mergeLogFiles(logDir, targetSubDirs, dryRun):
 
             if not dryRun:
                 # actual merger happens here
-                with open(infile_path, 'r') as infile:
+                with SimLogFormat.open_log_file(infile_path) as infile:
                     with open(outfile_path, 'a') as outfile:
 
-                        for line in infile:
-                            # read a log line
-                            try:
-                                log = json.loads(line)
-                            except ValueError:
-                                # input line cannot be parsed as a json
-                                # string. it may be corrupted
+                        # a line which cannot be parsed as a json string may
+                        # be corrupted; it's skipped. logs in the binary
+                        # format are written as json strings
+                        logs = SimLogFormat.read_logs(
+                            infile,
+                            on_error = lambda line, infile_path=infile_path: (
                                 skipped_lines.append((infile_path, line))
-                                continue
+                            )
+                        )
+                        for log in logs:
 
                             # collect cpuID and _runid that are used to compute
                             # cpu_id_offset and run_id_offset
@@ -180,13 +180,12 @@ def merge_output_files(folder_path):
             )
         )
 
-        # read files and concatenate results
-        with open(os.path.join(folder_path, subfolder + ".dat"), 'w') as outputfile:
+        # read files and concatenate results; files in either of the log
+        # formats can be concatenated as they are, compressed or not
+        with open(os.path.join(folder_path, subfolder + ".dat"), 'wb') as outputfile:
             for file_path in file_path_list:
-                with open(file_path, 'r') as inputfile:
-                    config = json.loads(inputfile.readline())
-                    outputfile.write(json.dumps(config) + "\n")
-                    outputfile.write(inputfile.read())
+                with open(file_path, 'rb') as inputfile:
+                    shutil.copyfileobj(inputfile, outputfile)
         shutil.rmtree(os.path.join(folder_path, subfolder))
 
 # =========================== main ============================================